@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应并发基准测试
+
+使用 fake_steamcmd.py 模拟超过一定会话数后被限流（下载失败）的 Steam，
+对比固定并发数与 ConcurrencyController 自适应并发的耗时、失败数量和
+最终选择的并发数。
+
+用法:
+    python benchmarks/bench_adaptive.py [--mods 40] [--max-sessions 4] [--workers 8]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+FAKE_STEAMCMD = str(Path(__file__).resolve().parent / "fake_steamcmd.py")
+
+
+def run_download(mod_ids, workshop_path, workers, details, adaptive):
+    """
+    下载所有模组并统计结果
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 下载目录
+        workers: 并发数（自适应时为上限）
+        details: 模组详情字典
+        adaptive: 是否使用自适应并发
+
+    Returns:
+        tuple: (总耗时, 失败数量, 最终并发数)
+    """
+    start = time.perf_counter()
+    results = main.download_mods_parallel(mod_ids, workshop_path, FAKE_STEAMCMD, 60, workers, details,
+                                          adaptive=adaptive, min_workers=1)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for result in results.values() if not result["success"])
+    final = main.load_concurrency_state(workshop_path) if adaptive else workers
+    return elapsed, failed, final
+
+
+def main_bench():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="自适应并发基准测试")
+    parser.add_argument("--mods", type=int, default=40, help="模拟的模组数量")
+    parser.add_argument("--workers", type=int, default=8, help="固定并发数 / 自适应并发上限")
+    parser.add_argument("--max-sessions", type=int, default=4, help="超过该会话数后模拟限流")
+    parser.add_argument("--delay", type=float, default=0.3, help="每个模组的下载耗时（秒）")
+    args = parser.parse_args()
+
+    mod_ids = [str(1000 + i) for i in range(args.mods)]
+    details = {mod_id: {"result": 1, "time_updated": 0.0, "file_size": 1024 * 1024, "title": ""}
+               for mod_id in mod_ids}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        spec = {
+            "login_delay": 0.2,
+            "default": {"delay": args.delay, "size": 1024 * 1024},
+            "max_sessions": args.max_sessions,
+            "session_dir": str(Path(tmp) / "sessions")
+        }
+        spec_path = Path(tmp) / "spec.json"
+        spec_path.write_text(json.dumps(spec), encoding='utf-8')
+        os.environ["FAKE_STEAMCMD_SPEC"] = str(spec_path)
+
+        fixed = run_download(mod_ids, str(Path(tmp) / "fixed"), args.workers, details, False)
+        adaptive = run_download(mod_ids, str(Path(tmp) / "adaptive"), args.workers, details, True)
+        # 第二次运行从上次保存的并发数开始
+        warm = run_download(mod_ids, str(Path(tmp) / "adaptive"), args.workers, details, True)
+
+    print("\n=== 基准测试结果 ===")
+    print(f"模组数量: {args.mods}, 限流阈值: {args.max_sessions} 个会话, 并发上限: {args.workers}")
+    for name, (elapsed, failed, final) in (("固定并发", fixed), ("自适应（首次）", adaptive),
+                                           ("自适应（沿用上次）", warm)):
+        print(f"{name}: {elapsed:.2f} 秒，失败 {failed} 个，并发数 {final}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端基准测试
+
+使用 fake_steamcmd.py 模拟 SteamCMD、stub_workshop_api.py 模拟
+GetPublishedFileDetails，在临时目录中完整运行一次更新流程（解析配置、
+查询详情、检查更新、下载、同步、清理），不访问网络。
+
+每个模组数量运行两个场景：
+- cold: 空的模组目录，所有模组都需要下载
+- warm: 在 cold 的基础上再次运行，其中 --changed 比例的模组有更新
+
+每次运行在独立的子进程中执行，记录各阶段耗时、峰值内存（RSS）、
+SteamCMD 子进程调用次数和 HTTP 请求次数，结果保存为 JSON，可以用
+--compare 与之前保存的结果对比。
+
+用法:
+    python benchmarks/bench_e2e.py [--mods 10,100,1000] [--workers 8] [--output results.json]
+    python benchmarks/bench_e2e.py --mods 10,100 --compare benchmarks/results/e2e-20260101-120000.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import zipfile
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+import main  # noqa: E402
+from fake_steamcmd import write_item  # noqa: E402
+from stub_workshop_api import StubWorkshopAPI  # noqa: E402
+
+FAKE_STEAMCMD = str(BENCH_DIR / "fake_steamcmd.py")
+
+# 汇总到结果中的 RunMetrics 计数器
+REPORTED_COUNTERS = ("mods_total", "mods_needing_update", "downloads_succeeded", "downloads_failed",
+                     "downloads_http", "bytes_written", "bytes_skipped", "api_requests", "api_retries")
+
+
+def run_child(config_path, result_path):
+    """
+    子进程：运行一次更新流程，把运行摘要和峰值内存写入 result_path
+
+    Args:
+        config_path: 配置文件路径
+        result_path: 结果 JSON 路径
+    """
+    args = main.parse_args(["--config", str(config_path)])
+    metrics = main.RunMetrics("once")
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        exit_code = main.run_update(args, metrics)
+
+    summary = metrics.summary()
+    summary.pop("mods")
+    summary["exit_code"] = exit_code
+    # Linux 上 ru_maxrss 的单位是 KB
+    summary["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    Path(result_path).write_text(json.dumps(summary), encoding='utf-8')
+
+
+def build_archive(mod_id, size, files, version):
+    """
+    生成与 fake_steamcmd 相同内容的模组压缩包（用于直接下载）
+
+    Returns:
+        bytes: zip 文件内容
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        item_path = Path(tmp) / mod_id
+        write_item(item_path, mod_id, size, files=files, version=version)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for file_path in sorted(item_path.iterdir()):
+                archive.write(file_path, file_path.name)
+        return buffer.getvalue()
+
+
+def write_player_config(config_path, mod_ids):
+    """
+    生成 config_player.xml
+
+    Args:
+        config_path: 输出路径
+        mod_ids: 模组ID列表
+    """
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write('<config language="English">\n  <contentpackages>\n    <regularpackages>\n')
+        for mod_id in mod_ids:
+            f.write(f'      <package path="LocalMods/{mod_id}/filelist.xml" enabled="true" />\n')
+        f.write('    </regularpackages>\n  </contentpackages>\n</config>\n')
+
+
+class Scenario:
+    """
+    一组模组的模拟环境：模组目录、fake_steamcmd 参数和 API 模拟服务
+    """
+
+    def __init__(self, root, mod_count, options, rng):
+        """
+        Args:
+            root: 场景使用的临时目录
+            mod_count: 模组数量
+            options: 命令行参数
+            rng: random.Random 实例
+        """
+        self.root = Path(root)
+        self.options = options
+        self.rng = rng
+        self.mod_ids = [str(3000000000 + index) for index in range(mod_count)]
+        self.spec_path = self.root / "spec.json"
+        self.call_log = self.root / "steamcmd_calls.log"
+        self.config_path = self.root / "config.json"
+
+        direct_count = int(round(mod_count * options.direct))
+        self.direct_ids = set(rng.sample(self.mod_ids, direct_count))
+        self.spec = {
+            "login_delay": options.login_delay,
+            "default": {"delay": options.delay, "size": options.size, "files": options.files,
+                        "fail_rate": options.fail_rate},
+            "items": {},
+            "session_dir": str(self.root / "sessions"),
+            "call_log": str(self.call_log)
+        }
+        now = int(time.time())
+        self.api = StubWorkshopAPI(latency=options.api_latency)
+        for mod_id in self.mod_ids:
+            self.api.update_item(mod_id, time_updated=now - 86400, file_size=options.size)
+            if mod_id in self.direct_ids:
+                self.api.update_item(mod_id, archive=build_archive(mod_id, options.size, options.files, 0))
+
+        write_player_config(self.root / "config_player.xml", self.mod_ids)
+        config = {
+            "steamcmd": {"path": FAKE_STEAMCMD},
+            "files": {"config_file": "config_player.xml", "workshop_path": "LocalMods", "extra_sources": []},
+            "download": {"timeout": 60, "max_workers": options.workers, "batch_mode": options.batch,
+                         "stall_timeout": 30},
+            "api": {"details_url": self.api.url, "rate_limit": 0, "max_retries": 1},
+            "staging": {"max_size_mb": options.staging_mb}
+        }
+        self.config_path.write_text(json.dumps(config, indent=2), encoding='utf-8')
+        self.write_spec()
+
+    def write_spec(self):
+        """保存 fake_steamcmd 参数"""
+        self.spec_path.write_text(json.dumps(self.spec), encoding='utf-8')
+
+    def publish_updates(self, fraction):
+        """
+        随机选择一部分模组发布新版本（更新时间和内容都改变）
+
+        Args:
+            fraction: 更新的模组比例
+
+        Returns:
+            int: 更新的模组数量
+        """
+        changed = self.rng.sample(self.mod_ids, int(round(len(self.mod_ids) * fraction)))
+        now = int(time.time())
+        for mod_id in changed:
+            version = self.spec["items"].get(mod_id, {}).get("version", 0) + 1
+            self.spec["items"][mod_id] = {"version": version}
+            self.api.update_item(mod_id, time_updated=now)
+            if mod_id in self.direct_ids:
+                self.api.update_item(mod_id, archive=build_archive(mod_id, self.options.size, self.options.files,
+                                                                   version))
+        self.write_spec()
+        return len(changed)
+
+    def run(self, phase):
+        """
+        在子进程中运行一次更新流程
+
+        Args:
+            phase: 场景名称（cold 或 warm）
+
+        Returns:
+            dict: 本次运行的结果
+        """
+        self.api.reset_counters()
+        self.call_log.write_text("", encoding='utf-8')
+        result_path = self.root / f"result-{phase}.json"
+        env = dict(os.environ, FAKE_STEAMCMD_SPEC=str(self.spec_path))
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, __file__, "--child", str(self.config_path), str(result_path)],
+                       env=env, check=True)
+        elapsed = time.perf_counter() - start
+
+        summary = json.loads(result_path.read_text(encoding='utf-8'))
+        calls = [line.split() for line in self.call_log.read_text(encoding='utf-8').splitlines() if line]
+        counters = summary["counters"]
+        return {
+            "mods": len(self.mod_ids),
+            "phase": phase,
+            "exit_code": summary["exit_code"],
+            "wall_seconds": summary["wall_seconds"],
+            "process_seconds": elapsed,
+            "stages": summary["stages"],
+            "peak_rss_kb": summary["peak_rss_kb"],
+            "steamcmd_calls": len(calls),
+            "steamcmd_items": sum(int(call[1]) for call in calls),
+            "http_requests": self.api.details_requests + self.api.file_requests,
+            "http_details_requests": self.api.details_requests,
+            "http_file_requests": self.api.file_requests,
+            "counters": {name: counters.get(name, 0) for name in REPORTED_COUNTERS}
+        }
+
+
+def run_scenarios(options):
+    """
+    依次运行所有模组数量的 cold / warm 场景
+
+    Args:
+        options: 命令行参数
+
+    Returns:
+        list: 每次运行的结果
+    """
+    rng = random.Random(options.seed)
+    results = []
+    for mod_count in options.mods:
+        with tempfile.TemporaryDirectory(prefix=f"bench-e2e-{mod_count}-") as tmp:
+            scenario = Scenario(tmp, mod_count, options, rng)
+            scenario.api.start()
+            try:
+                print(f"运行 {mod_count} 个模组（cold）...", flush=True)
+                results.append(scenario.run("cold"))
+                changed = scenario.publish_updates(options.changed)
+                print(f"运行 {mod_count} 个模组（warm，{changed} 个有更新）...", flush=True)
+                results.append(scenario.run("warm"))
+            finally:
+                scenario.api.stop()
+    return results
+
+
+def git_revision():
+    """
+    获取当前代码的 git 提交
+
+    Returns:
+        str: 提交哈希，无法获取时返回 None
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    """
+    输出结果表格，传入 previous 时附带与之前结果的耗时对比
+
+    Args:
+        results: run_scenarios 返回的结果
+        previous: 之前保存的结果（可选）
+    """
+    previous_runs = {(run["mods"], run["phase"]): run for run in (previous or {}).get("runs", [])}
+    stage_names = ["parse", "details", "check", "download", "cleanup"]
+
+    print("\n=== 基准测试结果 ===")
+    print(f"{'模组':>6} {'场景':<5} {'总耗时':>8} " + " ".join(f"{name:>9}" for name in stage_names)
+          + f" {'峰值RSS':>9} {'SteamCMD':>9} {'HTTP':>6} {'失败':>5}")
+    for run in results:
+        stages = " ".join(f"{run['stages'].get(name, 0.0):>8.2f}s" for name in stage_names)
+        rss = f"{run['peak_rss_kb'] / 1024:.1f}MB" if run["peak_rss_kb"] else "-"
+        line = (f"{run['mods']:>6} {run['phase']:<5} {run['wall_seconds']:>7.2f}s {stages} {rss:>9} "
+                f"{run['steamcmd_calls']:>9} {run['http_requests']:>6} {run['counters']['downloads_failed']:>5}")
+        before = previous_runs.get((run["mods"], run["phase"]))
+        if before:
+            change = (run["wall_seconds"] - before["wall_seconds"]) / before["wall_seconds"] * 100
+            line += f"  ({change:+.1f}% 对比 {previous.get('git_revision') or '之前'})"
+        print(line)
+
+
+def main_bench():
+    """主函数"""
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description="端到端基准测试（模拟 SteamCMD 和 Steam Web API）")
+    parser.add_argument("--mods", type=lambda value: [int(item) for item in value.split(",")],
+                        default=[10, 100, 1000], help="逗号分隔的模组数量（默认 10,100,1000）")
+    parser.add_argument("--workers", type=int, default=8, help="并发数")
+    parser.add_argument("--batch", action="store_true", help="使用批量 SteamCMD 会话")
+    parser.add_argument("--login-delay", type=float, default=0.05, help="每个 SteamCMD 会话的登录耗时（秒）")
+    parser.add_argument("--delay", type=float, default=0.02, help="每个模组的下载耗时（秒）")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="每个模组的大小（字节）")
+    parser.add_argument("--files", type=int, default=4, help="每个模组的文件数量")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="每个模组随机下载失败的概率")
+    parser.add_argument("--changed", type=float, default=0.1, help="warm 场景中有更新的模组比例")
+    parser.add_argument("--direct", type=float, default=0.0, help="提供 file_url（直接下载）的模组比例")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="每个 API 请求的模拟延迟（秒）")
+    parser.add_argument("--staging-mb", type=int, default=2048, help="staging.max_size_mb")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 路径（默认 benchmarks/results/e2e-时间.json）")
+    parser.add_argument("--compare", metavar="PATH", help="与之前保存的结果 JSON 对比")
+    options = parser.parse_args()
+
+    report_options = {key: value for key, value in vars(options).items() if key not in ("output", "compare")}
+    previous = None
+    if options.compare:
+        with open(options.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        differing = [key for key, value in report_options.items()
+                     if key != "mods" and previous.get("options", {}).get(key) != value]
+        if differing:
+            print(f"⚠ 与对比结果的参数不同: {', '.join(differing)}")
+
+    results = run_scenarios(options)
+    report = {
+        "created_at": time.time(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": report_options,
+        "runs": results
+    }
+
+    output = Path(options.output or BENCH_DIR / "results" / f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    print_results(results, previous)
+    print(f"\n结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main_bench()
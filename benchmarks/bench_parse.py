@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配置文件解析基准测试
+
+生成包含大量 <package> 条目的 config_player.xml，对比原先的
+ET.parse + findall + re.search 方式与流式 parse_mod_sources 的耗时和
+峰值内存。
+
+用法:
+    python benchmarks/bench_parse.py [--packages 10000] [--repeat 5]
+"""
+
+import re
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+
+def legacy_parse(config_path):
+    """
+    原先的解析方式：加载整棵树后 findall，逐个执行未编译的 re.search
+
+    Args:
+        config_path: 配置文件路径
+
+    Returns:
+        list: 模组ID列表
+    """
+    tree = ET.parse(config_path)
+    root = tree.getroot()
+    mod_ids = []
+    for package in root.findall('.//package'):
+        path = package.get('path', '')
+        match = re.search(r'LocalMods/(\d+)/filelist\.xml', path)
+        if match:
+            mod_ids.append(match.group(1))
+    return mod_ids
+
+
+def write_config(config_path, package_count):
+    """
+    生成合成的 config_player.xml
+
+    Args:
+        config_path: 输出路径
+        package_count: package 条目数量
+    """
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write('<config language="English">\n  <contentpackages>\n')
+        f.write('    <corepackage path="Content/ContentPackages/Vanilla.xml" />\n')
+        f.write('    <regularpackages>\n')
+        for index in range(package_count):
+            f.write(f'      <!--Mod {index}-->\n')
+            f.write(f'      <package path="LocalMods/{2000000000 + index}/filelist.xml" />\n')
+        f.write('    </regularpackages>\n  </contentpackages>\n</config>\n')
+
+
+def measure(func, config_path, repeat):
+    """
+    测量函数的最短耗时和峰值内存
+
+    Returns:
+        tuple: (最短耗时秒数, 峰值内存字节数, 结果数量)
+    """
+    best = None
+    result = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(config_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(config_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(result)
+
+
+def main_bench():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="配置文件解析基准测试")
+    parser.add_argument("--packages", type=int, default=10000, help="package 条目数量")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最短耗时）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = str(Path(tmp) / "config_player.xml")
+        write_config(config_path, args.packages)
+
+        legacy = measure(legacy_parse, config_path, args.repeat)
+        streaming = measure(main.parse_config_for_mod_ids, config_path, args.repeat)
+
+    print(f"=== 解析 {args.packages} 个 package 条目 ===")
+    print(f"ET.parse + findall: {legacy[0] * 1000:.1f} ms，峰值内存 {main.format_bytes(legacy[1])}，{legacy[2]} 个模组")
+    print(f"iterparse 流式解析: {streaming[0] * 1000:.1f} ms，峰值内存 {main.format_bytes(streaming[1])}，"
+          f"{streaming[2]} 个模组")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载调度器基准测试
+
+使用 fake_steamcmd.py 模拟耗时不同的下载，对比原先的
+multiprocessing.Pool.map 方式与 iter_download_results 线程调度器
+（大模组优先）的总耗时。
+
+用法:
+    python benchmarks/bench_scheduler.py [--mods 20] [--workers 3]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+FAKE_STEAMCMD = str(Path(__file__).resolve().parent / "fake_steamcmd.py")
+
+
+def pool_worker(args):
+    """
+    原先 Pool 版本使用的工作函数
+
+    Args:
+        args: (mod_id, workshop_path, steamcmd_path, timeout) 元组
+
+    Returns:
+        tuple: (mod_id, success_bool)
+    """
+    mod_id, workshop_path, steamcmd_path, timeout = args
+    return mod_id, main.download_mod_steamcmd(mod_id, workshop_path, steamcmd_path, timeout)
+
+
+def run_pool(mod_ids, workshop_path, max_workers):
+    """
+    使用 multiprocessing.Pool.map 下载（原实现）
+
+    Returns:
+        float: 总耗时（秒）
+    """
+    args_list = [(mod_id, workshop_path, FAKE_STEAMCMD, 300) for mod_id in mod_ids]
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes=max_workers) as pool:
+        pool.map(pool_worker, args_list)
+    return time.perf_counter() - start
+
+
+def run_scheduler(mod_ids, workshop_path, max_workers, details):
+    """
+    使用 iter_download_results 下载（线程调度器，大模组优先）
+
+    Returns:
+        tuple: (总耗时, 第一个结果产出的耗时)
+    """
+    start = time.perf_counter()
+    first_result = None
+    for _ in main.iter_download_results(mod_ids, workshop_path, FAKE_STEAMCMD, 300, max_workers, details):
+        if first_result is None:
+            first_result = time.perf_counter() - start
+    return time.perf_counter() - start, first_result
+
+
+def build_spec(mod_ids, seed):
+    """
+    生成模拟参数：大部分模组耗时较短，少数大模组耗时较长且排在列表末尾
+
+    Returns:
+        tuple: (fake_steamcmd 参数, 模组详情字典)
+    """
+    rng = random.Random(seed)
+    items = {}
+    details = {}
+    for index, mod_id in enumerate(mod_ids):
+        if index >= len(mod_ids) - max(1, len(mod_ids) // 10):
+            delay = rng.uniform(2.0, 3.0)
+        else:
+            delay = rng.uniform(0.1, 0.5)
+        size = int(delay * 1024 * 1024)
+        items[mod_id] = {"delay": delay, "size": 1024}
+        details[mod_id] = {"result": 1, "time_updated": 0.0, "file_size": size, "title": ""}
+    return {"login_delay": 0.2, "items": items}, details
+
+
+def main_bench():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="下载调度器基准测试")
+    parser.add_argument("--mods", type=int, default=20, help="模拟的模组数量")
+    parser.add_argument("--workers", type=int, default=3, help="并发数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    mod_ids = [str(1000 + i) for i in range(args.mods)]
+    spec, details = build_spec(mod_ids, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        spec_path = Path(tmp) / "spec.json"
+        spec_path.write_text(json.dumps(spec), encoding='utf-8')
+        os.environ["FAKE_STEAMCMD_SPEC"] = str(spec_path)
+
+        pool_time = run_pool(mod_ids, str(Path(tmp) / "pool"), args.workers)
+        sched_time, first_result = run_scheduler(mod_ids, str(Path(tmp) / "sched"), args.workers, details)
+
+    print("\n=== 基准测试结果 ===")
+    print(f"模组数量: {args.mods}, 并发数: {args.workers}")
+    print(f"multiprocessing.Pool.map: {pool_time:.2f} 秒")
+    print(f"线程调度器（大模组优先）: {sched_time:.2f} 秒（首个结果 {first_result:.2f} 秒）")
+    print(f"提升: {pool_time / sched_time:.2f} 倍")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟 SteamCMD 的测试用可执行文件
+
+解析 +force_install_dir 与 +workshop_download_item 参数，在
+steamapps/workshop/content/602960/{ID}/ 下生成假的模组文件，并输出与
+SteamCMD 相同格式的成功/失败行。
+
+通过环境变量 FAKE_STEAMCMD_SPEC 指定一个 JSON 文件：
+{
+  "login_delay": 0.5,
+  "default": {"delay": 1.0, "size": 1024, "files": 1, "fail": false, "fail_rate": 0.0},
+  "items": {"123": {"delay": 5.0, "size": 1048576, "progress": true}, "456": {"stall": 600}},
+  "max_sessions": 4,
+  "bandwidth": 10485760,
+  "session_dir": "/tmp/fake_steamcmd_sessions",
+  "call_log": "/tmp/fake_steamcmd_calls.log"
+}
+
+max_sessions: 同时运行的会话超过该数量时模拟限流，下载失败
+bandwidth: 所有会话共享的带宽（字节/秒），每个物品额外耗时 size * 会话数 / bandwidth
+session_dir: 记录运行中会话的目录（默认在系统临时目录下）
+call_log: 每次调用追加一行（进程号和下载的物品数量），用于统计子进程调用次数
+files: 模组数据分成的文件数量（总大小仍为 size）
+version: 内容版本，改变后生成的数据内容不同（模拟模组更新）
+fail_rate: 每个物品随机下载失败的概率
+fail_times: 物品前几次下载失败，之后成功（次数记录在 session_dir 中）
+error: 下载失败时输出的原因（默认 Failure，例如 Rate Limit Exceeded、Timeout）
+progress: 在 delay 期间逐步写入 steamapps/workshop/downloads/602960/{ID}/，完成后移动到下载目录
+stall: 开始下载前卡住的秒数（不输出、不写入任何文件）
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def load_spec():
+    """
+    读取 FAKE_STEAMCMD_SPEC 指定的模拟参数
+
+    Returns:
+        dict: 模拟参数
+    """
+    spec_path = os.environ.get("FAKE_STEAMCMD_SPEC")
+    if not spec_path:
+        return {}
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_item(item_path, mod_id, size, duration=0.0, files=1, version=0):
+    """
+    生成一个假的模组目录
+
+    Args:
+        item_path: 模组下载目录
+        mod_id: 模组ID
+        size: 数据文件总大小（字节）
+        duration: 数据分 10 次写入，总共耗时的秒数
+        files: 数据文件数量（第一个为 data.bin，其余为 data_{N}.bin）
+        version: 内容版本，决定数据文件的填充字节
+    """
+    item_path.mkdir(parents=True, exist_ok=True)
+    files = max(1, int(files))
+    names = ["data.bin"] + [f"data_{index}.bin" for index in range(1, files)]
+    entries = "".join(f'  <Other file="%ModDir%/{name}" />\n' for name in names)
+    (item_path / "filelist.xml").write_text(
+        f'<contentpackage name="fake {mod_id}">\n{entries}</contentpackage>\n',
+        encoding='utf-8'
+    )
+    step = max(1, size // 10) if duration else max(size, 1)
+    fill = bytes([zlib.crc32(f"{mod_id}:{version}".encode('ascii')) & 0xff])
+    for index, name in enumerate(names):
+        # 数据内容由模组ID和版本决定，同一版本重复下载时内容不变
+        remaining = size // files + (size % files if index == 0 else 0)
+        with open(item_path / name, 'wb') as f:
+            while remaining > 0:
+                chunk = min(remaining, step)
+                f.write(fill * chunk)
+                f.flush()
+                remaining -= chunk
+                if duration:
+                    time.sleep(duration / 10)
+
+
+def count_sessions(session_dir):
+    """
+    统计当前运行中的会话数量
+
+    Args:
+        session_dir: 记录会话的目录
+
+    Returns:
+        int: 会话数量
+    """
+    return sum(1 for _ in session_dir.glob("session-*"))
+
+
+def consume_failure(session_dir, mod_id, fail_times):
+    """
+    物品的前 fail_times 次下载返回失败
+
+    Args:
+        session_dir: 记录会话的目录（同时保存每个物品已失败的次数）
+        mod_id: 物品ID
+        fail_times: 失败次数
+
+    Returns:
+        bool: 本次下载是否失败
+    """
+    if not fail_times:
+        return False
+    counter = session_dir / f"failures-{mod_id}"
+    count = int(counter.read_text()) if counter.exists() else 0
+    if count >= int(fail_times):
+        return False
+    counter.write_text(str(count + 1))
+    return True
+
+
+def main():
+    """主函数"""
+    spec = load_spec()
+    default = spec.get("default", {})
+    items = spec.get("items", {})
+    max_sessions = spec.get("max_sessions")
+    bandwidth = spec.get("bandwidth")
+
+    if spec.get("call_log"):
+        item_count = sys.argv.count("+workshop_download_item")
+        with open(spec["call_log"], 'a', encoding='utf-8') as f:
+            f.write(f"{os.getpid()} {item_count}\n")
+
+    session_dir = Path(spec.get("session_dir") or Path(tempfile.gettempdir()) / "fake_steamcmd_sessions")
+    session_dir.mkdir(parents=True, exist_ok=True)
+    session_file = session_dir / f"session-{os.getpid()}"
+    session_file.touch()
+    try:
+        return run_session(spec, default, items, max_sessions, bandwidth, session_dir)
+    finally:
+        session_file.unlink()
+
+
+def run_session(spec, default, items, max_sessions, bandwidth, session_dir):
+    """
+    模拟一次 SteamCMD 会话
+
+    Args:
+        spec: 模拟参数
+        default: 物品默认参数
+        items: 按物品ID覆盖的参数
+        max_sessions: 超过后模拟限流的会话数量（None 表示不限流）
+        bandwidth: 共享带宽（字节/秒，None 表示不限制）
+        session_dir: 记录会话的目录
+
+    Returns:
+        int: 退出码
+    """
+    args = sys.argv[1:]
+    install_dir = Path.cwd()
+
+    print("Redirecting stderr to 'logs/stderr.txt'")
+    time.sleep(float(spec.get("login_delay", 0)))
+    print("Logging in user 'anonymous' to Steam Public...OK", flush=True)
+
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "+force_install_dir":
+            install_dir = Path(args[i + 1])
+            i += 2
+        elif arg == "+workshop_download_item":
+            app_id, mod_id = args[i + 1], args[i + 2]
+            i += 3
+            if i < len(args) and args[i] == "validate":
+                i += 1
+
+            item = dict(default)
+            item.update(items.get(mod_id, {}))
+            size = int(item.get("size", 1024))
+            sessions = count_sessions(session_dir)
+            delay = float(item.get("delay", 0))
+            if bandwidth:
+                delay += size * sessions / float(bandwidth)
+            time.sleep(float(item.get("stall", 0)))
+
+            item_path = install_dir / "steamapps" / "workshop" / "content" / app_id / mod_id
+            throttled = bool(max_sessions and sessions > max_sessions)
+            if item.get("progress") and not item.get("fail") and not throttled:
+                # 先逐步写入未完成的下载目录，完成后移动到下载目录
+                download_path = install_dir / "steamapps" / "workshop" / "downloads" / app_id / mod_id
+                if download_path.exists():
+                    shutil.rmtree(download_path)
+                write_item(download_path, mod_id, size, delay, item.get("files", 1), item.get("version", 0))
+                if item_path.exists():
+                    shutil.rmtree(item_path)
+                item_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(download_path, item_path)
+                print(f'Success. Downloaded item {mod_id} to "{item_path}" ({size} bytes)', flush=True)
+                continue
+            time.sleep(delay)
+
+            if (item.get("fail") or random.random() < float(item.get("fail_rate", 0))
+                    or consume_failure(session_dir, mod_id, item.get("fail_times"))):
+                print(f"ERROR! Download item {mod_id} failed ({item.get('error', 'Failure')}).", flush=True)
+                continue
+            if throttled:
+                print(f"ERROR! Download item {mod_id} failed (Rate Limit Exceeded).", flush=True)
+                continue
+
+            write_item(item_path, mod_id, size, files=item.get("files", 1), version=item.get("version", 0))
+            print(f'Success. Downloaded item {mod_id} to "{item_path}" ({size} bytes)', flush=True)
+        else:
+            i += 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
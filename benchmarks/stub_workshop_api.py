@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟 Steam Web API GetPublishedFileDetails 的本地 HTTP 服务
+
+POST 请求按 publishedfileids[N] 返回与 Steam 相同格式的 publishedfiledetails，
+不在 items 中的物品返回 result 9（未找到）。与 Steam 相同，只有
+GET /IPublishedFileService/GetDetails/v1/（需要 key，includechildren=true）
+返回 children。带有 archive 的物品在详情中
+附带 file_url，GET /files/{ID}.zip 返回压缩包内容并支持 HTTP Range、
+ETag 和 If-Range（ETag 不一致时返回完整内容）。
+物品的 truncate_next 设置后，下一次文件响应只发送该数量的字节就断开连接
+（模拟传输中断）；file_rate 限制文件下载速度（字节/秒）。
+fail_next() 让接下来的若干个详情请求返回错误状态码（例如 429、503，
+可附带 Retry-After），用于测试客户端的重试。
+
+作为模块使用:
+    api = StubWorkshopAPI({"123": {"time_updated": 1700000000, "file_size": 1024}})
+    api.start()
+    ...  # 将 config.json 的 api.details_url 设置为 api.url
+    api.stop()
+
+单独运行:
+    python benchmarks/stub_workshop_api.py --port 8080 --items items.json
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubWorkshopAPI:
+    """
+    本地 GetPublishedFileDetails 模拟服务（在后台线程中运行）
+
+    统计详情请求次数（以及每个请求到达的时间）、文件下载请求次数和发送的
+    文件字节数，供基准测试比较 HTTP 调用数量。
+    """
+
+    def __init__(self, items=None, latency=0.0, host="127.0.0.1", port=0, file_rate=None):
+        """
+        Args:
+            items: {mod_id: 详情字典}，可包含 time_updated、file_size、title、children、archive（bytes）、
+                   truncate_next（下一次文件响应发送的字节数）
+            latency: 每个请求额外等待的秒数（模拟网络往返）
+            host: 监听地址
+            port: 监听端口，0 表示自动选择
+            file_rate: 文件下载速度（字节/秒，None 表示不限制）
+        """
+        self.items = {str(mod_id): dict(item) for mod_id, item in (items or {}).items()}
+        self.latency = latency
+        self.file_rate = file_rate
+        self.details_requests = 0
+        self.details_request_times = []
+        self.file_requests = 0
+        self.bytes_sent = 0
+        self.failures = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """服务的根地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self):
+        """GetPublishedFileDetails 接口地址"""
+        return f"{self.base_url}/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
+
+    @property
+    def service_url(self):
+        """IPublishedFileService/GetDetails 接口地址"""
+        return f"{self.base_url}/IPublishedFileService/GetDetails/v1/"
+
+    def update_item(self, mod_id, **fields):
+        """
+        修改（或添加）一个物品的详情
+
+        Args:
+            mod_id: 模组ID
+            **fields: 要修改的字段
+        """
+        with self.lock:
+            self.items.setdefault(str(mod_id), {}).update(fields)
+
+    def fail_next(self, status, count=1, retry_after=None):
+        """
+        让接下来的 count 个详情请求返回错误状态码
+
+        Args:
+            status: HTTP 状态码（例如 429、503）
+            count: 返回错误的请求数量
+            retry_after: Retry-After 响应头的值（秒，None 表示不发送）
+        """
+        with self.lock:
+            self.failures.extend([(status, retry_after)] * count)
+
+    def reset_counters(self):
+        """清零请求统计"""
+        with self.lock:
+            self.details_requests = 0
+            self.details_request_times = []
+            self.file_requests = 0
+            self.bytes_sent = 0
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def build_details(self, mod_id, include_children=False):
+        """
+        生成单个物品的 publishedfiledetails 条目
+
+        Args:
+            mod_id: 模组ID
+            include_children: 是否附带 children（依赖物品）
+
+        Returns:
+            dict: 与 Steam Web API 格式相同的条目
+        """
+        with self.lock:
+            item = self.items.get(mod_id)
+            if item is None:
+                return {"publishedfileid": mod_id, "result": 9}
+            archive = item.get("archive")
+            details = {
+                "publishedfileid": mod_id,
+                "result": 1,
+                "title": item.get("title", f"Mod {mod_id}"),
+                "time_updated": int(item.get("time_updated", 0)),
+                "file_size": str(len(archive) if archive is not None else item.get("file_size", 0)),
+                "file_url": f"{self.base_url}/files/{mod_id}.zip" if archive is not None else ""
+            }
+            if include_children and item.get("children"):
+                details["children"] = [{"publishedfileid": child, "sortorder": index, "file_type": 0}
+                                       for index, child in enumerate(item["children"])]
+            return details
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_details(self, form, include_children=False):
+                with api.lock:
+                    api.details_requests += 1
+                    api.details_request_times.append(time.monotonic())
+                    failure = api.failures.pop(0) if api.failures else None
+                if api.latency:
+                    time.sleep(api.latency)
+                if failure is not None:
+                    status, retry_after = failure
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+                    self._send(status, b"", headers)
+                    return
+
+                mod_ids = []
+                while f"publishedfileids[{len(mod_ids)}]" in form:
+                    mod_ids.append(form[f"publishedfileids[{len(mod_ids)}]"][0])
+                items = [api.build_details(mod_id, include_children) for mod_id in mod_ids]
+                body = json.dumps({"response": {"result": 1, "resultcount": len(items),
+                                                "publishedfiledetails": items}}).encode('utf-8')
+                self._send(200, body, {"Content-Type": "application/json"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._send_details(parse_qs(self.rfile.read(length).decode('utf-8')))
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path.startswith("/IPublishedFileService/GetDetails/"):
+                    query = parse_qs(url.query)
+                    if not query.get("key"):
+                        self._send(403, b"")
+                        return
+                    self._send_details(query, query.get("includechildren", ["false"])[0] == "true")
+                    return
+                with api.lock:
+                    api.file_requests += 1
+                    mod_id = self.path.rsplit("/", 1)[-1].split(".", 1)[0]
+                    item = api.items.get(mod_id) or {}
+                    archive = item.get("archive") if self.path.startswith("/files/") else None
+                    truncate = item.pop("truncate_next", None)
+                if api.latency:
+                    time.sleep(api.latency)
+                if archive is None:
+                    self._send(404, b"")
+                    return
+
+                etag = f'"{hashlib.sha256(archive).hexdigest()[:16]}"'
+                range_header = self.headers.get("Range")
+                if range_header and self.headers.get("If-Range") not in (None, etag):
+                    # 文件已改变：忽略 Range，返回完整内容
+                    range_header = None
+                start = 0
+                if range_header and range_header.startswith("bytes="):
+                    start = int(range_header[len("bytes="):].split("-", 1)[0] or 0)
+                if start >= len(archive):
+                    self._send(416, b"", {"Content-Range": f"bytes */{len(archive)}"})
+                    return
+
+                body = archive[start:]
+                self.send_response(206 if range_header else 200)
+                self.send_header("Content-Type", "application/zip")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", etag)
+                if range_header:
+                    self.send_header("Content-Range", f"bytes {start}-{len(archive) - 1}/{len(archive)}")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+
+                sent = 0
+                limit = len(body) if truncate is None else min(truncate, len(body))
+                chunk_size = 16 * 1024
+                try:
+                    while sent < limit:
+                        chunk = body[sent:min(limit, sent + chunk_size)]
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        if api.file_rate:
+                            time.sleep(len(chunk) / api.file_rate)
+                    self.wfile.flush()
+                except OSError:
+                    pass
+                with api.lock:
+                    api.bytes_sent += sent
+                if sent < len(body):
+                    # 模拟传输中断：Content-Length 未发送完就关闭连接
+                    self.close_connection = True
+
+        return Handler
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="模拟 GetPublishedFileDetails 的本地 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8080, help="监听端口")
+    parser.add_argument("--items", help="物品详情 JSON 文件（{mod_id: {time_updated, file_size, title}}）")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求额外等待的秒数")
+    args = parser.parse_args()
+
+    items = {}
+    if args.items:
+        with open(args.items, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+
+    api = StubWorkshopAPI(items, args.latency, args.host, args.port)
+    print(f"GetPublishedFileDetails 模拟服务: {api.url}（{len(items)} 个物品）")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
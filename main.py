@@ -9,11 +9,25 @@ import xml.etree.ElementTree as ET
 import subprocess
 import re
 import sys
+import os
 import json
+import time
 import shutil
+import hashlib
+import mmap
+import tempfile
+import queue
+import random
+import signal
+import zipfile
+import tarfile
+import argparse
+import contextlib
+import threading
 import requests
-import multiprocessing
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 
 
 def load_config(config_path="config.json"):
@@ -32,11 +46,58 @@ def load_config(config_path="config.json"):
         },
         "files": {
             "config_file": "config_player.xml",
-            "workshop_path": "LocalMods"
+            "workshop_path": "LocalMods",
+            "extra_sources": []
         },
         "download": {
             "timeout": 300,
-            "max_workers": 3
+            "max_workers": 3,
+            "batch_mode": False,
+            "deadline": 0,
+            "adaptive": False,
+            "min_workers": 1,
+            "validate": False,
+            "stall_timeout": 120,
+            "timeout_factor": 3,
+            "default_throughput_kbps": 1024,
+            "direct_download": True
+        },
+        "api": {
+            "timeout": 30,
+            "connect_timeout": 10,
+            "batch_size": 100,
+            "max_retries": 3,
+            "backoff_base": 1.0,
+            "backoff_max": 30,
+            "rate_limit": 5,
+            "pool_size": 10,
+            "details_url": STEAM_API_DETAILS_URL,
+            "key": "",
+            "service_details_url": STEAM_API_SERVICE_DETAILS_URL
+        },
+        "dependencies": {
+            "resolve": False
+        },
+        "watch": {
+            "interval": 300,
+            "config_poll_interval": 5,
+            "max_backoff": 3600
+        },
+        "metrics": {
+            "report_path": "",
+            "prometheus_path": ""
+        },
+        "store": {
+            "path": "ModStore",
+            "link_mode": "hardlink",
+            "auto_gc": False
+        },
+        "profiles": [],
+        "verify": {
+            "hash_workers": 0
+        },
+        "staging": {
+            "max_size_mb": 2048
         }
     }
 
@@ -65,6 +126,124 @@ def load_config(config_path="config.json"):
         return default_config, config_path
 
 
+# 内容包路径中的创意工坊ID：LocalMods/{ID}/filelist.xml、
+# steamapps/workshop/content/602960/{ID}/filelist.xml、WorkshopMods/Installed/{ID}/filelist.xml
+MOD_PATH_PATTERN = re.compile(
+    r'(?:LocalMods|content[/\\]602960|WorkshopMods[/\\]Installed)[/\\](\d+)[/\\]filelist\.xml',
+    re.IGNORECASE
+)
+# 纯文本模组列表中的一行：纯数字ID，或创意工坊链接中的 id=ID
+MOD_ID_LINE_PATTERN = re.compile(r'^(\d+)$|[?&]id=(\d+)')
+
+
+def iter_mod_ids_from_xml(config_path):
+    """
+    流式解析 XML 配置文件，依次产出其中引用的模组ID
+
+    使用 iterparse 逐个处理元素并及时释放，不需要把整个文档加载到内存。
+    检查所有带 path 属性的元素（<package>、<corepackage> 等，无论位于
+    <regularpackages> 还是其他位置），按文档顺序产出。
+
+    Args:
+        config_path: XML 文件路径
+
+    Yields:
+        str: 模组ID（可能重复）
+    """
+    context = ET.iterparse(config_path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end":
+            continue
+        path = elem.get('path')
+        if path:
+            match = MOD_PATH_PATTERN.search(path)
+            if match:
+                yield match.group(1)
+        # 释放已处理的元素
+        elem.clear()
+        if elem is not root:
+            root.clear()
+
+
+def iter_mod_ids_from_json(list_path):
+    """
+    读取 JSON 模组列表
+
+    支持 ["123", 456] 或 {"mods": [...]} 两种格式，列表项也可以是带 id 字段的字典。
+
+    Args:
+        list_path: JSON 文件路径
+
+    Yields:
+        str: 模组ID
+    """
+    with open(list_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("mods", [])
+    for item in data:
+        if isinstance(item, dict):
+            item = item.get("id", item.get("publishedfileid", ""))
+        item = str(item).strip()
+        if item.isdigit():
+            yield item
+
+
+def iter_mod_ids_from_text(list_path):
+    """
+    读取纯文本模组列表
+
+    每行一个模组ID或创意工坊链接，# 开头的行为注释。
+
+    Args:
+        list_path: 文本文件路径
+
+    Yields:
+        str: 模组ID
+    """
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            match = MOD_ID_LINE_PATTERN.search(line)
+            if match:
+                yield match.group(1) or match.group(2)
+
+
+def parse_mod_sources(source_paths):
+    """
+    从多个来源提取模组ID，保持用户的加载顺序并去重
+
+    根据扩展名选择解析方式：.xml 使用流式 XML 解析，.json 读取 JSON
+    列表，其他文件按纯文本列表处理。
+
+    Args:
+        source_paths: 文件路径列表（config_player.xml、模组列表文件等）
+
+    Returns:
+        list: 去重后的模组ID列表
+    """
+    mod_ids = {}
+    for source_path in source_paths:
+        suffix = Path(source_path).suffix.lower()
+        if suffix == ".xml":
+            parser = iter_mod_ids_from_xml
+        elif suffix == ".json":
+            parser = iter_mod_ids_from_json
+        else:
+            parser = iter_mod_ids_from_text
+
+        try:
+            for mod_id in parser(str(source_path)):
+                mod_ids.setdefault(mod_id, None)
+        except Exception as e:
+            print(f"解析配置文件 {source_path} 时出错: {e}")
+
+    return list(mod_ids)
+
+
 def parse_config_for_mod_ids(config_path):
     """
     解析配置文件，提取所有模组ID
@@ -75,375 +254,4268 @@ def parse_config_for_mod_ids(config_path):
     Returns:
         list: 模组ID列表
     """
+    return parse_mod_sources([config_path])
+
+
+@contextlib.contextmanager
+def atomic_open(path):
+    """
+    以原子方式写入文件
+
+    先写入同目录下的临时文件并 fsync，再通过 os.replace 替换目标文件，
+    写入中途中断不会留下损坏的文件；出错时删除临时文件。
+
+    Args:
+        path: 目标文件路径
+
+    Yields:
+        file: 以文本模式（UTF-8）打开的临时文件
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=path.name, suffix=".tmp", dir=str(path.parent))
     try:
-        tree = ET.parse(config_path)
-        root = tree.getroot()
-
-        # 查找所有 package 元素
-        mod_ids = []
-        for package in root.findall('.//package'):
-            path = package.get('path', '')
-            # 提取 LocalMods/ID/filelist.xml 中的 ID
-            match = re.search(r'LocalMods/(\d+)/filelist\.xml', path)
-            if match:
-                mod_ids.append(match.group(1))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
-        return mod_ids
-    except Exception as e:
-        print(f"解析配置文件时出错: {e}")
-        return []
 
+def atomic_write_json(path, data):
+    """
+    原子写入 JSON 文件（见 atomic_open）
 
-def download_mod_steamcmd(mod_id, workshop_path, steamcmd_path="steamcmd", timeout=300):
+    Args:
+        path: 目标文件路径
+        data: 可序列化为 JSON 的数据
     """
-    使用 SteamCMD 下载模组
+    with atomic_open(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+MANIFEST_FILENAME = ".mod_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def load_manifest(workshop_path):
+    """
+    读取本地已安装模组清单
+
+    清单保存在 LocalMods/.mod_manifest.json，记录每个模组安装时的
+    time_updated、大小和内容哈希。
 
     Args:
-        mod_id: Steam 创意工坊模组ID
-        workshop_path: 创意工坊内容路径（绝对路径）
-        steamcmd_path: SteamCMD 可执行文件路径
-        timeout: 下载超时时间（秒）
+        workshop_path: 创意工坊内容路径
 
     Returns:
-        bool: 下载是否成功
+        dict: {mod_id: 清单条目} 的字典，文件不存在或损坏时返回空字典
     """
-    workshop = Path(workshop_path)
-    workshop.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(workshop_path) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
 
-    # SteamCMD 会下载到: workshop/steamapps/workshop/content/602960/{mod_id}/
-    # 我们需要将内容移动到: workshop/{mod_id}/
-    steamcmd_download_path = workshop / "steamapps" / "workshop" / "content" / "602960" / mod_id
-    final_mod_path = workshop / mod_id
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        mods = data.get("mods", {})
+        return mods if isinstance(mods, dict) else {}
+    except Exception as e:
+        print(f"读取模组清单失败: {e}，将重新建立清单")
+        return {}
 
-    # SteamCMD 下载命令
-    cmd = [
-        steamcmd_path,
-        "+force_install_dir", str(workshop),
-        "+login", "anonymous",
-        "+workshop_download_item", "602960", mod_id, "validate",
-        "+quit"
-    ]
 
-    try:
-        print(f"正在下载模组 {mod_id}...")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
+def save_manifest(workshop_path, manifest):
+    """
+    原子写入本地已安装模组清单，避免写入中途中断导致清单损坏
 
-        if result.returncode == 0:
-            # 验证下载是否成功
-            # 检查下载目录是否存在
-            if not steamcmd_download_path.exists():
-                print(f"✗ 模组 {mod_id} 下载失败: SteamCMD 未能创建下载目录")
-                print(f"SteamCMD 输出: {result.stdout}")
-                print(f"SteamCMD 错误: {result.stderr}")
-                return False
+    Args:
+        workshop_path: 创意工坊内容路径
+        manifest: {mod_id: 清单条目} 的字典
+    """
+    atomic_write_json(Path(workshop_path) / MANIFEST_FILENAME, {
+        "version": MANIFEST_VERSION,
+        "mods": manifest
+    })
 
-            # 检查下载目录是否为空
-            downloaded_files = list(steamcmd_download_path.iterdir())
-            if not downloaded_files:
-                print(f"✗ 模组 {mod_id} 下载失败: SteamCMD 未下载任何文件到预期位置")
-                print(f"SteamCMD 输出: {result.stdout}")
-                print(f"SteamCMD 错误: {result.stderr}")
-                return False
 
-            # 检查 filelist.xml 是否存在（这是模组的关键文件）
-            filelist_path = steamcmd_download_path / "filelist.xml"
-            if not filelist_path.exists():
-                print(f"✗ 模组 {mod_id} 下载失败: filelist.xml 不存在")
-                print(f"下载目录内容: {[f.name for f in downloaded_files]}")
-                print(f"SteamCMD 输出: {result.stdout}")
-                print(f"SteamCMD 错误: {result.stderr}")
-                return False
+_manifest_lock = threading.Lock()
 
-            # 检查 filelist.xml 是否为空
-            if filelist_path.stat().st_size == 0:
-                print(f"✗ 模组 {mod_id} 下载失败: filelist.xml 为空文件")
-                print(f"SteamCMD 输出: {result.stdout}")
-                print(f"SteamCMD 错误: {result.stderr}")
-                return False
 
-            # 将下载的文件移动到最终位置
-            try:
-                # 创建最终目录
-                final_mod_path.mkdir(parents=True, exist_ok=True)
-
-                # 移动所有文件
-                for item in steamcmd_download_path.iterdir():
-                    dest = final_mod_path / item.name
-                    if dest.exists():
-                        if dest.is_dir():
-                            shutil.rmtree(dest)
-                        else:
-                            dest.unlink()
-                    item.rename(dest)
-
-                # 验证文件是否成功移动
-                final_filelist = final_mod_path / "filelist.xml"
-                if not final_filelist.exists():
-                    print(f"✗ 模组 {mod_id} 文件移动失败: 最终位置未找到 filelist.xml")
-                    return False
-
-                print(f"✓ 模组 {mod_id} 下载并移动成功")
-                return True
-            except Exception as e:
-                print(f"✗ 模组 {mod_id} 文件移动时出错: {e}")
-                return False
-        else:
-            print(f"✗ 模组 {mod_id} 下载失败")
-            print(f"SteamCMD 错误信息: {result.stderr}")
-            print(f"SteamCMD 输出: {result.stdout}")
-            return False
-    except subprocess.TimeoutExpired:
-        print(f"✗ 模组 {mod_id} 下载超时")
-        return False
-    except Exception as e:
-        print(f"✗ 下载模组 {mod_id} 时出错: {e}")
-        return False
+def record_manifest_entry(workshop_path, mod_id, entry):
+    """
+    将单个模组的清单条目写入本地清单（线程安全）
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        mod_id: 模组ID
+        entry: 清单条目
+    """
+    with _manifest_lock:
+        manifest = load_manifest(workshop_path)
+        manifest[mod_id] = entry
+        save_manifest(workshop_path, manifest)
+
+
+class ManifestWriter:
+    """
+    批量写入本地清单
+
+    清单中记录了每个模组所有文件的哈希，模组较多时可达几十 MB。逐个调用
+    record_manifest_entry 会在每次安装时重新读取、写入整个清单，并让所有
+    下载线程串行等待清单锁。ManifestWriter 只在开始时读取一次清单，新条目
+    先记录在内存中，由 flush() 一次写入（下载过程中每隔 flush_interval 秒
+    写入一次，限制进程被强制终止时丢失的条目）。
+    """
+
+    def __init__(self, workshop_path, flush_interval=30.0):
+        """
+        Args:
+            workshop_path: 创意工坊内容路径
+            flush_interval: maybe_flush 两次写入之间的最短间隔（秒）
+        """
+        self.workshop_path = Path(workshop_path)
+        self.flush_interval = flush_interval
+        self.manifest = load_manifest(workshop_path)
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
 
+    def get(self, mod_id):
+        """
+        读取单个模组的清单条目
 
-def get_workshop_update_time(mod_id, timeout=30):
+        Args:
+            mod_id: 模组ID
+
+        Returns:
+            dict: 清单条目，不存在时返回 None
+        """
+        with self.lock:
+            return self.manifest.get(mod_id)
+
+    def record(self, mod_id, entry):
+        """
+        记录单个模组的清单条目（写入内存）
+
+        Args:
+            mod_id: 模组ID
+            entry: 清单条目
+        """
+        with self.lock:
+            self.manifest[mod_id] = entry
+            self.dirty = True
+
+    def flush(self):
+        """把记录的条目写入磁盘（没有新条目时不写入）"""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = dict(self.manifest)
+            self.dirty = False
+            self.last_flush = time.monotonic()
+        try:
+            with _manifest_lock:
+                save_manifest(self.workshop_path, snapshot)
+        except Exception:
+            with self.lock:
+                self.dirty = True
+            raise
+
+    def maybe_flush(self):
+        """距离上次写入超过 flush_interval 时写入"""
+        if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
     """
-    获取 Steam 创意工坊中模组的更新时间
+    计算单个文件的 SHA-256
 
-    使用 Steam Web API: https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/
+    不小于 chunk_size 的文件通过 mmap 整体交给 hashlib（计算期间释放 GIL，
+    多个线程可以同时计算），无法映射时退回分块读取。
 
     Args:
-        mod_id: Steam 创意工坊模组ID
-        timeout: 查询超时时间（秒）
+        file_path: 文件路径
+        chunk_size: 小文件直接读取的大小上限，以及分块读取时每次读取的字节数
 
     Returns:
-        float: 模组的更新时间戳（Unix 时间戳），如果获取失败返回 0
+        str: 十六进制哈希值
     """
-    api_url = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < chunk_size:
+            return hashlib.sha256(f.read()).hexdigest()
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()
+        except (OSError, ValueError):
+            digest = hashlib.sha256()
+            f.seek(0)
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
 
-    data = {
-        "itemcount": "1",
-        "publishedfileids[0]": mod_id
-    }
 
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
+def hash_files_parallel(file_paths, max_workers=None):
+    """
+    使用线程池并行计算多个文件的 SHA-256
 
-    try:
-        result = requests.post(api_url, data=data, headers=headers, timeout=timeout)
-
-        if result.status_code == 200:
-            data = result.json()
-            if 'response' in data and 'publishedfiledetails' in data['response']:
-                publishedfiledetails = data['response']['publishedfiledetails']
-                if publishedfiledetails:
-                    moddetails = publishedfiledetails[0]
-                    if 'time_updated' in moddetails:
-                        return float(moddetails['time_updated'])
-                    elif 'time_created' in moddetails:
-                        return float(moddetails['time_created'])
-    except Exception as e:
-        print(f"    获取模组 {mod_id} 更新信息失败: {e}")
+    Args:
+        file_paths: 文件路径列表
+        max_workers: 线程数（默认为 CPU 核心数）
+
+    Returns:
+        dict: {文件路径: 哈希} 的字典，读取失败的文件对应 None
+    """
+    def hash_or_none(file_path):
+        try:
+            return hash_file(file_path)
+        except OSError:
+            return None
 
-    return 0
+    file_paths = list(file_paths)
+    if len(file_paths) <= 1:
+        return {file_path: hash_or_none(file_path) for file_path in file_paths}
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+        return dict(zip(file_paths, executor.map(hash_or_none, file_paths)))
 
 
-def download_single_mod(args):
+def hash_mod_files(mod_path, max_workers=None):
     """
-    单个模组下载函数（用于多进程）
+    计算模组目录下所有文件的大小和哈希
 
     Args:
-        args: 包含 (mod_id, workshop_path, steamcmd_path, timeout) 的元组
+        mod_path: 模组目录
+        max_workers: 计算哈希的线程数（默认为 CPU 核心数）
 
     Returns:
-        tuple: (mod_id, success_bool)
+        dict: {相对路径: {"size": 字节数, "sha256": 哈希}} 的字典
     """
-    mod_id, workshop_path, steamcmd_path, timeout = args
-    success = download_mod_steamcmd(mod_id, workshop_path, steamcmd_path, timeout)
-    return (mod_id, success)
+    mod_path = Path(mod_path)
+    file_paths = [file_path for file_path in sorted(mod_path.rglob('*')) if file_path.is_file()]
+    hashes = hash_files_parallel(file_paths, max_workers)
+    files = {}
+    for file_path in file_paths:
+        if hashes[file_path] is None:
+            raise OSError(f"无法读取文件 {file_path}")
+        rel_path = file_path.relative_to(mod_path).as_posix()
+        files[rel_path] = {
+            "size": file_path.stat().st_size,
+            "sha256": hashes[file_path]
+        }
+    return files
 
 
-def download_mods_parallel(mod_ids, workshop_path, steamcmd_path="steamcmd", timeout=300, max_workers=3):
+def compute_content_hash(files):
     """
-    并行下载多个模组
+    根据文件列表计算整个模组的内容哈希
 
     Args:
-        mod_ids: 模组ID列表
-        workshop_path: 创意工坊内容路径
-        steamcmd_path: SteamCMD 路径
-        timeout: 下载超时时间（秒）
-        max_workers: 最大并发数（建议 3-5）
+        files: hash_mod_files 返回的字典
 
     Returns:
-        dict: {mod_id: success_bool} 的字典
+        str: 十六进制哈希值
     """
-    if not mod_ids:
-        return {}
+    digest = hashlib.sha256()
+    for rel_path in sorted(files):
+        info = files[rel_path]
+        digest.update(f"{rel_path}\0{info['size']}\0{info['sha256']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
 
-    # 准备参数列表
-    args_list = [(mod_id, workshop_path, steamcmd_path, timeout) for mod_id in mod_ids]
+def build_manifest_entry(mod_path, moddetails=None, files=None):
+    """
+    为已安装的模组生成清单条目
 
-    print(f"\n开始并行下载 {len(mod_ids)} 个模组（并发数: {max_workers}）...")
+    Args:
+        mod_path: 模组目录
+        moddetails: get_workshop_details_batch 返回的该模组详情（可选）
+        files: 已计算好的文件哈希（可选，未提供时重新计算）
 
-    # 使用多进程下载
-    with multiprocessing.Pool(processes=max_workers) as pool:
-        results = pool.map(download_single_mod, args_list)
+    Returns:
+        dict: 清单条目
+    """
+    if files is None:
+        files = hash_mod_files(mod_path)
+    moddetails = moddetails or {}
+    return {
+        "time_updated": moddetails.get("time_updated", 0),
+        "file_size": moddetails.get("file_size", 0),
+        "installed_size": sum(info["size"] for info in files.values()),
+        "content_hash": compute_content_hash(files),
+        "files": files,
+        "installed_at": time.time()
+    }
 
-    # 转换为字典
-    result_dict = {mod_id: success for mod_id, success in results}
 
-    # 统计结果
-    success_count = sum(1 for success in result_dict.values() if success)
-    fail_count = len(result_dict) - success_count
+def format_bytes(size):
+    """
+    将字节数格式化为便于阅读的字符串
 
-    print(f"\n并行下载完成 - 成功: {success_count}, 失败: {fail_count}")
+    Args:
+        size: 字节数
 
-    return result_dict
+    Returns:
+        str: 例如 "12.3 MB"
+    """
+    size = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
 
 
-def check_mod_updates(mod_ids, workshop_path):
+def _link_or_copy(src, dest):
     """
-    检查模组更新
+    为未变化的文件创建硬链接，文件系统不支持时退回复制
+
+    Args:
+        src: 源文件
+        dest: 目标文件
+    """
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
 
-    基于以下规则判断：
-    1. 模组目录不存在 → 需要下载
-    2. filelist.xml 不存在 → 需要更新
-    3. 本地 filelist.xml 修改时间早于 Steam 创意工坊更新时间 → 需要更新
+
+def sync_mod_tree(staged_path, final_mod_path, installed_files=None, keep_staged=False):
+    """
+    将 SteamCMD 临时目录中的模组增量同步到最终位置
+
+    按大小和 SHA-256 比较临时目录与已安装目录：未变化的文件从已安装
+    目录硬链接过来（保留原 inode 和修改时间），变化或新增的文件从
+    临时目录移动过来，已不存在的文件不会出现在新目录中。新目录在
+    LocalMods/.{ID}.sync 中组装完成后再整体替换，中途崩溃不会留下
+    更新了一半的模组（见 recover_interrupted_syncs）。
 
     Args:
-        mod_ids: 模组ID列表
-        workshop_path: 创意工坊内容路径
+        staged_path: SteamCMD 下载的临时目录
+        final_mod_path: 模组最终目录（LocalMods/{ID}）
+        installed_files: 清单中记录的已安装文件哈希（可选，用于避免重复计算哈希）
+        keep_staged: 保留临时目录中的文件（变化的文件以 reflink 或复制的方式同步，
+                     SteamCMD 下次更新时可以只下载差异部分）
 
     Returns:
-        list: 需要更新的模组ID列表
+        dict: 同步统计，包含 files（新文件哈希）、bytes_written、bytes_skipped、
+              files_written、files_skipped、files_deleted
     """
-    needs_update = []
-    workshop = Path(workshop_path)
+    staged_path = Path(staged_path)
+    final_mod_path = Path(final_mod_path)
+    workshop = final_mod_path.parent
+    new_path = workshop / f".{final_mod_path.name}.sync"
+    installed_files = installed_files or {}
 
-    for mod_id in mod_ids:
-        mod_path = workshop / mod_id
-        filelist_path = mod_path / "filelist.xml"
+    if new_path.exists():
+        shutil.rmtree(new_path)
+    new_path.mkdir(parents=True)
 
-        # 检查1: 模组目录是否存在
-        if not mod_path.exists():
-            print(f"  模组 {mod_id}: 目录不存在，需要下载")
-            needs_update.append(mod_id)
-            continue
+    stats = {
+        "files": {},
+        "bytes_written": 0,
+        "bytes_skipped": 0,
+        "files_written": 0,
+        "files_skipped": 0,
+        "files_deleted": 0
+    }
 
-        # 检查2: filelist.xml 是否存在
-        if not filelist_path.exists():
-            print(f"  模组 {mod_id}: filelist.xml 不存在，需要更新")
-            needs_update.append(mod_id)
+    for src in sorted(staged_path.rglob('*')):
+        rel_path = src.relative_to(staged_path).as_posix()
+        dest = new_path / rel_path
+        if src.is_dir():
+            dest.mkdir(parents=True, exist_ok=True)
             continue
 
-        # 检查3: 获取 Steam 创意工坊的模组更新时间
-        remote_update_time = get_workshop_update_time(mod_id)
-        if remote_update_time == 0:
-            # 无法获取远程更新时间，跳过检查
-            print(f"  模组 {mod_id}: 无法获取更新信息，跳过检查")
-            continue
+        size = src.stat().st_size
+        sha256 = hash_file(src)
+        stats["files"][rel_path] = {"size": size, "sha256": sha256}
+        dest.parent.mkdir(parents=True, exist_ok=True)
 
-        # 检查4: 比较本地和远程更新时间
-        local_mtime = filelist_path.stat().st_mtime
+        current = final_mod_path / rel_path
+        if current.is_file() and current.stat().st_size == size:
+            recorded = installed_files.get(rel_path)
+            if recorded and recorded.get("size") == size:
+                current_sha256 = recorded.get("sha256")
+            else:
+                current_sha256 = hash_file(current)
+            if current_sha256 == sha256:
+                _link_or_copy(current, dest)
+                stats["bytes_skipped"] += size
+                stats["files_skipped"] += 1
+                continue
 
-        if remote_update_time > local_mtime:
-            print(f"  模组 {mod_id}: Steam 有更新，需要下载")
-            needs_update.append(mod_id)
+        if keep_staged:
+            _clone_file(src, dest, "reflink")
         else:
-            print(f"  模组 {mod_id}: 已是最新")
+            os.replace(src, dest)
+        stats["bytes_written"] += size
+        stats["files_written"] += 1
 
-    return needs_update
+    if final_mod_path.exists():
+        for current in final_mod_path.rglob('*'):
+            if current.is_file() and current.relative_to(final_mod_path).as_posix() not in stats["files"]:
+                stats["files_deleted"] += 1
 
+    _swap_mod_dir(new_path, final_mod_path)
+    return stats
 
-def main():
-    """主函数"""
-    # 加载配置
-    print("=== Barotrauma 模组自动更新工具 ===\n")
-    config, config_path = load_config()
 
-    # 从配置中获取设置
-    config_file = config["files"]["config_file"]
-    workshop_path = config["files"]["workshop_path"]
-    steamcmd_path = config["steamcmd"]["path"]
-    timeout = config["download"]["timeout"]
-    max_workers = config["download"]["max_workers"]
+def _swap_mod_dir(new_path, final_mod_path):
+    """
+    用组装好的新目录整体替换模组目录
 
-    # 以配置文件所在目录为基准解析相对路径
-    config_dir = config_path.parent
-    if not Path(workshop_path).is_absolute():
-        # 相对路径：相对于配置文件的位置
-        workshop_path = str((config_dir / workshop_path).resolve())
-    else:
-        # 绝对路径：直接使用
-        workshop_path = str(Path(workshop_path).resolve())
+    旧目录先改名为 .{ID}.old，新目录再改名到最终位置，最后删除旧目录。
+    两次改名之间中断时，recover_interrupted_syncs 会恢复旧目录。
 
-    print(f"使用配置文件: {config_path}")
-    print(f"SteamCMD 路径: {steamcmd_path}")
-    print(f"模组下载目录: {workshop_path}")
-    print(f"下载超时: {timeout} 秒")
-    print(f"并行下载: {max_workers} 个进程\n")
+    Args:
+        new_path: 组装好的新目录（LocalMods/.{ID}.sync）
+        final_mod_path: 模组最终目录（LocalMods/{ID}）
+    """
+    if not final_mod_path.exists():
+        os.rename(new_path, final_mod_path)
+        return
 
-    # 检查配置文件是否存在
-    config_file_path = Path(config_file)
-    if not config_file_path.is_absolute():
-        config_file_path = config_dir / config_file
-    config_file_path = config_file_path.resolve()
+    old_path = final_mod_path.parent / f".{final_mod_path.name}.old"
+    if old_path.exists():
+        shutil.rmtree(old_path)
+    os.rename(final_mod_path, old_path)
+    os.rename(new_path, final_mod_path)
+    shutil.rmtree(old_path, ignore_errors=True)
 
-    if not config_file_path.exists():
-        print(f"错误: 找不到配置文件 {config_file_path}")
-        sys.exit(1)
 
-    # 解析配置文件
-    print(f"正在解析配置文件: {config_file_path}")
-    mod_ids = parse_config_for_mod_ids(str(config_file_path))
+def recover_interrupted_syncs(workshop_path):
+    """
+    清理上次运行中断时遗留的同步目录
 
-    if not mod_ids:
-        print("未找到任何模组配置")
-        sys.exit(0)
+    - LocalMods/.{ID}.sync: 未组装完成的新目录，直接删除
+    - LocalMods/.{ID}.old: 若最终目录缺失（在两次改名之间中断），恢复为旧版本；否则删除
 
-    print(f"找到 {len(mod_ids)} 个模组\n")
+    Args:
+        workshop_path: 创意工坊内容路径
+    """
+    workshop = Path(workshop_path)
+    if not workshop.exists():
+        return
 
-    # 检查需要更新的模组
-    print("检查模组更新状态...")
-    update_list = check_mod_updates(mod_ids, workshop_path)
+    for path in workshop.iterdir():
+        if not path.is_dir() or not path.name.startswith('.'):
+            continue
+        if path.name.endswith('.sync'):
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.name.endswith('.old'):
+            final_mod_path = workshop / path.name[1:-len('.old')]
+            if final_mod_path.exists():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                print(f"恢复上次中断更新的模组 {final_mod_path.name}")
+                os.rename(path, final_mod_path)
 
-    if update_list:
-        print(f"发现 {len(update_list)} 个模组需要更新或下载\n")
-    else:
-        print("所有模组都是最新的\n")
 
-    # 下载/更新模组（并行下载）
-    if update_list:
-        download_results = download_mods_parallel(
-            update_list,
-            workshop_path,
-            steamcmd_path,
-            timeout,
-            max_workers
-        )
+# filelist.xml 中指向模组自身目录的路径：%ModDir%/...、%ModDir:名称或ID%/...、旧版的 Mods/{名称}/...
+MODDIR_PATH_PATTERN = re.compile(r'^%moddir(?::([^%]*))?%[/\\](.+)$', re.IGNORECASE)
+LEGACY_MOD_PATH_PATTERN = re.compile(r'^mods[/\\]([^/\\]+)[/\\](.+)$', re.IGNORECASE)
 
-        # 统计结果
-        success_count = sum(1 for success in download_results.values() if success)
-        fail_count = len(download_results) - success_count
-
-        # 显示每个模组的下载结果
-        print("\n=== 详细结果 ===")
-        for mod_id, success in download_results.items():
-            status = "✓ 成功" if success else "✗ 失败"
-            print(f"  模组 {mod_id}: {status}")
-    else:
-        success_count = 0
-        fail_count = 0
 
-    # 清理临时目录
-    steamapps_dir = Path(workshop_path) / "steamapps"
-    if steamapps_dir.exists():
-        print("\n正在清理临时文件...")
-        shutil.rmtree(steamapps_dir, ignore_errors=True)
-        print("✓ 临时文件清理完成")
+def parse_filelist_files(filelist_path, mod_id=None):
+    """
+    解析 filelist.xml 中引用的本模组内容文件
+
+    指向其他模组（%ModDir:其他模组%）或游戏本体的路径会被忽略。
+
+    Args:
+        filelist_path: filelist.xml 路径
+        mod_id: 模组ID（可选，用于识别 %ModDir:ID%）
+
+    Returns:
+        list: 相对于模组目录的文件路径列表（去重，保持原顺序）
+
+    Raises:
+        ET.ParseError: filelist.xml 格式错误
+    """
+    root = ET.parse(filelist_path).getroot()
+    own_names = {mod_id, root.get("name"), root.get("steamworkshopid")} - {None, ""}
+
+    files = []
+    for elem in root.iter():
+        value = elem.get("file")
+        if not value:
+            continue
+        match = MODDIR_PATH_PATTERN.match(value)
+        if match:
+            if match.group(1) and match.group(1) not in own_names:
+                continue
+            rel_path = match.group(2)
+        else:
+            match = LEGACY_MOD_PATH_PATTERN.match(value)
+            if not match:
+                continue
+            rel_path = match.group(2)
+        files.append(rel_path.replace('\\', '/'))
+    return list(dict.fromkeys(files))
+
+
+def find_missing_content_files(mod_id, mod_path):
+    """
+    检查 filelist.xml 引用的内容文件是否都存在
+
+    Args:
+        mod_id: 模组ID
+        mod_path: 模组目录
+
+    Returns:
+        list: 问题描述列表，为空表示检查通过
+    """
+    mod_path = Path(mod_path)
+    filelist_path = mod_path / "filelist.xml"
+    if not filelist_path.is_file() or filelist_path.stat().st_size == 0:
+        return ["filelist.xml 不存在或为空"]
+    try:
+        referenced = parse_filelist_files(filelist_path, mod_id)
+    except ET.ParseError as e:
+        return [f"filelist.xml 解析失败: {e}"]
+    return [f"缺少内容文件 {rel_path}" for rel_path in referenced if not (mod_path / rel_path).is_file()]
+
+
+def verify_installed_mods(mod_ids, workshop_path, max_workers=None):
+    """
+    校验已安装模组的完整性（替代 SteamCMD 的 validate）
+
+    1. filelist.xml 存在且能解析，其中引用的内容文件都存在
+    2. 清单记录的每个文件都存在且大小一致
+    3. 所有模组的文件在同一个线程池中计算 SHA-256，与清单记录比较
+
+    清单中没有文件哈希的模组（从旧目录补录的条目）只做前两项检查，
+    通过后把本次计算的哈希写入清单，作为以后校验的基准。
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 创意工坊内容路径
+        max_workers: 计算哈希的线程数（默认为 CPU 核心数）
+
+    Returns:
+        dict: {mod_id: 问题描述列表}，列表为空表示校验通过
+    """
+    workshop = Path(workshop_path)
+    writer = ManifestWriter(workshop)
+    manifest = writer.manifest
+    problems = {}
+    expected = {}
+    baseline_ids = []
+
+    for mod_id in mod_ids:
+        mod_path = workshop / mod_id
+        if not mod_path.is_dir():
+            problems[mod_id] = ["模组目录不存在"]
+            continue
+        problems[mod_id] = find_missing_content_files(mod_id, mod_path)
+
+        files = (manifest.get(mod_id) or {}).get("files")
+        if not files:
+            baseline_ids.append(mod_id)
+            continue
+        for rel_path, info in files.items():
+            file_path = mod_path / rel_path
+            if not file_path.is_file():
+                problems[mod_id].append(f"缺少文件 {rel_path}")
+            elif file_path.stat().st_size != info["size"]:
+                problems[mod_id].append(f"文件大小不一致 {rel_path}")
+            else:
+                expected[file_path] = (mod_id, rel_path, info["sha256"])
+
+    hashes = hash_files_parallel(expected, max_workers)
+    for file_path, (mod_id, rel_path, sha256) in expected.items():
+        if hashes[file_path] != sha256:
+            problems[mod_id].append(f"文件内容不一致 {rel_path}")
+
+    for mod_id in baseline_ids:
+        if problems[mod_id]:
+            continue
+        entry = dict(manifest[mod_id]) if mod_id in manifest else {}
+        baseline = build_manifest_entry(workshop / mod_id, None, hash_mod_files(workshop / mod_id, max_workers))
+        for key in ("time_updated", "file_size", "installed_at"):
+            if key in entry:
+                baseline[key] = entry[key]
+        writer.record(mod_id, baseline)
+        print(f"  模组 {mod_id}: 清单中没有文件哈希，已记录当前文件作为校验基准")
+    writer.flush()
+
+    return problems
+
+
+STEAM_APP_ID = "602960"
+
+# SteamCMD 在每个 workshop_download_item 完成后输出的结果行
+STEAMCMD_SUCCESS_PATTERN = re.compile(r'Success\. Downloaded item (\d+)')
+STEAMCMD_FAILURE_PATTERN = re.compile(r'ERROR! Download item (\d+) failed \(([^)]*)\)')
+STEAMCMD_LOGIN_FAILURE_PATTERN = re.compile(r"Logging in user .*\.\.\.FAILED|FAILED login")
+# 这些失败原因通常是并发会话过多造成的（被限流、连接超时、登录失败），
+# 其余原因（例如 Failure、File Not Found）与并发数无关
+STEAMCMD_CONGESTION_PATTERN = re.compile(r'rate limit|timeout|timed out|no connection|busy|登录失败', re.IGNORECASE)
+
+
+# 正在运行的 SteamCMD 进程，用于取消下载时统一终止
+_active_processes = set()
+_active_processes_lock = threading.Lock()
+
+
+class SteamCMDTimeout(subprocess.TimeoutExpired):
+    """
+    SteamCMD 被看门狗终止
+
+    reason 为 "too_slow"（超过按大小估算的截止时间）或 "stalled"（长时间没有进展）。
+    """
+
+    def __init__(self, cmd, timeout, reason, output=None, stderr=None):
+        super().__init__(cmd, timeout, output=output, stderr=stderr)
+        self.reason = reason
+
+
+def _paths_size(paths):
+    """
+    统计多个文件或目录的总大小（不存在的路径计为 0）
+
+    Args:
+        paths: 路径列表
+
+    Returns:
+        int: 字节数
+    """
+    total = 0
+    for path in paths:
+        path = Path(path)
+        try:
+            if path.is_file():
+                total += path.stat().st_size
+            elif path.is_dir():
+                total += _dir_size(path)
+        except OSError:
+            pass
+    return total
+
+
+def _kill_process_tree(proc):
+    """
+    终止进程及其启动的所有子进程
+
+    Linux 上的 steamcmd 是 steamcmd.sh，真正的下载进程是它的子进程；只终止
+    脚本本身时子进程仍占用输出管道，读取线程会一直等到它自己退出。进程以
+    新会话启动（进程组ID与进程ID相同），这里终止整个进程组；Windows 上
+    直接终止进程。
+
+    Args:
+        proc: subprocess.Popen 实例
+    """
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+            return
+        except (ProcessLookupError, PermissionError):
+            pass
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+def run_steamcmd(cmd, timeout, stall_timeout=None, watch_paths=None, poll_interval=1.0):
+    """
+    运行 SteamCMD 并由看门狗监视直到结束
+
+    进程在运行期间会登记到 _active_processes 中，以便
+    terminate_active_steamcmd 在取消下载时终止它。输出的每一行以及
+    watch_paths（SteamCMD 的下载目录）大小的增长都视为有进展；超过
+    stall_timeout 秒没有任何进展，或总耗时超过 timeout 时终止进程。
+
+    Args:
+        cmd: 命令参数列表
+        timeout: 超时时间（秒）
+        stall_timeout: 没有进展的最长时间（秒，None 或 0 表示不检测）
+        watch_paths: 用于判断下载进展的路径列表（可选）
+        poll_interval: 看门狗检查间隔（秒）
+
+    Returns:
+        subprocess.CompletedProcess: 运行结果
+
+    Raises:
+        SteamCMDTimeout: 超时或停滞（进程已被终止）
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            start_new_session=os.name == "posix")
+    with _active_processes_lock:
+        _active_processes.add(proc)
+
+    start = time.monotonic()
+    progress = {"time": start}
+    output = {"stdout": [], "stderr": []}
+
+    def read_stream(stream, lines):
+        for line in stream:
+            lines.append(line)
+            progress["time"] = time.monotonic()
+
+    readers = [threading.Thread(target=read_stream, args=(proc.stdout, output["stdout"]), daemon=True),
+               threading.Thread(target=read_stream, args=(proc.stderr, output["stderr"]), daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    reason = None
+    last_size = _paths_size(watch_paths or [])
+    try:
+        while True:
+            try:
+                proc.wait(timeout=poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+
+            now = time.monotonic()
+            if watch_paths:
+                size = _paths_size(watch_paths)
+                if size != last_size:
+                    last_size = size
+                    progress["time"] = now
+
+            if now - start >= timeout:
+                reason = "too_slow"
+            elif stall_timeout and now - progress["time"] >= stall_timeout:
+                reason = "stalled"
+            if reason:
+                _kill_process_tree(proc)
+                proc.wait()
+                break
+    finally:
+        if proc.poll() is None:
+            _kill_process_tree(proc)
+            proc.wait()
+        for reader in readers:
+            reader.join()
+        with _active_processes_lock:
+            _active_processes.discard(proc)
+
+    stdout = "".join(output["stdout"])
+    stderr = "".join(output["stderr"])
+    if reason:
+        raise SteamCMDTimeout(cmd, timeout, reason, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def terminate_active_steamcmd():
+    """
+    终止所有正在运行的 SteamCMD 进程（包括它们的子进程）
+    """
+    with _active_processes_lock:
+        processes = list(_active_processes)
+    for proc in processes:
+        _kill_process_tree(proc)
+
+
+def get_steamcmd_progress_paths(workshop_path, mod_ids):
+    """
+    获取用于判断 SteamCMD 下载进展的目录（未完成的下载和下载完成的物品目录）
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        mod_ids: 模组ID列表
+
+    Returns:
+        list: 路径列表
+    """
+    workshop_dir = Path(workshop_path) / "steamapps" / "workshop"
+    paths = []
+    for mod_id in mod_ids:
+        paths.append(workshop_dir / "downloads" / STEAM_APP_ID / mod_id)
+        paths.append(workshop_dir / "content" / STEAM_APP_ID / mod_id)
+    return paths
+
+
+def get_steamcmd_download_path(workshop_path, mod_id):
+    """
+    获取 SteamCMD 下载模组时使用的临时目录
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        mod_id: 模组ID
+
+    Returns:
+        Path: workshop/steamapps/workshop/content/602960/{mod_id}
+    """
+    return Path(workshop_path) / "steamapps" / "workshop" / "content" / STEAM_APP_ID / mod_id
+
+
+def get_http_download_path(workshop_path, mod_id):
+    """
+    获取直接下载（file_url）时未完成文件的保存位置
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        mod_id: 模组ID
+
+    Returns:
+        Path: workshop/steamapps/workshop/downloads/602960/{mod_id}.part
+    """
+    return Path(workshop_path) / "steamapps" / "workshop" / "downloads" / STEAM_APP_ID / f"{mod_id}.part"
+
+
+def _partial_info_path(part_path):
+    """未完成文件对应的版本记录（{mod_id}.part.json）"""
+    return part_path.with_name(part_path.name + ".json")
+
+
+def _discard_partial_download(part_path):
+    """删除未完成的文件及其版本记录"""
+    part_path.unlink(missing_ok=True)
+    _partial_info_path(part_path).unlink(missing_ok=True)
+
+
+# 多次记录时需要累加的统计字段
+_ACCUMULATED_STATS = ("steamcmd_seconds", "http_seconds", "http_bytes", "validate_seconds", "move_seconds",
+                      "attempts", "bytes_written", "bytes_skipped", "files_written", "files_skipped", "files_deleted")
+
+
+def _record_mod_stats(mod_stats, mod_id, **values):
+    """
+    记录单个模组的统计信息
+
+    计时、次数和数据量等字段累加，其他字段（如 exit_code）直接覆盖。
+
+    Args:
+        mod_stats: {mod_id: 统计信息} 字典，为 None 时不记录
+        mod_id: 模组ID
+        **values: 要记录的字段
+    """
+    if mod_stats is None:
+        return
+    stats = mod_stats.setdefault(mod_id, {})
+    for key, value in values.items():
+        if key in _ACCUMULATED_STATS:
+            stats[key] = stats.get(key, 0) + value
+        else:
+            stats[key] = value
+
+
+JOURNAL_FILENAME = ".run_journal.jsonl"
+JOURNAL_STATES = ("queued", "downloading", "staged", "installed", "failed")
+
+
+class RunJournal:
+    """
+    记录一次运行中每个模组的状态（queued / downloading / staged / installed / failed）
+
+    日志以 JSON Lines 格式追加写入 LocalMods/.run_journal.jsonl：第一行记录
+    本次运行要处理的模组，之后每次状态变化追加一行，正常结束时追加 end 行。
+    进程被终止后，--resume 根据最后一次运行的日志继续处理未完成的模组。
+    """
+
+    def __init__(self, workshop_path):
+        """
+        初始化运行日志
+
+        Args:
+            workshop_path: 创意工坊内容路径
+        """
+        self.path = Path(workshop_path) / JOURNAL_FILENAME
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def _append(self, record):
+        """
+        追加一条记录并立即刷新到磁盘
+
+        Args:
+            record: 记录字典
+        """
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self, mod_ids, states=None):
+        """
+        开始新的运行日志（覆盖上一次的日志）
+
+        Args:
+            mod_ids: 本次要处理的模组ID列表
+            states: 已知的初始状态（可选，恢复运行时沿用上次的 staged 状态），默认均为 queued
+        """
+        states = states or {}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.states = {mod_id: states.get(mod_id, "queued") for mod_id in mod_ids}
+            self.path.unlink(missing_ok=True)
+            self._append({"type": "run", "started_at": time.time(), "mods": self.states})
+
+    def record(self, mod_id, state, **info):
+        """
+        记录模组状态变化
+
+        Args:
+            mod_id: 模组ID
+            state: 新状态（JOURNAL_STATES 之一）
+            **info: 附加信息（如失败原因）
+        """
+        with self._lock:
+            self.states[mod_id] = state
+            self._append(dict({"type": "mod", "mod_id": mod_id, "state": state, "time": time.time()}, **info))
+
+    def finish(self, exit_code):
+        """
+        记录本次运行正常结束
+
+        Args:
+            exit_code: 退出码
+        """
+        with self._lock:
+            self._append({"type": "end", "exit_code": exit_code, "time": time.time()})
+
+    @staticmethod
+    def load(workshop_path):
+        """
+        读取上一次运行的日志
+
+        日志末尾被截断的行（写入中途被终止）会被忽略。
+
+        Args:
+            workshop_path: 创意工坊内容路径
+
+        Returns:
+            dict: {"states": {mod_id: 状态}, "finished": 是否正常结束}，没有日志时返回 None
+        """
+        path = Path(workshop_path) / JOURNAL_FILENAME
+        if not path.exists():
+            return None
+
+        states = {}
+        finished = False
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "run":
+                    states = dict(record.get("mods", {}))
+                elif record.get("type") == "mod":
+                    states[record["mod_id"]] = record["state"]
+                elif record.get("type") == "end":
+                    finished = True
+        return {"states": states, "finished": finished}
+
+
+def _journal_record(journal, mod_id, state, **info):
+    """
+    记录模组状态（journal 为 None 时不记录）
+
+    Args:
+        journal: RunJournal 实例或 None
+        mod_id: 模组ID
+        state: 新状态
+        **info: 附加信息
+    """
+    if journal is not None:
+        journal.record(mod_id, state, **info)
+
+
+def _validate_staged_mod(mod_id, steamcmd_download_path, stdout="", stderr=""):
+    """
+    验证 SteamCMD 下载到临时目录的模组是否完整
+
+    Args:
+        mod_id: 模组ID
+        steamcmd_download_path: SteamCMD 下载目录
+        stdout: SteamCMD 标准输出（用于出错时显示）
+        stderr: SteamCMD 错误输出（用于出错时显示）
+
+    Returns:
+        bool: 验证是否通过
+    """
+    # 检查下载目录是否存在
+    if not steamcmd_download_path.exists():
+        print(f"✗ 模组 {mod_id} 下载失败: SteamCMD 未能创建下载目录")
+        print(f"SteamCMD 输出: {stdout}")
+        print(f"SteamCMD 错误: {stderr}")
+        return False
+
+    # 检查下载目录是否为空
+    downloaded_files = list(steamcmd_download_path.iterdir())
+    if not downloaded_files:
+        print(f"✗ 模组 {mod_id} 下载失败: SteamCMD 未下载任何文件到预期位置")
+        print(f"SteamCMD 输出: {stdout}")
+        print(f"SteamCMD 错误: {stderr}")
+        return False
+
+    # 检查 filelist.xml 是否存在（这是模组的关键文件）
+    filelist_path = steamcmd_download_path / "filelist.xml"
+    if not filelist_path.exists():
+        print(f"✗ 模组 {mod_id} 下载失败: filelist.xml 不存在")
+        print(f"下载目录内容: {[f.name for f in downloaded_files]}")
+        print(f"SteamCMD 输出: {stdout}")
+        print(f"SteamCMD 错误: {stderr}")
+        return False
+
+    # 检查 filelist.xml 是否为空
+    if filelist_path.stat().st_size == 0:
+        print(f"✗ 模组 {mod_id} 下载失败: filelist.xml 为空文件")
+        print(f"SteamCMD 输出: {stdout}")
+        print(f"SteamCMD 错误: {stderr}")
+        return False
+
+    # 检查 filelist.xml 引用的内容文件（模组作者遗漏文件时游戏同样会报错，这里只提示）
+    problems = find_missing_content_files(mod_id, steamcmd_download_path)
+    if problems:
+        print(f"⚠ 模组 {mod_id}: {'; '.join(problems[:5])}")
+        if len(problems) > 5:
+            print(f"  ……共 {len(problems)} 个问题")
+
+    return True
+
+
+def install_downloaded_mod(mod_id, workshop_path, stdout="", stderr="", moddetails=None, mod_stats=None,
+                           journal=None, manifest=None):
+    """
+    验证 SteamCMD 下载结果并将模组增量同步到最终位置
+
+    安装成功后会把模组写入本地清单。SteamCMD 临时目录中的文件会保留，
+    作为下次更新的基础（由 cleanup_staging 按大小上限清理）。
+
+    Args:
+        mod_id: 模组ID
+        workshop_path: 创意工坊内容路径（绝对路径）
+        stdout: SteamCMD 标准输出（用于出错时显示）
+        stderr: SteamCMD 错误输出（用于出错时显示）
+        moddetails: get_workshop_details_batch 返回的该模组详情（可选）
+        mod_stats: 字典（可选），传入时记录 {mod_id: 统计信息}（计时、退出码、同步数据量）
+        journal: RunJournal 实例（可选），记录 staged / installed 状态
+        manifest: ManifestWriter 实例（可选），传入时清单条目由它批量写入，
+                  否则立即写入本地清单
+
+    Returns:
+        bool: 安装是否成功
+    """
+    workshop = Path(workshop_path)
+    # SteamCMD 会下载到: workshop/steamapps/workshop/content/602960/{mod_id}/
+    # 我们需要将内容移动到: workshop/{mod_id}/
+    steamcmd_download_path = get_steamcmd_download_path(workshop, mod_id)
+    final_mod_path = workshop / mod_id
+
+    # 验证下载是否成功
+    validate_start = time.monotonic()
+    valid = _validate_staged_mod(mod_id, steamcmd_download_path, stdout, stderr)
+    _record_mod_stats(mod_stats, mod_id, validate_seconds=time.monotonic() - validate_start)
+    if not valid:
+        return False
+    _journal_record(journal, mod_id, "staged")
+
+    # 将下载的文件增量同步到最终位置
+    move_start = time.monotonic()
+    try:
+        entry = manifest.get(mod_id) if manifest is not None else load_manifest(workshop).get(mod_id)
+        installed_files = (entry or {}).get("files")
+        stats = sync_mod_tree(steamcmd_download_path, final_mod_path, installed_files, keep_staged=True)
+        # 更新修改时间，清理临时目录时最近使用的模组最后被淘汰
+        os.utime(steamcmd_download_path)
+
+        # 验证文件是否成功移动
+        final_filelist = final_mod_path / "filelist.xml"
+        if not final_filelist.exists():
+            print(f"✗ 模组 {mod_id} 文件移动失败: 最终位置未找到 filelist.xml")
+            return False
+
+        print(f"✓ 模组 {mod_id} 下载并移动成功（写入 {format_bytes(stats['bytes_written'])}，"
+              f"跳过未变化的 {format_bytes(stats['bytes_skipped'])}，删除 {stats['files_deleted']} 个文件）")
+    except Exception as e:
+        print(f"✗ 模组 {mod_id} 文件移动时出错: {e}")
+        _record_mod_stats(mod_stats, mod_id, move_seconds=time.monotonic() - move_start)
+        return False
+
+    # 更新本地清单
+    try:
+        entry = build_manifest_entry(final_mod_path, moddetails, stats["files"])
+        if manifest is not None:
+            manifest.record(mod_id, entry)
+        else:
+            record_manifest_entry(workshop, mod_id, entry)
+    except Exception as e:
+        print(f"  模组 {mod_id}: 更新模组清单失败: {e}")
+
+    _record_mod_stats(mod_stats, mod_id, move_seconds=time.monotonic() - move_start,
+                      **{key: value for key, value in stats.items() if key != "files"})
+    _journal_record(journal, mod_id, "installed")
+    return True
+
+
+def download_mod_steamcmd(mod_id, workshop_path, steamcmd_path="steamcmd", timeout=300, moddetails=None,
+                          mod_stats=None, validate=True, journal=None, stall_timeout=None, manifest=None):
+    """
+    使用 SteamCMD 下载模组
+
+    Args:
+        mod_id: Steam 创意工坊模组ID
+        workshop_path: 创意工坊内容路径（绝对路径）
+        steamcmd_path: SteamCMD 可执行文件路径
+        timeout: 下载超时时间（秒）
+        moddetails: get_workshop_details_batch 返回的该模组详情（可选，用于写入清单）
+        mod_stats: 字典（可选），传入时记录 {mod_id: 统计信息}（计时、退出码、同步数据量）
+        validate: 是否让 SteamCMD 下载后重新校验物品的所有文件
+        journal: RunJournal 实例（可选），记录模组状态
+        stall_timeout: 没有下载进展多少秒后终止 SteamCMD（None 或 0 表示不检测）
+        manifest: ManifestWriter 实例（可选），批量写入清单条目
+
+    Returns:
+        bool: 下载是否成功
+    """
+    workshop = Path(workshop_path)
+    workshop.mkdir(parents=True, exist_ok=True)
+
+    # SteamCMD 下载命令
+    cmd = [
+        steamcmd_path,
+        "+force_install_dir", str(workshop),
+        "+login", "anonymous",
+        "+workshop_download_item", STEAM_APP_ID, mod_id
+    ]
+    if validate:
+        cmd.append("validate")
+    cmd.append("+quit")
+
+    steamcmd_start = time.monotonic()
+    try:
+        print(f"正在下载模组 {mod_id}...")
+        _journal_record(journal, mod_id, "downloading")
+        result = run_steamcmd(cmd, timeout, stall_timeout, get_steamcmd_progress_paths(workshop, [mod_id]))
+        _record_mod_stats(mod_stats, mod_id, steamcmd_seconds=time.monotonic() - steamcmd_start, attempts=1,
+                          exit_code=result.returncode)
+
+        # SteamCMD 下载失败时退出码同样为 0，临时目录中可能还保留着上一个版本，
+        # 必须以输出中的成功行为准
+        success, reason = parse_steamcmd_item_results(result.stdout).get(mod_id, (False, "无结果"))
+        if result.returncode == 0 and success:
+            return install_downloaded_mod(mod_id, workshop, result.stdout, result.stderr, moddetails, mod_stats,
+                                          journal, manifest)
+        else:
+            if not success and STEAMCMD_LOGIN_FAILURE_PATTERN.search(result.stdout):
+                reason = "登录失败"
+            _record_mod_stats(mod_stats, mod_id, error=reason)
+            print(f"✗ 模组 {mod_id} 下载失败（{reason or f'退出码 {result.returncode}'}）")
+            print(f"SteamCMD 错误信息: {result.stderr}")
+            print(f"SteamCMD 输出: {result.stdout}")
+            return False
+    except SteamCMDTimeout as e:
+        _record_mod_stats(mod_stats, mod_id, steamcmd_seconds=time.monotonic() - steamcmd_start, attempts=1,
+                          exit_code=None, timeout_reason=e.reason)
+        if e.reason == "stalled":
+            print(f"✗ 模组 {mod_id} 下载停滞（{stall_timeout} 秒没有进展），已终止 SteamCMD")
+        else:
+            print(f"✗ 模组 {mod_id} 下载超时（{timeout:.0f} 秒）")
+        return False
+    except Exception as e:
+        print(f"✗ 下载模组 {mod_id} 时出错: {e}")
+        return False
+
+
+def _safe_extract_path(dest_path, member_name):
+    """
+    计算压缩包成员的解压位置，拒绝绝对路径和跳出目标目录的路径
+
+    Args:
+        dest_path: 解压目标目录
+        member_name: 压缩包中的成员路径
+
+    Returns:
+        Path: 解压后的路径
+
+    Raises:
+        ValueError: 成员路径不安全
+    """
+    dest_path = Path(dest_path).resolve()
+    target = (dest_path / member_name).resolve()
+    if target != dest_path and dest_path not in target.parents:
+        raise ValueError(f"压缩包包含不安全的路径: {member_name}")
+    return target
+
+
+def extract_mod_archive(archive_path, dest_path):
+    """
+    将直接下载的模组压缩包（zip 或 tar）解压到目录
+
+    压缩包中只有一个顶层目录且 filelist.xml 位于其中时，返回该目录，
+    使返回的目录与 SteamCMD 下载目录的结构一致。
+
+    Args:
+        archive_path: 压缩包路径
+        dest_path: 解压目标目录（不存在时创建）
+
+    Returns:
+        Path: 模组内容所在目录（包含 filelist.xml）
+
+    Raises:
+        ValueError: 不支持的压缩格式或不安全的成员路径
+    """
+    dest_path = Path(dest_path)
+    dest_path.mkdir(parents=True, exist_ok=True)
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for name in archive.namelist():
+                _safe_extract_path(dest_path, name)
+            archive.extractall(dest_path)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path) as archive:
+            members = archive.getmembers()
+            for member in members:
+                _safe_extract_path(dest_path, member.name)
+                if not (member.isfile() or member.isdir()):
+                    raise ValueError(f"压缩包包含不支持的成员类型: {member.name}")
+            archive.extractall(dest_path, members)
+    else:
+        raise ValueError("不支持的压缩格式（仅支持 zip 和 tar）")
+
+    entries = list(dest_path.iterdir())
+    if not (dest_path / "filelist.xml").exists() and len(entries) == 1 and entries[0].is_dir():
+        return entries[0]
+    return dest_path
+
+
+def download_mod_http(mod_id, workshop_path, moddetails, http_client, timeout=300, mod_stats=None, journal=None,
+                      cancel_event=None, chunk_size=64 * 1024, max_attempts=3, manifest=None):
+    """
+    直接从 GetPublishedFileDetails 返回的 file_url 下载模组压缩包
+
+    不需要启动 SteamCMD（登录、获取应用信息）。文件以流式写入
+    steamapps/workshop/downloads/602960/{mod_id}.part，连接中断或超时后
+    保留已下载的部分，下次通过 HTTP Range 请求继续。{mod_id}.part.json
+    记录该文件对应的 file_url、time_updated、file_size 和服务器返回的
+    ETag / Last-Modified：版本变化后丢弃旧的部分重新下载，续传时通过
+    If-Range 让服务器在文件已改变时返回完整内容。下载完成后与
+    file_size 比较大小，解压到 SteamCMD 使用的临时目录，再由
+    install_downloaded_mod 验证并同步到最终位置。
+
+    Args:
+        mod_id: 模组ID
+        workshop_path: 创意工坊内容路径（绝对路径）
+        moddetails: get_workshop_details_batch 返回的该模组详情（需要 file_url）
+        http_client: SteamWebAPIClient 实例
+        timeout: 整个下载的超时时间（秒）
+        mod_stats: 字典（可选），传入时记录 {mod_id: 统计信息}
+        journal: RunJournal 实例（可选），记录模组状态
+        cancel_event: 设置后中止下载（可选）
+        chunk_size: 每次读取的字节数
+        max_attempts: 传输中断时（通过 Range 续传）的最大尝试次数
+        manifest: ManifestWriter 实例（可选），批量写入清单条目
+
+    Returns:
+        bool: 下载并安装是否成功
+    """
+    moddetails = moddetails or {}
+    file_url = moddetails.get("file_url")
+    if not file_url:
+        return False
+    expected_size = moddetails.get("file_size", 0)
+
+    workshop = Path(workshop_path)
+    part_path = get_http_download_path(workshop, mod_id)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    info_path = _partial_info_path(part_path)
+    version = {"file_url": file_url, "time_updated": moddetails.get("time_updated", 0),
+               "file_size": expected_size}
+
+    partial_info = {}
+    if part_path.exists():
+        try:
+            with open(info_path, 'r', encoding='utf-8') as f:
+                partial_info = json.load(f)
+        except (OSError, ValueError):
+            partial_info = {}
+        if any(partial_info.get(key) != value for key, value in version.items()):
+            # 没有版本记录或模组已经更新：旧的部分不能与新版本拼接
+            print(f"  模组 {mod_id}: 未完成的文件属于其他版本，重新下载")
+            _discard_partial_download(part_path)
+            partial_info = {}
+
+    print(f"正在直接下载模组 {mod_id}...")
+    _journal_record(journal, mod_id, "downloading")
+    start = time.monotonic()
+    deadline = start + timeout
+    received = 0
+    complete = False
+    try:
+        for attempt in range(max_attempts):
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            if expected_size and offset >= expected_size:
+                complete = offset == expected_size
+                break
+
+            headers = {}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                validator = partial_info.get("etag") or partial_info.get("last_modified")
+                if validator:
+                    headers["If-Range"] = validator
+            try:
+                with http_client.get(file_url, headers=headers, stream=True) as response:
+                    if response.status_code == 416:
+                        # 服务器认为已经没有剩余内容：文件与预期不符，重新下载
+                        _discard_partial_download(part_path)
+                        partial_info = {}
+                        continue
+                    response.raise_for_status()
+                    etag = response.headers.get("ETag")
+                    if offset and response.status_code == 206 and partial_info.get("etag") and etag \
+                            and etag != partial_info["etag"]:
+                        # 服务器忽略了 If-Range，但文件已经改变
+                        print(f"  模组 {mod_id}: 服务器上的文件已改变，重新下载")
+                        _discard_partial_download(part_path)
+                        partial_info = {}
+                        continue
+                    if offset and response.status_code != 206:
+                        # 服务器不支持 Range（或文件已改变），从头下载
+                        offset = 0
+                    if offset:
+                        print(f"  模组 {mod_id}: 从 {format_bytes(offset)} 处继续下载")
+                    else:
+                        partial_info = dict(version, etag=etag,
+                                            last_modified=response.headers.get("Last-Modified"))
+                        atomic_write_json(info_path, partial_info)
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size):
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise InterruptedError("下载已取消")
+                            if time.monotonic() > deadline:
+                                raise TimeoutError(f"下载超时（{timeout:.0f} 秒）")
+                            f.write(chunk)
+                            received += len(chunk)
+            except requests.HTTPError as e:
+                print(f"✗ 模组 {mod_id} 直接下载失败: {e}")
+                return False
+            except requests.RequestException as e:
+                kept = part_path.stat().st_size if part_path.exists() else 0
+                print(f"  模组 {mod_id}: 传输中断（{e}），已保留 {format_bytes(kept)}（{attempt + 1}/{max_attempts}）")
+                continue
+
+            complete = True
+            break
+    except (InterruptedError, TimeoutError, OSError) as e:
+        print(f"✗ 模组 {mod_id} 直接下载失败: {e}")
+        return False
+    finally:
+        _record_mod_stats(mod_stats, mod_id, http_seconds=time.monotonic() - start, http_bytes=received)
+
+    if not complete:
+        print(f"✗ 模组 {mod_id} 直接下载失败: 多次传输中断")
+        return False
+
+    actual_size = part_path.stat().st_size
+    if expected_size and actual_size != expected_size:
+        print(f"✗ 模组 {mod_id} 直接下载的文件大小不符（{actual_size} / {expected_size} 字节）")
+        _discard_partial_download(part_path)
+        return False
+
+    # 解压到临时目录后替换 SteamCMD 临时目录中的旧版本
+    staged_path = get_steamcmd_download_path(workshop, mod_id)
+    extract_path = staged_path.with_name(f".{mod_id}.extract")
+    shutil.rmtree(extract_path, ignore_errors=True)
+    try:
+        content_path = extract_mod_archive(part_path, extract_path)
+        shutil.rmtree(staged_path, ignore_errors=True)
+        os.replace(content_path, staged_path)
+    except (ValueError, OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        print(f"✗ 模组 {mod_id} 解压失败: {e}")
+        _discard_partial_download(part_path)
+        return False
+    finally:
+        shutil.rmtree(extract_path, ignore_errors=True)
+    _discard_partial_download(part_path)
+
+    if not install_downloaded_mod(mod_id, workshop, moddetails=moddetails, mod_stats=mod_stats, journal=journal,
+                                  manifest=manifest):
+        return False
+    _record_mod_stats(mod_stats, mod_id, source="http")
+    return True
+
+
+def parse_steamcmd_item_results(output):
+    """
+    解析 SteamCMD 输出中每个创意工坊物品的下载结果
+
+    Args:
+        output: SteamCMD 标准输出
+
+    Returns:
+        dict: {mod_id: (success_bool, 失败原因)} 的字典，未出现在输出中的物品不包含在内
+    """
+    item_results = {}
+    for line in output.splitlines():
+        match = STEAMCMD_SUCCESS_PATTERN.search(line)
+        if match:
+            item_results[match.group(1)] = (True, "")
+            continue
+        match = STEAMCMD_FAILURE_PATTERN.search(line)
+        if match:
+            item_results[match.group(1)] = (False, match.group(2))
+    return item_results
+
+
+def download_mods_steamcmd_batch(mod_ids, workshop_path, steamcmd_path="steamcmd", timeout=300, details=None,
+                                 cancel_event=None, mod_stats=None, validate=True, journal=None,
+                                 stall_timeout=None, manifest=None):
+    """
+    在一个 SteamCMD 会话中批量下载多个模组
+
+    将多个 +workshop_download_item 串联到同一次调用中，只需登录一次。
+    根据输出中每个物品的成功/失败行安装模组，失败或没有结果的模组
+    再逐个调用 download_mod_steamcmd 重试。
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 创意工坊内容路径（绝对路径）
+        steamcmd_path: SteamCMD 可执行文件路径
+        timeout: 单个模组的下载超时时间（秒），整个会话按模组数量累加
+        details: get_workshop_details_batch 返回的模组详情字典（可选，用于写入清单）
+        cancel_event: 设置后不再逐个重试失败的模组（可选）
+        mod_stats: 字典（可选），传入时记录 {mod_id: 统计信息}（计时、退出码、同步数据量）
+        validate: 是否让 SteamCMD 下载后重新校验物品的所有文件
+        journal: RunJournal 实例（可选），记录模组状态
+        stall_timeout: 没有下载进展多少秒后终止 SteamCMD（None 或 0 表示不检测）
+        manifest: ManifestWriter 实例（可选），批量写入清单条目
+
+    Returns:
+        dict: {mod_id: success_bool} 的字典
+    """
+    if not mod_ids:
+        return {}
+
+    workshop = Path(workshop_path)
+    workshop.mkdir(parents=True, exist_ok=True)
+    details = details or {}
+
+    cmd = [
+        steamcmd_path,
+        "+force_install_dir", str(workshop),
+        "+login", "anonymous"
+    ]
+    for mod_id in mod_ids:
+        cmd += ["+workshop_download_item", STEAM_APP_ID, mod_id]
+        if validate:
+            cmd.append("validate")
+    cmd.append("+quit")
+
+    stdout = ""
+    stderr = ""
+    exit_code = None
+    session_start = time.monotonic()
+    try:
+        print(f"正在批量下载 {len(mod_ids)} 个模组: {', '.join(mod_ids)}")
+        for mod_id in mod_ids:
+            _journal_record(journal, mod_id, "downloading")
+        result = run_steamcmd(cmd, timeout * len(mod_ids), stall_timeout,
+                              get_steamcmd_progress_paths(workshop, mod_ids))
+        stdout = result.stdout
+        stderr = result.stderr
+        exit_code = result.returncode
+    except SteamCMDTimeout as e:
+        print(f"✗ 批量下载{'停滞' if e.reason == 'stalled' else '超时'}，将逐个重试未完成的模组")
+        stdout = e.stdout or ""
+        if isinstance(stdout, bytes):
+            stdout = stdout.decode('utf-8', errors='replace')
+    except Exception as e:
+        print(f"✗ 批量下载时出错: {e}，将逐个重试")
+
+    item_results = parse_steamcmd_item_results(stdout)
+
+    # 会话耗时平均分摊到批次中的每个模组
+    session_share = (time.monotonic() - session_start) / len(mod_ids)
+    for mod_id in mod_ids:
+        _record_mod_stats(mod_stats, mod_id, steamcmd_seconds=session_share, attempts=1, exit_code=exit_code)
+
+    results = {}
+    retry_ids = []
+    for mod_id in mod_ids:
+        success, reason = item_results.get(mod_id, (False, "无结果"))
+        if success and install_downloaded_mod(mod_id, workshop, stdout, stderr, details.get(mod_id), mod_stats,
+                                              journal, manifest):
+            results[mod_id] = True
+        else:
+            if not success:
+                print(f"✗ 模组 {mod_id} 批量下载失败（{reason}），稍后单独重试")
+            retry_ids.append(mod_id)
+
+    # 仅对失败的模组逐个重试
+    for mod_id in retry_ids:
+        if cancel_event is not None and cancel_event.is_set():
+            results[mod_id] = False
+            continue
+        results[mod_id] = download_mod_steamcmd(mod_id, workshop, steamcmd_path, timeout, details.get(mod_id),
+                                                mod_stats, validate, journal, stall_timeout, manifest)
+
+    return results
+
+
+STEAM_API_DETAILS_URL = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
+# 返回 children（依赖物品）的接口，需要 Steam Web API 密钥
+STEAM_API_SERVICE_DETAILS_URL = "https://api.steampowered.com/IPublishedFileService/GetDetails/v1/"
+
+
+class TokenBucket:
+    """
+    令牌桶限流器（线程安全）
+
+    每秒补充 rate 个令牌，最多积累 capacity 个。每次请求消耗一个令牌，
+    令牌不足时阻塞等待。
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate: 每秒补充的令牌数，<= 0 表示不限流
+            capacity: 令牌桶容量（允许的突发请求数），默认与 rate 相同
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取一个令牌，必要时等待
+
+        Returns:
+            float: 等待的时间（秒）
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class SteamWebAPIClient:
+    """
+    Steam Web API 客户端
+
+    所有请求共用一个 requests.Session（挂载了连接池的 HTTPAdapter），
+    避免每次调用都重新建立 TLS 连接。遇到 429、5xx 或超时时按指数退避
+    加随机抖动重试，并通过令牌桶限制请求速率。检查和下载阶段共用同一个实例。
+    """
+
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout=30, connect_timeout=10, max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 rate_limit=5.0, burst=None, pool_size=10, details_url=STEAM_API_DETAILS_URL, key=None,
+                 service_details_url=STEAM_API_SERVICE_DETAILS_URL):
+        """
+        Args:
+            timeout: 读取超时时间（秒）
+            connect_timeout: 连接超时时间（秒）
+            max_retries: 失败后的最大重试次数
+            backoff_base: 第一次重试前的基础等待时间（秒），之后每次翻倍
+            backoff_max: 单次重试的最长等待时间（秒）
+            rate_limit: 每秒最多请求数，<= 0 表示不限流
+            burst: 允许的突发请求数，默认与 rate_limit 相同
+            pool_size: 连接池大小
+            details_url: GetPublishedFileDetails 接口地址（基准测试时指向本地模拟服务）
+            key: Steam Web API 密钥（可选，查询依赖时使用）
+            service_details_url: IPublishedFileService/GetDetails 接口地址
+        """
+        self.timeout = (connect_timeout, timeout)
+        self.details_url = details_url or STEAM_API_DETAILS_URL
+        self.key = key or None
+        self.service_details_url = service_details_url or STEAM_API_SERVICE_DETAILS_URL
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": "Mozilla/5.0"})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # 统计信息
+        self.request_count = 0
+        self.retry_count = 0
+        self.stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, api_config):
+        """
+        根据 config.json 中的 api 配置创建客户端
+
+        Args:
+            api_config: 配置中的 api 字典
+
+        Returns:
+            SteamWebAPIClient: 客户端实例
+        """
+        return cls(
+            timeout=api_config.get("timeout", 30),
+            connect_timeout=api_config.get("connect_timeout", 10),
+            max_retries=api_config.get("max_retries", 3),
+            backoff_base=api_config.get("backoff_base", 1.0),
+            backoff_max=api_config.get("backoff_max", 30.0),
+            rate_limit=api_config.get("rate_limit", 5.0),
+            burst=api_config.get("burst"),
+            pool_size=api_config.get("pool_size", 10),
+            details_url=api_config.get("details_url"),
+            key=api_config.get("key"),
+            service_details_url=api_config.get("service_details_url")
+        )
+
+    def _backoff_delay(self, attempt, response=None):
+        """
+        计算第 attempt 次重试前的等待时间
+
+        优先使用 429 响应中的 Retry-After，否则使用指数退避加随机抖动。
+
+        Args:
+            attempt: 重试次数（从 0 开始）
+            response: 触发重试的响应（可选）
+
+        Returns:
+            float: 等待时间（秒）
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(self.backoff_max, max(0.0, float(retry_after)))
+                except ValueError:
+                    pass
+
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def request(self, method, url, **kwargs):
+        """
+        发送请求，失败时自动重试
+
+        Args:
+            method: HTTP 方法
+            url: 请求地址
+            **kwargs: 传给 requests.Session.request 的其他参数
+
+        Returns:
+            requests.Response: 最终的响应（可能仍是失败状态码）
+
+        Raises:
+            requests.RequestException: 重试次数用尽后仍然出现连接错误或超时
+        """
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with self.stats_lock:
+                self.request_count += 1
+                if attempt:
+                    self.retry_count += 1
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"    请求失败: {self.redact(e)}，{delay:.1f} 秒后重试（{attempt + 1}/{self.max_retries}）")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response)
+                print(f"    请求失败: HTTP {response.status_code}，{delay:.1f} 秒后重试"
+                      f"（{attempt + 1}/{self.max_retries}）")
+                response.close()
+                time.sleep(delay)
+                continue
+
+            return response
+
+    def redact(self, message):
+        """
+        隐藏错误信息中的 API 密钥（连接错误的信息中包含请求地址和查询参数）
+
+        Args:
+            message: 错误信息或异常
+
+        Returns:
+            str: 隐藏密钥后的文本
+        """
+        message = str(message)
+        return message.replace(self.key, "***") if self.key else message
+
+    def post(self, url, data=None, **kwargs):
+        """
+        发送 POST 请求（带重试）
+
+        Args:
+            url: 请求地址
+            data: 表单数据
+            **kwargs: 传给 request 的其他参数
+
+        Returns:
+            requests.Response: 响应
+        """
+        return self.request("POST", url, data=data, **kwargs)
+
+    def get(self, url, **kwargs):
+        """
+        发送 GET 请求（带重试）
+
+        Args:
+            url: 请求地址
+            **kwargs: 传给 request 的其他参数
+
+        Returns:
+            requests.Response: 响应
+        """
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _chunked(items, size):
+    """
+    将列表按固定大小切分
+
+    Args:
+        items: 待切分的列表
+        size: 每块的最大长度
+
+    Returns:
+        generator: 依次产生每一块子列表
+    """
+    size = max(1, int(size))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _parse_published_file_details(moddetails):
+    """
+    将 GetPublishedFileDetails 返回的单个条目整理为统一格式
+
+    Args:
+        moddetails: API 返回的 publishedfiledetails 列表中的单个字典
+
+    Returns:
+        dict: 包含 result、time_updated、file_size、title、file_url、children 的字典
+    """
+    time_updated = moddetails.get('time_updated', moddetails.get('time_created', 0))
+    try:
+        time_updated = float(time_updated)
+    except (TypeError, ValueError):
+        time_updated = 0.0
+
+    try:
+        file_size = int(moddetails.get('file_size', 0))
+    except (TypeError, ValueError):
+        file_size = 0
+
+    # 依赖的创意工坊物品（children），部分接口版本不返回该字段
+    children = []
+    for child in moddetails.get('children', []) or []:
+        child_id = str(child.get('publishedfileid', '')) if isinstance(child, dict) else str(child)
+        if child_id and child_id not in children:
+            children.append(child_id)
+
+    return {
+        "result": int(moddetails.get('result', 0)),
+        "time_updated": time_updated,
+        "file_size": file_size,
+        "title": moddetails.get('title', ''),
+        # 部分物品提供可直接下载的压缩包地址（见 download_mod_http）
+        "file_url": moddetails.get('file_url', '') or '',
+        "children": children
+    }
+
+
+def get_workshop_details_batch(mod_ids, timeout=30, batch_size=100, api_url=None, client=None,
+                               include_children=False):
+    """
+    批量获取 Steam 创意工坊模组详情
+
+    每个请求通过 publishedfileids[N] 一次查询多个模组，模组数量超过
+    batch_size 时自动拆分为多个请求。GetPublishedFileDetails 不返回
+    children（依赖物品）；include_children 为 True 且客户端配置了 API 密钥时
+    改用 IPublishedFileService/GetDetails（GET 请求，includechildren=true）。
+
+    Args:
+        mod_ids: 模组ID列表
+        timeout: 单个请求的超时时间（秒），仅在未传入 client 时使用
+        batch_size: 每个请求最多包含的模组数量
+        api_url: GetPublishedFileDetails 接口地址（默认使用 client.details_url）
+        client: SteamWebAPIClient 实例（可选，未传入时临时创建一个）
+        include_children: 是否查询依赖物品（需要 client.key）
+
+    Returns:
+        dict: {mod_id: 详情字典} 的字典，获取失败的模组不会出现在结果中
+    """
+    details = {}
+    # 去重并保持顺序
+    unique_ids = list(dict.fromkeys(str(mod_id) for mod_id in mod_ids))
+    if not unique_ids:
+        return details
+
+    own_client = client is None
+    if own_client:
+        client = SteamWebAPIClient(timeout=timeout)
+    use_service = bool(include_children and client.key)
+    api_url = client.service_details_url if use_service else api_url or client.details_url
+
+    for chunk in _chunked(unique_ids, batch_size):
+        data = {"itemcount": str(len(chunk))}
+        for index, mod_id in enumerate(chunk):
+            data[f"publishedfileids[{index}]"] = mod_id
+
+        try:
+            if use_service:
+                # IPublishedFileService 只接受查询参数，不接受 itemcount
+                data.pop("itemcount")
+                data.update({"key": client.key, "includechildren": "true"})
+                result = client.get(api_url, params=data)
+            else:
+                result = client.post(api_url, data=data)
+            if result.status_code != 200:
+                print(f"    批量获取模组信息失败: HTTP {result.status_code}（{len(chunk)} 个模组）")
+                continue
+
+            response = result.json().get('response', {})
+            for moddetails in response.get('publishedfiledetails', []):
+                mod_id = str(moddetails.get('publishedfileid', ''))
+                if mod_id:
+                    details[mod_id] = _parse_published_file_details(moddetails)
+        except Exception as e:
+            print(f"    批量获取模组信息失败（{len(chunk)} 个模组）: {client.redact(e)}")
+
+    if own_client:
+        client.close()
+
+    return details
+
+
+def resolve_mod_dependencies(mod_ids, client=None, batch_size=100, details=None):
+    """
+    根据创意工坊的 children（依赖物品）信息解析完整的依赖闭包
+
+    children 只有 IPublishedFileService/GetDetails 返回，需要 client 配置了
+    API 密钥（见 get_workshop_details_batch 的 include_children）。
+
+    按层广度优先遍历依赖图，每一层未知的模组只发送一次批量 API 请求
+    （超过 batch_size 时按块拆分），而不是每个节点一次请求。遍历完成后
+    按“依赖在前”的顺序排序，发现循环依赖时记录下来并断开。
+
+    Args:
+        mod_ids: config_player.xml 中启用的模组ID列表（保持用户的加载顺序）
+        client: SteamWebAPIClient 实例（可选）
+        batch_size: 每个 API 请求最多包含的模组数量
+        details: 已获取的模组详情字典（可选，已有的模组不再重复查询）
+
+    Returns:
+        dict: 依赖图，包含
+            roots: 配置中启用的模组ID列表
+            order: 依赖在前的完整模组ID列表
+            details: 全部模组的详情字典（每个模组附带 dependency_level）
+            nodes: {mod_id: {"title", "children", "required_by", "level"}}
+            cycles: 检测到的循环依赖列表
+            missing: 依赖中未在配置里启用的模组ID列表
+    """
+    roots = list(dict.fromkeys(str(mod_id) for mod_id in mod_ids))
+    details = dict(details or {})
+
+    # 逐层获取详情
+    seen = set(roots)
+    frontier = roots
+    while frontier:
+        unknown = [mod_id for mod_id in frontier if mod_id not in details]
+        if unknown:
+            details.update(get_workshop_details_batch(unknown, batch_size=batch_size, client=client,
+                                                      include_children=True))
+
+        next_level = []
+        for mod_id in frontier:
+            for child_id in (details.get(mod_id) or {}).get("children", []):
+                if child_id not in seen:
+                    seen.add(child_id)
+                    next_level.append(child_id)
+        frontier = next_level
+
+    graph = {mod_id: [child for child in (details.get(mod_id) or {}).get("children", []) if child in seen]
+             for mod_id in seen}
+
+    # 深度优先拓扑排序（依赖在前），同时检测循环依赖
+    order = []
+    levels = {}
+    cycles = []
+    state = {}  # 1 = 访问中, 2 = 已完成
+    stack = []
+
+    def visit(mod_id):
+        if state.get(mod_id) == 2:
+            return levels[mod_id]
+        if state.get(mod_id) == 1:
+            cycles.append(stack[stack.index(mod_id):] + [mod_id])
+            return 0
+        state[mod_id] = 1
+        stack.append(mod_id)
+        level = 0
+        for child_id in graph.get(mod_id, []):
+            level = max(level, visit(child_id) + 1)
+        stack.pop()
+        state[mod_id] = 2
+        levels[mod_id] = level
+        order.append(mod_id)
+        return level
+
+    for mod_id in roots:
+        visit(mod_id)
+
+    nodes = {}
+    for mod_id in order:
+        moddetails = details.get(mod_id)
+        if moddetails is not None:
+            moddetails["dependency_level"] = levels[mod_id]
+        nodes[mod_id] = {
+            "title": (moddetails or {}).get("title", ""),
+            "children": graph.get(mod_id, []),
+            "required_by": [parent for parent in order if mod_id in graph.get(parent, [])],
+            "level": levels[mod_id]
+        }
+
+    root_set = set(roots)
+    return {
+        "roots": roots,
+        "order": order,
+        "details": details,
+        "nodes": nodes,
+        "cycles": cycles,
+        "missing": [mod_id for mod_id in order if mod_id not in root_set]
+    }
+
+
+def print_dependency_graph(graph):
+    """
+    显示依赖解析结果
+
+    Args:
+        graph: resolve_mod_dependencies 返回的依赖图
+    """
+    nodes = graph["nodes"]
+    dependent_count = sum(1 for mod_id in graph["roots"] if nodes.get(mod_id, {}).get("children"))
+    print(f"依赖解析完成: {len(graph['roots'])} 个已启用模组，其中 {dependent_count} 个有依赖，"
+          f"共 {len(graph['order'])} 个模组")
+
+    for mod_id in graph["missing"]:
+        node = nodes[mod_id]
+        title = f"（{node['title']}）" if node["title"] else ""
+        print(f"  依赖模组 {mod_id}{title} 未在配置中启用，被 {', '.join(node['required_by'])} 依赖")
+
+    for cycle in graph["cycles"]:
+        print(f"  ⚠️ 检测到循环依赖: {' → '.join(cycle)}")
+
+
+def export_dependency_graph(graph, output_path):
+    """
+    将依赖图导出为 JSON 文件
+
+    Args:
+        graph: resolve_mod_dependencies 返回的依赖图
+        output_path: 输出文件路径
+    """
+    data = {key: graph[key] for key in ("roots", "order", "nodes", "cycles", "missing")}
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"依赖图已导出到: {output_path}")
+
+
+CONCURRENCY_STATE_FILENAME = ".concurrency.json"
+
+
+class ConcurrencyController:
+    """
+    自适应调整 SteamCMD 并发会话数（AIMD）
+
+    从较低的并发数开始，每完成一轮（当前并发数个任务）统计总吞吐量：
+    没有拥塞且吞吐量没有明显下降时并发数加一；出现拥塞（由调用方判断，
+    例如被限流或超时）时并发数减半（同一次拥塞中已在运行的任务再失败
+    不会重复减半），并把上限设为出错级别的下一级；加一后吞吐量反而
+    下降时同样退回上一级。在上限处连续几轮没有拥塞后才会再次试探更高
+    的并发数。
+    """
+
+    def __init__(self, min_workers=1, max_workers=8, initial=None, decrease_factor=0.5, tolerance=0.1,
+                 probe_windows=3):
+        """
+        初始化控制器
+
+        Args:
+            min_workers: 并发数下限
+            max_workers: 并发数上限
+            initial: 初始并发数（默认为下限，通常为上次运行选择的并发数）
+            decrease_factor: 失败时并发数乘以的系数
+            tolerance: 判断吞吐量下降的相对幅度
+            probe_windows: 在上限处连续多少轮没有失败后再次尝试提高上限
+        """
+        self.min_workers = max(1, int(min_workers))
+        self.max_workers = max(self.min_workers, int(max_workers))
+        self.limit = min(max(int(initial or self.min_workers), self.min_workers), self.max_workers)
+        self.decrease_factor = decrease_factor
+        self.tolerance = tolerance
+        self.generation = 0
+        # 沿用上次选择的并发数时，先在该级别运行几轮再试探更高的并发数
+        self.ceiling = self.limit if initial else self.max_workers
+        self.probe_windows = probe_windows
+        self.clean_windows = 0
+        self.last_change = None
+        self.previous_throughput = None
+        self.throughput = None
+        self.history = [self.limit]
+        self._reset_window()
+
+    def _reset_window(self):
+        """开始新一轮统计"""
+        self.window_jobs = 0
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+
+    def _set_limit(self, limit, reason):
+        """
+        修改并发数并输出日志
+
+        Args:
+            limit: 新的并发数
+            reason: 调整原因
+        """
+        old_limit = self.limit
+        self.limit = limit
+        self.history.append(limit)
+        print(f"  并发数调整: {old_limit} → {limit}（{reason}）")
+
+    @property
+    def chosen_level(self):
+        """
+        本次运行得出的并发数：达到过的最高级别，但不超过已知不会出错的上限
+
+        Returns:
+            int: 并发数
+        """
+        return min(self.ceiling, max(self.history))
+
+    def record(self, success, bytes_downloaded, generation):
+        """
+        记录一个任务的结果并按需调整并发数
+
+        Args:
+            success: 任务是否没有遇到拥塞（与并发数无关的失败也视为 True）
+            bytes_downloaded: 任务下载的数据量（字节）
+            generation: 任务开始时的 self.generation
+
+        Returns:
+            bool: 并发数是否发生变化
+        """
+        old_limit = self.limit
+
+        if not success:
+            # 只对最近一次减半之后开始的任务做出反应
+            if generation == self.generation:
+                self.generation += 1
+                self.last_change = "decrease"
+                self.previous_throughput = None
+                self.ceiling = max(self.min_workers, self.limit - 1)
+                self.clean_windows = 0
+                new_limit = max(self.min_workers, int(self.limit * self.decrease_factor))
+                if new_limit != self.limit:
+                    self._set_limit(new_limit, "下载被限流或超时")
+                self._reset_window()
+            return self.limit != old_limit
+
+        self.window_jobs += 1
+        self.window_bytes += bytes_downloaded
+        if self.window_jobs < self.limit:
+            return False
+
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        self.throughput = self.window_bytes / elapsed
+        rate = f"{format_bytes(self.throughput)}/s"
+        if (self.last_change == "increase" and self.previous_throughput
+                and self.throughput < self.previous_throughput * (1 - self.tolerance)):
+            # 增加并发后吞吐量下降：退回上一级并不再超过该级别
+            self.ceiling = max(self.min_workers, self.limit - 1)
+            self.last_change = "decrease"
+            self._set_limit(self.ceiling, f"吞吐量下降到 {rate}")
+        elif self.limit > self.ceiling:
+            # 试探的级别完整运行了一轮且没有失败，提高上限
+            self.ceiling = self.limit
+            self.last_change = None
+        elif self.limit < self.ceiling:
+            self.last_change = "increase"
+            self._set_limit(self.limit + 1, f"吞吐量 {rate}")
+        else:
+            self.last_change = None
+            # 在上限处连续几轮没有失败时，重新试探更高的并发数
+            self.clean_windows += 1
+            if self.clean_windows >= self.probe_windows and self.limit < self.max_workers:
+                self.clean_windows = 0
+                self.last_change = "increase"
+                self._set_limit(self.limit + 1, f"试探，吞吐量 {rate}")
+
+        self.previous_throughput = self.throughput
+        self._reset_window()
+        return self.limit != old_limit
+
+
+PLAN_EXIT_UPDATES_PENDING = 10
+
+
+def build_update_plan(update_list, workshop_path, config, details, unchecked=()):
+    """
+    估算下载需要更新的模组所需的数据量和时间，不启动 SteamCMD
+
+    耗时按配置的并发数（自适应模式下为上次运行选择的并发数）模拟
+    plan_download_jobs 生成的任务队列：每个任务交给最先空闲的进程，
+    任务耗时由上次运行测得的吞吐量和会话固定开销估算（没有记录时
+    使用默认吞吐量）。
+
+    Args:
+        update_list: 需要更新的模组ID列表
+        workshop_path: 创意工坊内容路径
+        config: 配置字典
+        details: 模组详情字典
+        unchecked: 无法获取更新信息、未能检查的模组ID列表
+
+    Returns:
+        dict: 更新计划，包含每个模组的大小、总字节数、预计耗时和未能检查的模组
+    """
+    download_config = config["download"]
+    state = load_throughput_state(workshop_path)
+    estimator = ThroughputEstimator(download_config["default_throughput_kbps"] * 1024,
+                                    initial=state.get("throughput"), overhead=state.get("overhead"))
+
+    workers = download_config["max_workers"]
+    if download_config["adaptive"]:
+        workers = load_concurrency_state(workshop_path) or download_config["min_workers"]
+    workers = max(1, min(workers, len(update_list) or 1))
+
+    mods = []
+    for mod_id in update_list:
+        moddetails = details.get(mod_id) or {}
+        mods.append({
+            "mod_id": mod_id,
+            "title": moddetails.get("title", ""),
+            "file_size": moddetails.get("file_size", 0),
+            "time_updated": moddetails.get("time_updated", 0.0)
+        })
+    sizes = {mod["mod_id"]: mod["file_size"] for mod in mods}
+
+    # 列表调度：按队列顺序把任务分给最先空闲的 SteamCMD 进程
+    busy_until = [0.0] * workers
+    for job in plan_download_jobs(update_list, details, workers, download_config["batch_mode"]):
+        index = busy_until.index(min(busy_until))
+        busy_until[index] += estimator.estimate_seconds([sizes[mod_id] for mod_id in job])
+
+    return {
+        "mods": mods,
+        "mods_count": len(mods),
+        "total_bytes": sum(sizes.values()),
+        "unknown_size": sum(1 for size in sizes.values() if not size),
+        "workers": workers,
+        "throughput": estimator.throughput or estimator.default_throughput,
+        "throughput_measured": estimator.throughput is not None,
+        "overhead": estimator.overhead if estimator.overhead is not None else estimator.DEFAULT_OVERHEAD,
+        "estimated_seconds": max(busy_until) if update_list else 0.0,
+        "unchecked": list(unchecked)
+    }
+
+
+def print_update_plan(plan, deadline=0):
+    """
+    输出更新计划
+
+    Args:
+        plan: build_update_plan 返回的更新计划
+        deadline: 配置的全局下载截止时间（秒，0 表示不限制）
+    """
+    print("=== 更新计划 ===")
+    for mod in plan["mods"]:
+        size = format_bytes(mod["file_size"]) if mod["file_size"] else "大小未知"
+        title = f" {mod['title']}" if mod["title"] else ""
+        print(f"  模组 {mod['mod_id']}{title}: {size}")
+
+    print(f"\n共 {plan['mods_count']} 个模组，需下载 {format_bytes(plan['total_bytes'])}")
+    if plan["unknown_size"]:
+        print(f"  其中 {plan['unknown_size']} 个模组的大小未知，未计入总量")
+    source = "上次运行测得" if plan["throughput_measured"] else "默认值"
+    print(f"预计耗时: {plan['estimated_seconds'] / 60:.1f} 分钟"
+          f"（{plan['workers']} 个 SteamCMD 进程，吞吐量 {format_bytes(plan['throughput'])}/s（{source}），"
+          f"每个会话固定开销约 {plan['overhead']:.0f} 秒）")
+    if deadline and plan["estimated_seconds"] > deadline:
+        print(f"⚠ 预计耗时超过全局截止时间 {deadline} 秒，部分模组可能无法在本次运行中完成")
+    if plan["unchecked"]:
+        print(f"✗ {len(plan['unchecked'])} 个模组无法获取更新信息，计划不完整: {', '.join(plan['unchecked'])}")
+
+
+def load_concurrency_state(workshop_path):
+    """
+    读取上次运行自适应选择的并发数
+
+    Args:
+        workshop_path: 创意工坊内容路径
+
+    Returns:
+        int: 并发数，没有记录时返回 None
+    """
+    state_path = Path(workshop_path) / CONCURRENCY_STATE_FILENAME
+    if not state_path.exists():
+        return None
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return int(json.load(f)["max_workers"])
+    except Exception as e:
+        print(f"读取并发数记录失败: {e}")
+        return None
+
+
+def save_concurrency_state(workshop_path, controller):
+    """
+    原子写入自适应选择的并发数，作为下次运行的起点
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        controller: ConcurrencyController 实例
+    """
+    atomic_write_json(Path(workshop_path) / CONCURRENCY_STATE_FILENAME, {
+        "max_workers": controller.chosen_level,
+        "throughput": controller.throughput,
+        "history": controller.history,
+        "updated_at": time.time()
+    })
+
+
+THROUGHPUT_STATE_FILENAME = ".throughput.json"
+
+
+class ThroughputEstimator:
+    """
+    估算单个 SteamCMD 下载的吞吐量，并据此计算每个模组的截止时间
+
+    吞吐量取已完成下载（模组大小 / SteamCMD 耗时）的指数加权平均，初始值为
+    上次运行保存的测量值；没有任何测量时使用配置的默认吞吐量。小模组的
+    SteamCMD 耗时主要是登录等固定开销，单独记录为 overhead，供 --plan 估算耗时。
+    """
+
+    # 小于该大小的模组主要耗时在登录上，不参与吞吐量统计
+    MIN_SAMPLE_BYTES = 1024 * 1024
+
+    # 没有测量值时假定的每个 SteamCMD 会话固定开销（秒）
+    DEFAULT_OVERHEAD = 10.0
+
+    def __init__(self, default_throughput, timeout_factor=3.0, initial=None, smoothing=0.3, overhead=None):
+        """
+        初始化估算器
+
+        Args:
+            default_throughput: 没有测量值时假定的吞吐量（字节/秒）
+            timeout_factor: 截止时间为预计下载时间的倍数
+            initial: 上次运行测得的吞吐量（字节/秒，可选）
+            smoothing: 新测量值的权重
+            overhead: 上次运行测得的会话固定开销（秒，可选）
+        """
+        self.default_throughput = default_throughput
+        self.timeout_factor = timeout_factor
+        self.throughput = initial
+        self.overhead = overhead
+        self.smoothing = smoothing
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, size, seconds):
+        """
+        记录一次下载的大小和耗时
+
+        Args:
+            size: 模组大小（字节）
+            seconds: SteamCMD 耗时（秒）
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            if size < self.MIN_SAMPLE_BYTES:
+                if self.overhead is None:
+                    self.overhead = seconds
+                else:
+                    self.overhead = (1 - self.smoothing) * self.overhead + self.smoothing * seconds
+                return
+            sample = size / seconds
+            if self.throughput is None:
+                self.throughput = sample
+            else:
+                self.throughput = (1 - self.smoothing) * self.throughput + self.smoothing * sample
+            self.samples += 1
+
+    def item_timeout(self, file_size, base_timeout):
+        """
+        根据模组大小计算截止时间
+
+        Args:
+            file_size: 模组大小（字节，未知时为 0）
+            base_timeout: 最短截止时间（秒），也用于大小未知的模组
+
+        Returns:
+            float: 截止时间（秒）
+        """
+        throughput = self.throughput or self.default_throughput
+        if not file_size or not throughput:
+            return base_timeout
+        return max(base_timeout, self.timeout_factor * file_size / throughput)
+
+    def estimate_seconds(self, file_sizes):
+        """
+        估算在一个 SteamCMD 会话中下载若干模组的耗时
+
+        Args:
+            file_sizes: 模组大小列表（字节）
+
+        Returns:
+            float: 预计耗时（秒）
+        """
+        throughput = self.throughput or self.default_throughput
+        overhead = self.overhead if self.overhead is not None else self.DEFAULT_OVERHEAD
+        transfer = sum(file_sizes) / throughput if throughput else 0.0
+        if len(file_sizes) == 1:
+            # 测得的吞吐量已包含登录时间
+            return max(overhead, transfer)
+        return overhead + transfer
+
+
+def load_throughput_state(workshop_path):
+    """
+    读取上次运行测得的下载吞吐量
+
+    Args:
+        workshop_path: 创意工坊内容路径
+
+    Returns:
+        dict: 包含 throughput（字节/秒）和 overhead（秒）的字典，没有记录时返回空字典
+    """
+    state_path = Path(workshop_path) / THROUGHPUT_STATE_FILENAME
+    if not state_path.exists():
+        return {}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"读取吞吐量记录失败: {e}")
+        return {}
+
+
+def save_throughput_state(workshop_path, estimator):
+    """
+    原子写入测得的下载吞吐量
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        estimator: ThroughputEstimator 实例
+    """
+    atomic_write_json(Path(workshop_path) / THROUGHPUT_STATE_FILENAME, {
+        "throughput": estimator.throughput,
+        "overhead": estimator.overhead,
+        "samples": estimator.samples,
+        "updated_at": time.time()
+    })
+
+
+def plan_download_jobs(mod_ids, details=None, max_workers=3, batch_mode=False):
+    """
+    生成下载任务列表，依赖在前，同一依赖层级内按 file_size 从大到小排列
+
+    被依赖的模组（详情中的 dependency_level 较小）先下载；同一层级中
+    大模组排在队列前面，避免耗时最长的下载落在最后拖慢整体进度。
+    批量模式下把模组分为 max_workers 个批次，每次分配给当前总大小
+    最小的批次，使各个 SteamCMD 会话的下载量接近。
+
+    Args:
+        mod_ids: 模组ID列表
+        details: get_workshop_details_batch 返回的模组详情字典（可选）
+        max_workers: 最大并发数
+        batch_mode: 是否使用批量 SteamCMD 会话
+
+    Returns:
+        list: 任务列表，每个任务是一个模组ID列表
+    """
+    details = details or {}
+    sizes = {mod_id: (details.get(mod_id) or {}).get("file_size", 0) for mod_id in mod_ids}
+    levels = {mod_id: (details.get(mod_id) or {}).get("dependency_level", 0) for mod_id in mod_ids}
+    ordered = sorted(mod_ids, key=lambda mod_id: (levels[mod_id], -sizes[mod_id]))
+
+    if not batch_mode:
+        return [[mod_id] for mod_id in ordered]
+
+    batch_count = max(1, min(max_workers, len(ordered)))
+    batches = [[] for _ in range(batch_count)]
+    totals = [0] * batch_count
+    for mod_id in ordered:
+        index = totals.index(min(totals))
+        batches[index].append(mod_id)
+        totals[index] += max(sizes[mod_id], 1)
+    return [batch for batch in batches if batch]
+
+
+def _make_download_result(success, status, elapsed, stats=None):
+    """
+    生成调度器产出的单个模组结果字典
+
+    Args:
+        success: 是否成功
+        status: 状态（success、failed、stalled、too_slow、cancelled、deadline）
+        elapsed: 任务耗时（秒）
+        stats: 下载过程中记录的统计信息（可选）
+
+    Returns:
+        dict: 结果字典
+    """
+    stats = stats or {}
+    return {
+        "success": success,
+        "status": status,
+        "elapsed": elapsed,
+        "bytes_written": stats.get("bytes_written", 0),
+        "bytes_skipped": stats.get("bytes_skipped", 0),
+        "steamcmd_seconds": stats.get("steamcmd_seconds", 0.0),
+        "http_seconds": stats.get("http_seconds", 0.0),
+        "validate_seconds": stats.get("validate_seconds", 0.0),
+        "move_seconds": stats.get("move_seconds", 0.0),
+        "attempts": stats.get("attempts", 0),
+        "exit_code": stats.get("exit_code"),
+        "error": stats.get("error", ""),
+        "source": stats.get("source", "steamcmd")
+    }
+
+
+def is_congestion_failure(result):
+    """
+    判断失败的下载是否像是并发过高造成的
+
+    停滞、超过截止时间，以及 SteamCMD 报告被限流、超时或登录失败时
+    认为是拥塞；其他失败（物品不存在、文件校验失败等）降低并发也无济于事。
+
+    Args:
+        result: 调度器产出的结果字典
+
+    Returns:
+        bool: 是否为拥塞类失败
+    """
+    if result["success"]:
+        return False
+    return (result["status"] in ("stalled", "too_slow")
+            or bool(STEAMCMD_CONGESTION_PATTERN.search(result.get("error") or "")))
+
+
+def _merge_download_results(earlier, later):
+    """
+    合并重新排队前后同一个模组的结果，次数和耗时累加，状态取后一次
+
+    Args:
+        earlier: 重新排队前的结果字典
+        later: 最终的结果字典
+
+    Returns:
+        dict: 合并后的结果字典
+    """
+    merged = dict(later)
+    for key in ("elapsed", "steamcmd_seconds", "http_seconds", "validate_seconds", "move_seconds", "attempts"):
+        merged[key] = earlier.get(key, 0) + later.get(key, 0)
+    return merged
+
+
+def _run_download_job(job, workshop_path, steamcmd_path, timeout, details, cancel_event, validate=True,
+                      journal=None, estimator=None, stall_timeout=None, http_client=None, manifest=None):
+    """
+    执行单个下载任务（一个模组或一个批次）
+
+    传入 http_client 时，详情中带有 file_url 的模组先直接下载，
+    没有地址或直接下载失败的模组再交给 SteamCMD。
+
+    Args:
+        job: 模组ID列表
+        workshop_path: 创意工坊内容路径
+        steamcmd_path: SteamCMD 路径
+        timeout: 单个模组的下载超时时间（秒）
+        details: 模组详情字典
+        cancel_event: 取消事件
+        validate: 是否让 SteamCMD 校验下载的文件
+        journal: RunJournal 实例（可选），记录模组状态
+        estimator: ThroughputEstimator 实例（可选），按模组大小计算截止时间并记录吞吐量
+        stall_timeout: 没有下载进展多少秒后终止 SteamCMD（None 或 0 表示不检测）
+        http_client: SteamWebAPIClient 实例（可选），用于直接下载 file_url
+        manifest: ManifestWriter 实例（可选），批量写入清单条目
+
+    Returns:
+        dict: {mod_id: 结果字典} 的字典，下载被看门狗终止时 status 为 stalled 或 too_slow，
+              取消后未开始的模组 status 为 cancelled
+    """
+    start = time.monotonic()
+    mod_stats = {}
+    job_results = {}
+    steamcmd_job = list(job)
+    cancelled = []
+    # 每个模组的截止时间（直接下载和 SteamCMD 共用）
+    item_timeouts = {mod_id: estimator.item_timeout((details.get(mod_id) or {}).get("file_size", 0), timeout)
+                     if estimator is not None else timeout for mod_id in job}
+    try:
+        if http_client is not None:
+            for mod_id in job:
+                moddetails = details.get(mod_id) or {}
+                if not moddetails.get("file_url") or cancel_event.is_set():
+                    continue
+                if download_mod_http(mod_id, workshop_path, moddetails, http_client, item_timeouts[mod_id],
+                                     mod_stats, journal, cancel_event, manifest=manifest):
+                    job_results[mod_id] = True
+                    steamcmd_job.remove(mod_id)
+                elif not cancel_event.is_set():
+                    print(f"  模组 {mod_id}: 直接下载失败，改用 SteamCMD")
+
+        if cancel_event.is_set():
+            # 取消后（可能已经终止过正在运行的 SteamCMD）不再启动新的会话
+            cancelled, steamcmd_job = steamcmd_job, []
+        elif steamcmd_job:
+            # 批量会话的截止时间按模组数量累加，这里传入平均值
+            timeout = sum(item_timeouts[mod_id] for mod_id in steamcmd_job) / len(steamcmd_job)
+        if len(steamcmd_job) == 1:
+            mod_id = steamcmd_job[0]
+            job_results[mod_id] = download_mod_steamcmd(mod_id, workshop_path, steamcmd_path, timeout,
+                                                        details.get(mod_id), mod_stats, validate, journal,
+                                                        stall_timeout, manifest)
+        elif steamcmd_job:
+            job_results.update(download_mods_steamcmd_batch(steamcmd_job, workshop_path, steamcmd_path, timeout,
+                                                            details, cancel_event, mod_stats, validate, journal,
+                                                            stall_timeout, manifest))
+    except Exception as e:
+        print(f"✗ 下载任务 {', '.join(job)} 出错: {e}")
+
+    elapsed = time.monotonic() - start
+    results = {}
+    for mod_id in job:
+        success = job_results.get(mod_id, False)
+        stats = mod_stats.get(mod_id) or {}
+        if success:
+            status = "success"
+            if estimator is not None:
+                estimator.record(stats.get("bytes_written", 0) + stats.get("bytes_skipped", 0),
+                                 stats.get("steamcmd_seconds", 0.0))
+        elif mod_id in cancelled:
+            status = "cancelled"
+        else:
+            status = stats.get("timeout_reason") or "failed"
+        results[mod_id] = _make_download_result(success, status, elapsed, stats)
+    return results
+
+
+def iter_download_results(mod_ids, workshop_path, steamcmd_path="steamcmd", timeout=300, max_workers=3,
+                          details=None, batch_mode=False, deadline=None, cancel_event=None, controller=None,
+                          validate=True, journal=None, estimator=None, stall_timeout=None, http_client=None,
+                          manifest=None):
+    """
+    使用线程池调度 SteamCMD 下载，每完成一个模组就立即产出结果
+
+    下载本身由 SteamCMD 子进程完成，线程只负责等待，不需要为每个任务
+    启动新的 Python 解释器。设置 cancel_event 或超过全局截止时间后，
+    尚未开始的任务不再执行，正在运行的 SteamCMD 进程会被终止。
+
+    传入 controller 时，同时运行的任务数由控制器的 limit 决定（最多
+    controller.max_workers 个），失败的任务会重新排队一次。只有拥塞类失败
+    （见 is_congestion_failure）会降低并发数，重新排队后成功的任务按普通的
+    成功记录（拥塞已在第一次失败时计入）。
+    因停滞（stalled）被终止的任务同样会重新排队一次。
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 创意工坊内容路径
+        steamcmd_path: SteamCMD 路径
+        timeout: 单个模组的下载超时时间（秒）
+        max_workers: 最大并发数
+        details: get_workshop_details_batch 返回的模组详情字典（可选，用于排序和写入清单）
+        batch_mode: 是否使用批量 SteamCMD 会话
+        deadline: 全部下载的截止时间（从开始计的秒数，None 或 0 表示不限制）
+        cancel_event: threading.Event，设置后取消剩余下载（可选）
+        controller: ConcurrencyController 实例（可选，自适应并发）
+        validate: 是否让 SteamCMD 校验下载的文件
+        journal: RunJournal 实例（可选），记录模组状态
+        estimator: ThroughputEstimator 实例（可选），按模组大小计算截止时间
+        stall_timeout: 没有下载进展多少秒后终止 SteamCMD（None 或 0 表示不检测）
+        http_client: SteamWebAPIClient 实例（可选），带有 file_url 的模组先直接下载
+        manifest: ManifestWriter 实例（可选），批量写入清单条目
+
+    Yields:
+        tuple: (mod_id, 结果字典)，结果字典包含 success、status、elapsed、
+              bytes_written、bytes_skipped、steamcmd_seconds、http_seconds、validate_seconds、move_seconds、
+              attempts、exit_code、source
+    """
+    details = details or {}
+    if controller is not None:
+        max_workers = controller.max_workers
+        jobs = plan_download_jobs(mod_ids, details, controller.limit, batch_mode)
+    else:
+        jobs = plan_download_jobs(mod_ids, details, max_workers, batch_mode)
+    pending = set(mod_ids)
+    if not jobs:
+        return
+
+    end_time = time.monotonic() + deadline if deadline else None
+    results_queue = queue.Queue()
+    stop_event = threading.Event()
+    waiting = list(jobs)
+    retried = set()
+    requeued = {}
+    in_flight = 0
+
+    def worker(job, generation):
+        if stop_event.is_set():
+            results_queue.put((job, generation, {}))
+            return
+        results_queue.put((job, generation,
+                           _run_download_job(job, workshop_path, steamcmd_path, timeout, details, stop_event,
+                                             validate, journal, estimator, stall_timeout, http_client, manifest)))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs))))
+    stop_status = None
+    try:
+        while pending:
+            limit = controller.limit if controller is not None else max_workers
+            while waiting and in_flight < limit:
+                executor.submit(worker, waiting.pop(0), controller.generation if controller is not None else 0)
+                in_flight += 1
+
+            if cancel_event is not None and cancel_event.is_set():
+                stop_status = "cancelled"
+                break
+            if end_time is not None and time.monotonic() >= end_time:
+                stop_status = "deadline"
+                break
+            try:
+                job, generation, job_results = results_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            in_flight -= 1
+
+            if controller is not None and job_results:
+                # 与并发数无关的失败不降低并发
+                controller.record(not any(is_congestion_failure(result) for result in job_results.values()),
+                                  sum(result["bytes_written"] + result["bytes_skipped"]
+                                      for result in job_results.values()),
+                                  generation)
+
+            # 停滞的下载（以及自适应并发下失败的下载，多半是被限流）重新排队一次
+            retry = [mod_id for mod_id, result in job_results.items()
+                     if not result["success"] and (controller is not None or result["status"] == "stalled")]
+            if retry and tuple(job) not in retried:
+                retried.add(tuple(job))
+                retried.add(tuple(retry))
+                waiting.append(retry)
+                print(f"  重新排队: {', '.join(retry)}")
+                for mod_id in retry:
+                    requeued[mod_id] = job_results.pop(mod_id)
+
+            for mod_id, result in job_results.items():
+                if mod_id in pending:
+                    pending.discard(mod_id)
+                    if mod_id in requeued:
+                        result = _merge_download_results(requeued.pop(mod_id), result)
+                    yield mod_id, result
+    finally:
+        if pending:
+            # 提前结束（取消、超过截止时间或调用方中断）：停止剩余任务
+            stop_event.set()
+            terminate_active_steamcmd()
+        executor.shutdown(wait=True)
+
+    if stop_status == "cancelled":
+        print(f"下载已取消，{len(pending)} 个模组未完成")
+    elif stop_status == "deadline":
+        print(f"已超过全局截止时间 {deadline} 秒，{len(pending)} 个模组未完成")
+
+    for mod_id in mod_ids:
+        if mod_id in pending:
+            pending.discard(mod_id)
+            result = _make_download_result(False, stop_status, 0.0)
+            if mod_id in requeued:
+                result = _merge_download_results(requeued.pop(mod_id), result)
+            yield mod_id, result
+
+
+def download_mods_parallel(mod_ids, workshop_path, steamcmd_path="steamcmd", timeout=300, max_workers=3,
+                           details=None, batch_mode=False, deadline=None, cancel_event=None, api_client=None,
+                           adaptive=False, min_workers=1, validate=True, journal=None, stall_timeout=None,
+                           timeout_factor=None, default_throughput=None, direct_download=False):
+    """
+    并行下载多个模组
+
+    由 iter_download_results 调度，大模组优先下载。下载成功的模组会
+    写入本地清单（LocalMods/.mod_manifest.json）。启用批量模式时，
+    模组列表被拆分为 max_workers 份，每份用一个 SteamCMD 会话下载。
+    启用自适应并发时，并发数在 min_workers 和 max_workers 之间自动调整，
+    最终选择的并发数保存到 LocalMods/.concurrency.json 作为下次运行的起点。
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 创意工坊内容路径
+        steamcmd_path: SteamCMD 路径
+        timeout: 下载超时时间（秒）
+        max_workers: 最大并发数（建议 3-5）
+        details: get_workshop_details_batch 返回的模组详情字典（可选）
+        batch_mode: 是否使用批量 SteamCMD 会话
+        deadline: 全部下载的截止时间（秒，None 或 0 表示不限制）
+        cancel_event: threading.Event，设置后取消剩余下载（可选）
+        api_client: SteamWebAPIClient 实例（可选），未传入 details 时用于查询模组详情
+        adaptive: 是否自适应调整并发数
+        min_workers: 自适应并发的下限
+        validate: 是否让 SteamCMD 校验下载的文件（关闭时只做本地检查）
+        journal: RunJournal 实例（可选），记录每个模组的状态，供 --resume 使用
+        stall_timeout: 没有下载进展多少秒后终止并重新排队（None 或 0 表示不检测）
+        timeout_factor: 设置时按 file_size 和测得的吞吐量计算每个模组的截止时间
+                        （预计下载时间的倍数，不短于 timeout），测得的吞吐量保存到
+                        LocalMods/.throughput.json
+        default_throughput: 没有测量值时假定的吞吐量（字节/秒）
+        direct_download: 详情中带有 file_url 的模组是否先直接通过 HTTP 下载（失败时改用 SteamCMD）
+
+    Returns:
+        dict: {mod_id: 结果字典} 的字典，结果字典包含 success、status、elapsed、
+              bytes_written、bytes_skipped、steamcmd_seconds、http_seconds、validate_seconds、move_seconds、
+              attempts、exit_code、source
+    """
+    if not mod_ids:
+        return {}
+
+    if details is None and api_client is not None:
+        # 获取 file_size 用于排序，time_updated 用于写入清单
+        details = get_workshop_details_batch(mod_ids, client=api_client)
+
+    controller = None
+    if adaptive:
+        controller = ConcurrencyController(min_workers, max_workers, load_concurrency_state(workshop_path))
+    estimator = None
+    if timeout_factor:
+        state = load_throughput_state(workshop_path)
+        estimator = ThroughputEstimator(default_throughput, timeout_factor, state.get("throughput"),
+                                        overhead=state.get("overhead"))
+
+    http_client = None
+    if direct_download and any((details or {}).get(mod_id, {}).get("file_url") for mod_id in mod_ids):
+        # 下载不经过 Steam Web API，不限流；与 API 使用不同的连接池
+        http_client = SteamWebAPIClient(rate_limit=0, pool_size=max_workers)
+
+    if batch_mode:
+        session_count = controller.limit if controller is not None else max_workers
+        print(f"\n开始批量下载 {len(mod_ids)} 个模组（{max(1, min(session_count, len(mod_ids)))} 个 SteamCMD 会话）...")
+    elif controller is not None:
+        print(f"\n开始并行下载 {len(mod_ids)} 个模组（自适应并发: {controller.limit}，"
+              f"范围 {controller.min_workers}-{controller.max_workers}）...")
+    else:
+        print(f"\n开始并行下载 {len(mod_ids)} 个模组（并发数: {max_workers}）...")
+
+    # 清单只读取一次，下载过程中定期写入，结束时再写入一次
+    manifest = ManifestWriter(workshop_path)
+    result_dict = {}
+    try:
+        for mod_id, result in iter_download_results(mod_ids, workshop_path, steamcmd_path, timeout, max_workers,
+                                                    details, batch_mode, deadline, cancel_event, controller,
+                                                    validate, journal, estimator, stall_timeout, http_client,
+                                                    manifest):
+            result_dict[mod_id] = result
+            manifest.maybe_flush()
+            if not result["success"]:
+                _journal_record(journal, mod_id, "failed", status=result["status"])
+            print(f"  [{len(result_dict)}/{len(mod_ids)}] 模组 {mod_id}: {result['status']}"
+                  f"（{result['elapsed']:.1f} 秒）")
+    finally:
+        if http_client is not None:
+            http_client.close()
+        try:
+            manifest.flush()
+        except Exception as e:
+            print(f"写入模组清单失败: {e}")
+
+    if estimator is not None and (estimator.samples or estimator.overhead is not None):
+        try:
+            save_throughput_state(workshop_path, estimator)
+        except Exception as e:
+            print(f"保存吞吐量记录失败: {e}")
+
+    if controller is not None and not batch_mode:
+        print(f"\n自适应并发: 选择并发数 {controller.chosen_level}（调整过程: {' → '.join(map(str, controller.history))}）")
+        try:
+            save_concurrency_state(workshop_path, controller)
+        except Exception as e:
+            print(f"保存并发数记录失败: {e}")
+
+    # 统计结果
+    success_count = sum(1 for result in result_dict.values() if result["success"])
+    fail_count = len(result_dict) - success_count
+
+    bytes_written = sum(result["bytes_written"] for result in result_dict.values())
+    bytes_skipped = sum(result["bytes_skipped"] for result in result_dict.values())
+
+    print(f"\n并行下载完成 - 成功: {success_count}, 失败: {fail_count}")
+    print(f"文件同步 - 写入: {format_bytes(bytes_written)}, 跳过未变化: {format_bytes(bytes_skipped)}")
+
+    return result_dict
+
+
+def check_mod_updates(mod_ids, workshop_path, api_timeout=30, batch_size=100, details=None, manifest=None,
+                      api_client=None, persist=True, unchecked=None):
+    """
+    检查模组更新
+
+    基于以下规则判断：
+    1. 模组目录不存在 → 需要下载
+    2. 本地清单中的 time_updated 不早于 Steam 创意工坊更新时间 → 已是最新（快速路径）
+    3. filelist.xml 不存在 → 需要更新
+    4. 本地 filelist.xml 修改时间早于 Steam 创意工坊更新时间 → 需要更新
+
+    需要查询远程更新时间的模组会通过一次（或少量）批量 API 请求统一获取。
+    不在清单中但判断为最新的模组会被补录进清单，下次直接走快速路径。
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 创意工坊内容路径
+        api_timeout: API 查询超时时间（秒）
+        batch_size: 每个 API 请求最多包含的模组数量
+        details: 已获取的模组详情字典（可选，传入时不再重复查询）
+        manifest: 已加载的本地清单（可选，默认从 workshop_path 读取）
+        api_client: SteamWebAPIClient 实例（可选，与下载阶段共用）
+        persist: 是否把补录的清单条目写回磁盘（--plan 时为 False）
+        unchecked: 列表（可选），传入时记录无法获取更新信息、跳过检查的模组ID
+
+    Returns:
+        list: 需要更新的模组ID列表
+    """
+    needs_update = []
+    workshop = Path(workshop_path)
+    pending_remote = []
+
+    if manifest is None:
+        manifest = load_manifest(workshop_path)
+    manifest_changed = False
+
+    for mod_id in mod_ids:
+        mod_path = workshop / mod_id
+
+        # 检查1: 模组目录是否存在
+        if not mod_path.exists():
+            print(f"  模组 {mod_id}: 目录不存在，需要下载")
+            needs_update.append(mod_id)
+            continue
+
+        pending_remote.append(mod_id)
+
+    if not pending_remote:
+        return needs_update
+
+    # 批量获取 Steam 创意工坊的模组更新时间
+    if details is None:
+        details = get_workshop_details_batch(pending_remote, timeout=api_timeout, batch_size=batch_size,
+                                             client=api_client)
+
+    for mod_id in pending_remote:
+        filelist_path = workshop / mod_id / "filelist.xml"
+        moddetails = details.get(mod_id)
+        remote_ok = bool(moddetails and moddetails["result"] == 1 and moddetails["time_updated"])
+        entry = manifest.get(mod_id)
+
+        # 检查2: 快速路径，信任清单记录的版本
+        if remote_ok and entry and entry.get("time_updated", 0) >= moddetails["time_updated"]:
+            print(f"  模组 {mod_id}: 已是最新")
+            continue
+
+        # 检查3: filelist.xml 是否存在
+        if not filelist_path.exists():
+            print(f"  模组 {mod_id}: filelist.xml 不存在，需要更新")
+            needs_update.append(mod_id)
+            continue
+
+        if not remote_ok:
+            # 无法获取远程更新时间，跳过检查
+            print(f"  模组 {mod_id}: 无法获取更新信息，跳过检查")
+            if unchecked is not None:
+                unchecked.append(mod_id)
+            continue
+
+        # 检查4: 清单中没有记录（或记录较旧）时，比较本地和远程更新时间
+        remote_update_time = moddetails["time_updated"]
+        local_mtime = filelist_path.stat().st_mtime
+
+        if entry or remote_update_time > local_mtime:
+            print(f"  模组 {mod_id}: Steam 有更新，需要下载")
+            needs_update.append(mod_id)
+        else:
+            print(f"  模组 {mod_id}: 已是最新")
+            # 补录到清单，下次运行直接走快速路径
+            manifest[mod_id] = {
+                "time_updated": remote_update_time,
+                "file_size": moddetails["file_size"],
+                "content_hash": None,
+                "installed_at": time.time()
+            }
+            manifest_changed = True
+
+    if manifest_changed and persist:
+        try:
+            save_manifest(workshop_path, manifest)
+        except Exception as e:
+            print(f"保存模组清单失败: {e}")
+
+    return needs_update
+
+
+STORE_OBJECTS_DIR = "objects"
+STORE_MODS_DIR = "mods"
+STORE_REFS_FILENAME = "refs.json"
+
+# Linux 上 btrfs / xfs 等文件系统的 reflink（写时复制克隆）ioctl
+FICLONE = 0x40049409
+
+
+def _reflink(src, dest):
+    """
+    使用 FICLONE 创建写时复制的克隆文件（仅 Linux 且文件系统支持时可用）
+
+    Args:
+        src: 源文件
+        dest: 目标文件
+
+    Raises:
+        OSError: 平台或文件系统不支持
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前平台不支持 reflink")
+
+    with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dest_file.close()
+            os.unlink(dest)
+            raise
+
+
+def _clone_file(src, dest, link_mode="hardlink"):
+    """
+    按配置的方式把共享存储中的文件放到目标位置
+
+    hardlink 失败（例如跨文件系统）时依次尝试 reflink 和复制；
+    reflink 失败时退回复制。
+
+    Args:
+        src: 源文件
+        dest: 目标文件
+        link_mode: hardlink、reflink 或 copy
+
+    Returns:
+        str: 实际使用的方式
+    """
+    if link_mode == "hardlink":
+        try:
+            os.link(src, dest)
+            return "hardlink"
+        except OSError:
+            pass
+    if link_mode in ("hardlink", "reflink"):
+        try:
+            _reflink(src, dest)
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copy2(src, dest)
+    return "copy"
+
+
+def get_store_object_path(store_path, sha256):
+    """
+    获取内容寻址存储中某个文件内容对应的路径
+
+    Args:
+        store_path: 共享存储目录
+        sha256: 文件内容的 SHA-256
+
+    Returns:
+        Path: store/objects/{前两位}/{sha256}
+    """
+    return Path(store_path) / STORE_OBJECTS_DIR / sha256[:2] / sha256
+
+
+def ingest_mod_into_store(store_path, mod_id, entry):
+    """
+    将共享存储中已安装的模组文件登记到内容寻址对象目录
+
+    对象文件是 store/mods/{ID} 中对应文件的硬链接，不额外占用空间；
+    内容相同的文件（不同模组或不同版本之间）只保留一份对象。
+
+    Args:
+        store_path: 共享存储目录
+        mod_id: 模组ID
+        entry: 该模组在共享存储清单中的条目（需要包含 files）
+
+    Returns:
+        int: 新增的对象数量
+    """
+    mod_path = Path(store_path) / STORE_MODS_DIR / mod_id
+    added = 0
+    for rel_path, info in entry["files"].items():
+        object_path = get_store_object_path(store_path, info["sha256"])
+        if object_path.exists():
+            continue
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = object_path.with_name(object_path.name + ".tmp")
+        _clone_file(mod_path / rel_path, tmp_path, "hardlink")
+        os.replace(tmp_path, object_path)
+        added += 1
+    return added
+
+
+def link_mod_into_profile(store_path, mod_id, entry, profile_workshop, link_mode="hardlink", manifest=None):
+    """
+    从共享存储把模组链接到某个服务器配置的 LocalMods/{ID}
+
+    在 LocalMods/.{ID}.sync 中用对象文件组装新目录后整体替换，并把
+    清单条目写入该配置自己的 .mod_manifest.json。
+
+    Args:
+        store_path: 共享存储目录
+        mod_id: 模组ID
+        entry: 共享存储清单中的条目
+        profile_workshop: 该配置的模组目录
+        link_mode: hardlink、reflink 或 copy
+        manifest: 该配置的 ManifestWriter 实例（可选），批量写入清单条目
+
+    Returns:
+        dict: {方式: 文件数} 的统计
+    """
+    profile_workshop = Path(profile_workshop)
+    profile_workshop.mkdir(parents=True, exist_ok=True)
+    final_mod_path = profile_workshop / mod_id
+    new_path = profile_workshop / f".{mod_id}.sync"
+    if new_path.exists():
+        shutil.rmtree(new_path)
+    new_path.mkdir(parents=True)
+
+    methods = {}
+    for rel_path, info in entry["files"].items():
+        dest = new_path / rel_path
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        method = _clone_file(get_store_object_path(store_path, info["sha256"]), dest, link_mode)
+        methods[method] = methods.get(method, 0) + 1
+
+    _swap_mod_dir(new_path, final_mod_path)
+    if manifest is not None:
+        manifest.record(mod_id, entry)
+    else:
+        record_manifest_entry(profile_workshop, mod_id, entry)
+    return methods
+
+
+def load_store_refs(store_path):
+    """
+    读取共享存储的引用记录
+
+    Args:
+        store_path: 共享存储目录
+
+    Returns:
+        dict: {配置名称: {"workshop_path": 模组目录, "mods": {mod_id: content_hash}}}
+    """
+    refs_path = Path(store_path) / STORE_REFS_FILENAME
+    if not refs_path.exists():
+        return {}
+    try:
+        with open(refs_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("profiles", {})
+    except Exception as e:
+        print(f"读取共享存储引用记录失败: {e}")
+        return {}
+
+
+def save_store_refs(store_path, refs):
+    """
+    原子写入共享存储的引用记录
+
+    Args:
+        store_path: 共享存储目录
+        refs: {配置名称: {"workshop_path": 模组目录, "mods": {mod_id: content_hash}}}
+    """
+    atomic_write_json(Path(store_path) / STORE_REFS_FILENAME, {"profiles": refs})
+
+
+def gc_store(store_path, refs):
+    """
+    清理共享存储中不再被任何配置引用的模组和对象文件
+
+    对象文件只要仍属于共享存储中的某个模组版本，或仍被某个配置当前链接的
+    版本使用（见各配置自己的清单），就会保留。
+
+    Args:
+        store_path: 共享存储目录
+        refs: {配置名称: {"workshop_path": 模组目录, "mods": {mod_id: content_hash}}}
+
+    Returns:
+        dict: 包含 mods_removed、objects_removed、bytes_freed 的统计
+    """
+    store_path = Path(store_path)
+    store_workshop = store_path / STORE_MODS_DIR
+
+    referenced_mods = set()
+    for profile_refs in refs.values():
+        referenced_mods.update(profile_refs.get("mods", {}))
+
+    stats = {"mods_removed": 0, "objects_removed": 0, "bytes_freed": 0}
+
+    # 删除没有任何配置使用的模组
+    manifest = load_manifest(store_workshop)
+    for mod_id in list(manifest):
+        if mod_id not in referenced_mods:
+            shutil.rmtree(store_workshop / mod_id, ignore_errors=True)
+            del manifest[mod_id]
+            stats["mods_removed"] += 1
+    if stats["mods_removed"]:
+        save_manifest(store_workshop, manifest)
+
+    referenced_hashes = set()
+    for entry in manifest.values():
+        referenced_hashes.update(info["sha256"] for info in (entry.get("files") or {}).values())
+    for profile_refs in refs.values():
+        profile_manifest = load_manifest(profile_refs["workshop_path"])
+        for mod_id in profile_refs.get("mods", {}):
+            entry = profile_manifest.get(mod_id) or {}
+            referenced_hashes.update(info["sha256"] for info in (entry.get("files") or {}).values())
+
+    objects_dir = store_path / STORE_OBJECTS_DIR
+    if objects_dir.exists():
+        for object_path in objects_dir.glob('*/*'):
+            if object_path.name not in referenced_hashes:
+                stats["bytes_freed"] += object_path.stat().st_size
+                object_path.unlink()
+                stats["objects_removed"] += 1
+        for prefix_dir in objects_dir.iterdir():
+            if prefix_dir.is_dir() and not any(prefix_dir.iterdir()):
+                prefix_dir.rmdir()
+
+    return stats
+
+
+class RunMetrics:
+    """
+    单次更新运行的分阶段计时和指标
+
+    记录解析、检查、下载、清理等阶段的耗时，每个模组的下载结果
+    （SteamCMD 耗时、验证和移动耗时、数据量、重试次数、退出码）以及
+    API 请求计数，可导出为 JSON Lines 运行报告和 Prometheus textfile。
+    """
+
+    def __init__(self, mode="once"):
+        """
+        Args:
+            mode: 运行模式（once 或 watch）
+        """
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{random.randint(0, 0xffff):04x}"
+        self.mode = mode
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stages = {}
+        self.counters = {}
+        self.mods = {}
+        self.plan = None
+        self.exit_code = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        统计一个阶段的耗时（同名阶段累加）
+
+        Args:
+            name: 阶段名称
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start
+
+    def count(self, name, value=1):
+        """
+        累加计数器
+
+        Args:
+            name: 计数器名称
+            value: 增加的值
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_downloads(self, download_results):
+        """
+        记录 download_mods_parallel 返回的每个模组结果
+
+        Args:
+            download_results: {mod_id: 结果字典}
+        """
+        for mod_id, result in download_results.items():
+            self.mods[mod_id] = dict(result)
+            self.count("downloads_succeeded" if result["success"] else "downloads_failed")
+            if result["status"] in ("stalled", "too_slow"):
+                self.count(f"downloads_{result['status']}")
+            if result.get("source") == "http":
+                self.count("downloads_http")
+            self.count("bytes_written", result.get("bytes_written", 0))
+            self.count("bytes_skipped", result.get("bytes_skipped", 0))
+            self.count("steamcmd_attempts", result.get("attempts", 0))
+            self.count("download_retries", max(0, result.get("attempts", 0) - 1))
+
+    def record_api_client(self, api_client):
+        """
+        记录 API 客户端的请求和重试次数
+
+        Args:
+            api_client: SteamWebAPIClient 实例
+        """
+        self.counters["api_requests"] = api_client.request_count
+        self.counters["api_retries"] = api_client.retry_count
+
+    def finish(self, exit_code=0):
+        """
+        结束本次运行
+
+        Args:
+            exit_code: 本次运行的退出码
+        """
+        self.finished_at = time.time()
+        self.exit_code = exit_code
+
+    def summary(self):
+        """
+        生成运行摘要
+
+        Returns:
+            dict: 摘要字典
+        """
+        finished_at = self.finished_at or time.time()
+        summary = {
+            "type": "summary",
+            "run_id": self.run_id,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "finished_at": finished_at,
+            "wall_seconds": finished_at - self.started_at,
+            "exit_code": self.exit_code,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "mods": {mod_id: dict(result) for mod_id, result in self.mods.items()}
+        }
+        if self.plan is not None:
+            summary["plan"] = self.plan
+        return summary
+
+    def write_jsonl(self, report_path):
+        """
+        以 JSON Lines 格式追加运行报告：每个阶段、每个模组各一行，最后一行为摘要
+
+        Args:
+            report_path: 报告文件路径
+        """
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        lines = []
+        for name, seconds in self.stages.items():
+            lines.append({"type": "stage", "run_id": self.run_id, "stage": name, "seconds": seconds})
+        for mod_id, result in self.mods.items():
+            lines.append(dict(result, type="mod", run_id=self.run_id, mod_id=mod_id))
+        summary = self.summary()
+        summary.pop("mods")
+        lines.append(summary)
+
+        with open(report_path, 'a', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, textfile_path):
+        """
+        原子写入 Prometheus node_exporter textfile collector 格式的指标文件
+
+        Args:
+            textfile_path: 指标文件路径（应以 .prom 结尾）
+        """
+        textfile_path = Path(textfile_path)
+        textfile_path.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary()
+        prefix = "barotrauma_mod_update"
+        lines = [
+            f"# HELP {prefix}_last_run_timestamp_seconds 最近一次运行结束的时间",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds {summary['finished_at']:.3f}",
+            f"# HELP {prefix}_last_run_duration_seconds 最近一次运行的总耗时",
+            f"# TYPE {prefix}_last_run_duration_seconds gauge",
+            f"{prefix}_last_run_duration_seconds {summary['wall_seconds']:.3f}",
+            f"# HELP {prefix}_last_run_exit_code 最近一次运行的退出码",
+            f"# TYPE {prefix}_last_run_exit_code gauge",
+            f"{prefix}_last_run_exit_code {summary['exit_code'] or 0}",
+            f"# HELP {prefix}_stage_duration_seconds 各阶段耗时",
+            f"# TYPE {prefix}_stage_duration_seconds gauge"
+        ]
+        for name, seconds in summary["stages"].items():
+            lines.append(f'{prefix}_stage_duration_seconds{{stage="{name}"}} {seconds:.3f}')
+        for name, value in summary["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        lines.append(f"# HELP {prefix}_mod_download_seconds 每个模组的下载任务耗时")
+        lines.append(f"# TYPE {prefix}_mod_download_seconds gauge")
+        for mod_id, result in summary["mods"].items():
+            lines.append(f'{prefix}_mod_download_seconds{{mod_id="{mod_id}",status="{result["status"]}"}} '
+                         f'{result["elapsed"]:.3f}')
+
+        with atomic_open(textfile_path) as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def emit_run_metrics(metrics, config, config_path, json_stream=None):
+    """
+    按配置输出运行指标
+
+    Args:
+        metrics: RunMetrics 实例
+        config: 配置字典
+        config_path: config.json 的绝对路径（相对路径以其所在目录为基准）
+        json_stream: 输出 JSON 摘要的流（可选，用于 --json）
+    """
+    metrics_config = config["metrics"]
+    try:
+        if metrics_config["report_path"]:
+            metrics.write_jsonl(resolve_config_relative(config_path, metrics_config["report_path"]))
+        if metrics_config["prometheus_path"]:
+            metrics.write_prometheus(resolve_config_relative(config_path, metrics_config["prometheus_path"]))
+    except Exception as e:
+        print(f"写入运行指标失败: {e}")
+
+    if json_stream is not None:
+        json_stream.write(json.dumps(metrics.summary(), ensure_ascii=False) + "\n")
+        json_stream.flush()
+
+
+def resolve_config_relative(config_path, path):
+    """
+    将相对路径解析为相对于 config.json 所在目录的绝对路径
+
+    Args:
+        config_path: config.json 的绝对路径
+        path: 待解析的路径
+
+    Returns:
+        Path: 绝对路径
+    """
+    path = Path(path)
+    if not path.is_absolute():
+        path = config_path.parent / path
+    return path.resolve()
+
+
+def resolve_paths(config, config_path):
+    """
+    以 config.json 所在目录为基准解析模组目录和模组来源文件路径
+
+    Args:
+        config: 配置字典
+        config_path: config.json 的绝对路径
+
+    Returns:
+        tuple: (模组下载目录字符串, 模组来源文件 Path 列表)，
+               第一个来源为 files.config_file，其后为 files.extra_sources
+    """
+    config_dir = config_path.parent
+    workshop_path = config["files"]["workshop_path"]
+    if not Path(workshop_path).is_absolute():
+        # 相对路径：相对于配置文件的位置
+        workshop_path = str((config_dir / workshop_path).resolve())
+    else:
+        # 绝对路径：直接使用
+        workshop_path = str(Path(workshop_path).resolve())
+
+    source_paths = [resolve_config_relative(config_path, source)
+                    for source in [config["files"]["config_file"]] + list(config["files"]["extra_sources"])]
+
+    return workshop_path, source_paths
+
+
+def resolve_profiles(config, config_path):
+    """
+    解析 profiles 中每个服务器配置的模组目录和模组来源文件
+
+    每个配置的 config_file、workshop_path、extra_sources 未填写时沿用 files 中的值。
+
+    Args:
+        config: 配置字典
+        config_path: config.json 的绝对路径
+
+    Returns:
+        list: [{"name", "workshop_path", "source_paths"}]
+    """
+    profiles = []
+    for index, profile in enumerate(config["profiles"]):
+        files = dict(config["files"])
+        files.update({key: profile[key] for key in ("config_file", "workshop_path", "extra_sources")
+                      if key in profile})
+        workshop_path, source_paths = resolve_paths({"files": files}, config_path)
+        profiles.append({
+            "name": profile.get("name") or f"profile{index + 1}",
+            "workshop_path": workshop_path,
+            "source_paths": source_paths
+        })
+    return profiles
+
+
+# Valve KeyValues（.acf / .vdf）中的字符串和大括号
+VDF_TOKEN_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])')
+
+# appworkshop_602960.acf 中按物品ID记录状态的小节
+ACF_ITEM_SECTIONS = ("WorkshopItemsInstalled", "WorkshopItemDetails")
+
+
+def parse_vdf(text):
+    """
+    解析 Valve KeyValues 文本
+
+    Args:
+        text: 文件内容
+
+    Returns:
+        list: [(键, 值)] 列表，值为字符串或嵌套的列表（保留原有顺序和转义）
+
+    Raises:
+        ValueError: 格式错误
+    """
+    stack = [[]]
+    key = None
+    for match in VDF_TOKEN_PATTERN.finditer(text):
+        string, brace = match.groups()
+        if brace == "{":
+            if key is None:
+                raise ValueError("大括号前缺少键")
+            child = []
+            stack[-1].append((key, child))
+            stack.append(child)
+            key = None
+        elif brace == "}":
+            if len(stack) == 1 or key is not None:
+                raise ValueError("多余的右大括号")
+            stack.pop()
+        elif key is None:
+            key = string
+        else:
+            stack[-1].append((key, string))
+            key = None
+    if len(stack) != 1 or key is not None:
+        raise ValueError("文件不完整")
+    return stack[0]
+
+
+def format_vdf(pairs, indent=0):
+    """
+    将 parse_vdf 的结果格式化为 KeyValues 文本
+
+    Args:
+        pairs: [(键, 值)] 列表
+        indent: 缩进层级
+
+    Returns:
+        str: KeyValues 文本
+    """
+    tab = "\t" * indent
+    lines = []
+    for key, value in pairs:
+        if isinstance(value, list):
+            lines.append(f'{tab}"{key}"\n{tab}{{\n{format_vdf(value, indent + 1)}{tab}}}\n')
+        else:
+            lines.append(f'{tab}"{key}"\t\t"{value}"\n')
+    return "".join(lines)
+
+
+def remove_acf_items(acf_path, mod_ids):
+    """
+    从 SteamCMD 的 appworkshop_602960.acf 中删除指定物品的状态
+
+    其他物品的状态保持不变，SteamCMD 仍然可以对它们做差异下载。
+    文件无法解析时整个删除（SteamCMD 会重新建立）。
+
+    Args:
+        acf_path: appworkshop_602960.acf 路径
+        mod_ids: 要删除的模组ID集合
+    """
+    acf_path = Path(acf_path)
+    if not acf_path.exists():
+        return
+    try:
+        root = parse_vdf(acf_path.read_text(encoding='utf-8'))
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        print(f"  无法解析 {acf_path.name}（{e}），已删除")
+        acf_path.unlink(missing_ok=True)
+        return
+
+    for _, app_state in root:
+        if not isinstance(app_state, list):
+            continue
+        for key, section in app_state:
+            if key in ACF_ITEM_SECTIONS and isinstance(section, list):
+                section[:] = [(item_id, value) for item_id, value in section if item_id not in mod_ids]
+    with atomic_open(acf_path) as f:
+        f.write(format_vdf(root))
+
+
+def _dir_size(path):
+    """
+    统计目录中所有文件的总大小
+
+    Args:
+        path: 目录
+
+    Returns:
+        int: 字节数
+    """
+    total = 0
+    for file_path in Path(path).rglob('*'):
+        try:
+            if file_path.is_file():
+                total += file_path.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def cleanup_staging(workshop_path, max_size_mb=0):
+    """
+    按大小上限清理 SteamCMD 临时目录
+
+    临时目录（LocalMods/steamapps）保留 SteamCMD 的下载状态、未完成的下载
+    和已下载的物品，下次更新时可以只下载差异部分。总大小超过上限时，按
+    最近使用时间淘汰物品目录，并从 SteamCMD 的物品状态文件中删除这些物品，
+    避免 SteamCMD 认为被删除的物品仍已下载。max_size_mb 为 0 时整个删除。
+
+    Args:
+        workshop_path: 创意工坊内容路径
+        max_size_mb: 临时目录大小上限（MB），0 表示每次运行后都删除
+    """
+    steamapps_dir = Path(workshop_path) / "steamapps"
+    if not steamapps_dir.exists():
+        return
+
+    if not max_size_mb:
+        print("\n正在清理临时文件...")
+        shutil.rmtree(steamapps_dir, ignore_errors=True)
+        print("✓ 临时文件清理完成")
+        return
+
+    max_bytes = max_size_mb * 1024 * 1024
+    total = _dir_size(steamapps_dir)
+    if total <= max_bytes:
+        print(f"\nSteamCMD 临时目录: {format_bytes(total)}（上限 {format_bytes(max_bytes)}），保留供下次使用")
+        return
+
+    print(f"\nSteamCMD 临时目录 {format_bytes(total)} 超过上限 {format_bytes(max_bytes)}，正在淘汰最久未使用的模组...")
+    workshop_dir = steamapps_dir / "workshop"
+    content_dir = workshop_dir / "content" / STEAM_APP_ID
+    items = sorted((item for item in content_dir.iterdir() if item.is_dir()),
+                   key=lambda item: item.stat().st_mtime) if content_dir.exists() else []
+
+    evicted = set()
+    for item in items:
+        if total <= max_bytes:
+            break
+        total -= _dir_size(item)
+        shutil.rmtree(item, ignore_errors=True)
+        evicted.add(item.name)
+    if evicted:
+        remove_acf_items(workshop_dir / f"appworkshop_{STEAM_APP_ID}.acf", evicted)
+
+    if total > max_bytes:
+        # 只剩未完成的下载等状态文件仍然超过上限：整个删除
+        shutil.rmtree(steamapps_dir, ignore_errors=True)
+        print(f"✓ 淘汰 {len(evicted)} 个模组后仍超过上限，已删除整个临时目录")
+    else:
+        print(f"✓ 淘汰 {len(evicted)} 个模组，临时目录 {format_bytes(total)}")
+
+
+def run_downloads(update_list, workshop_path, config, details, api_client, cancel_event=None, journal=None):
+    """
+    下载需要更新的模组并显示每个模组的结果
+
+    Args:
+        update_list: 需要更新的模组ID列表
+        workshop_path: 创意工坊内容路径
+        config: 配置字典
+        details: 模组详情字典
+        api_client: SteamWebAPIClient 实例
+        cancel_event: threading.Event，设置后取消剩余下载（可选）
+        journal: RunJournal 实例（可选），记录每个模组的状态
+
+    Returns:
+        dict: download_mods_parallel 返回的结果字典
+    """
+    download_results = download_mods_parallel(
+        update_list,
+        workshop_path,
+        config["steamcmd"]["path"],
+        config["download"]["timeout"],
+        config["download"]["max_workers"],
+        details,
+        config["download"]["batch_mode"],
+        config["download"]["deadline"],
+        cancel_event,
+        api_client,
+        config["download"]["adaptive"],
+        config["download"]["min_workers"],
+        config["download"]["validate"],
+        journal,
+        config["download"]["stall_timeout"],
+        config["download"]["timeout_factor"],
+        config["download"]["default_throughput_kbps"] * 1024,
+        config["download"]["direct_download"]
+    )
+
+    # 显示每个模组的下载结果
+    print("\n=== 详细结果 ===")
+    for mod_id, result in download_results.items():
+        status = "✓ 成功" if result["success"] else f"✗ 失败（{result['status']}）"
+        print(f"  模组 {mod_id}: {status}")
+
+    return download_results
+
+
+def collect_mod_details(mod_ids, config, api_client, deps_json=None):
+    """
+    批量获取模组详情，启用依赖解析时补全依赖模组
+
+    Args:
+        mod_ids: 模组ID列表
+        config: 配置字典
+        api_client: SteamWebAPIClient 实例
+        deps_json: 依赖图导出路径（可选，指定时总是解析依赖）
+
+    Returns:
+        tuple: (依赖在前的模组ID列表, 模组详情字典)
+    """
+    batch_size = config["api"]["batch_size"]
+    if not (config["dependencies"]["resolve"] or deps_json):
+        return mod_ids, get_workshop_details_batch(mod_ids, batch_size=batch_size, client=api_client)
+
+    if not api_client.key:
+        print("⚠ 依赖解析需要 api.key（Steam Web API 密钥）：GetPublishedFileDetails 不返回依赖信息，本次不解析依赖")
+        return mod_ids, get_workshop_details_batch(mod_ids, batch_size=batch_size, client=api_client)
+    graph = resolve_mod_dependencies(mod_ids, api_client, batch_size)
+    print_dependency_graph(graph)
+    if deps_json:
+        export_dependency_graph(graph, deps_json)
+    return graph["order"], graph["details"]
+
+
+def expand_mod_dependencies(mod_ids, details):
+    """
+    根据模组详情中的 children 补全一组模组的依赖
+
+    Args:
+        mod_ids: 模组ID列表
+        details: 模组详情字典（resolve_mod_dependencies 返回的 details）
+
+    Returns:
+        list: 包含依赖的模组ID列表（原有顺序在前）
+    """
+    result = list(mod_ids)
+    seen = set(result)
+    for mod_id in result:
+        for child_id in (details.get(mod_id) or {}).get("children", []):
+            if child_id not in seen and child_id in details:
+                seen.add(child_id)
+                result.append(child_id)
+    return result
+
+
+def run_store_update(profiles, config, config_path, metrics, run_gc=False, deps_json=None):
+    """
+    多服务器配置模式：模组只下载到共享存储，再链接到每个配置的模组目录
+
+    1. 合并所有配置的模组列表，只查询和下载一次
+    2. 新版本下载到 {store}/mods，文件按 SHA-256 登记到 {store}/objects
+    3. 内容哈希发生变化的模组重新链接到各配置的 LocalMods/{ID}
+    4. 更新 {store}/refs.json，按需清理不再被引用的模组和对象
+
+    Args:
+        profiles: resolve_profiles 返回的配置列表
+        config: 配置字典
+        config_path: config.json 的绝对路径
+        metrics: RunMetrics 实例
+        run_gc: 是否在结束时清理共享存储
+        deps_json: 依赖图导出路径（可选）
+
+    Returns:
+        int: 退出码
+    """
+    store_path = resolve_config_relative(config_path, config["store"]["path"])
+    store_workshop = store_path / STORE_MODS_DIR
+    link_mode = config["store"]["link_mode"]
+    print(f"共享存储: {store_path}（链接方式: {link_mode}）")
+
+    # 解析每个配置的模组列表
+    profile_mods = {}
+    with metrics.stage("parse"):
+        for profile in profiles:
+            for source_path in profile["source_paths"]:
+                if not source_path.exists():
+                    print(f"错误: 找不到配置文件 {source_path}（配置 {profile['name']}）")
+                    return 1
+            profile_mods[profile["name"]] = parse_mod_sources(profile["source_paths"])
+            print(f"配置 {profile['name']}: {len(profile_mods[profile['name']])} 个模组 → {profile['workshop_path']}")
+
+    all_mod_ids = list(dict.fromkeys(mod_id for mod_ids in profile_mods.values() for mod_id in mod_ids))
+    if not all_mod_ids:
+        print("未找到任何模组配置")
+        return 0
+    print(f"\n所有配置共 {len(all_mod_ids)} 个不重复的模组\n")
+
+    recover_interrupted_syncs(store_workshop)
+    for profile in profiles:
+        recover_interrupted_syncs(profile["workshop_path"])
+
+    api_client = SteamWebAPIClient.from_config(config["api"])
+    with metrics.stage("details"):
+        all_mod_ids, details = collect_mod_details(all_mod_ids, config, api_client, deps_json)
+    metrics.count("mods_total", len(all_mod_ids))
+
+    with metrics.stage("check"):
+        print("检查共享存储中的模组更新状态...")
+        update_list = check_mod_updates(all_mod_ids, store_workshop, details=details, api_client=api_client)
+
+        # 从旧目录补录的条目没有文件哈希，本地计算一次后才能链接
+        store_manifest = ManifestWriter(store_workshop)
+        for mod_id in all_mod_ids:
+            entry = store_manifest.get(mod_id)
+            if mod_id not in update_list and entry and not entry.get("files"):
+                store_manifest.record(mod_id, build_manifest_entry(store_workshop / mod_id, details.get(mod_id)))
+        store_manifest.flush()
+    metrics.count("mods_needing_update", len(update_list))
+
+    fail_count = 0
+    if update_list:
+        print(f"发现 {len(update_list)} 个模组需要更新或下载\n")
+        with metrics.stage("download"):
+            download_results = run_downloads(update_list, str(store_workshop), config, details, api_client)
+        metrics.record_downloads(download_results)
+        fail_count = sum(1 for result in download_results.values() if not result["success"])
+    else:
+        print("共享存储中的模组都是最新的\n")
+
+    metrics.record_api_client(api_client)
+    api_client.close()
+
+    # 登记对象文件并链接到各配置
+    old_refs = load_store_refs(store_path)
+    refs = {}
+    with metrics.stage("link"):
+        store_manifest = load_manifest(store_workshop)
+        for mod_id in all_mod_ids:
+            entry = store_manifest.get(mod_id)
+            if entry and entry.get("files"):
+                metrics.count("store_objects_added", ingest_mod_into_store(store_path, mod_id, entry))
+
+        print("\n=== 链接到服务器配置 ===")
+        for profile in profiles:
+            name = profile["name"]
+            mod_ids = profile_mods[name]
+            if config["dependencies"]["resolve"] or deps_json:
+                mod_ids = expand_mod_dependencies(mod_ids, details)
+
+            profile_manifest = ManifestWriter(profile["workshop_path"])
+            previous = old_refs.get(name, {}).get("mods", {})
+            linked_mods = {}
+            linked = 0
+            for mod_id in mod_ids:
+                entry = store_manifest.get(mod_id)
+                if not entry or not entry.get("files"):
+                    print(f"  {name}: 模组 {mod_id} 不在共享存储中，跳过")
+                    if mod_id in previous:
+                        linked_mods[mod_id] = previous[mod_id]
+                    fail_count += 1
+                    continue
+
+                linked_mods[mod_id] = entry["content_hash"]
+                current = profile_manifest.get(mod_id) or {}
+                if current.get("content_hash") == entry["content_hash"] and \
+                        (Path(profile["workshop_path"]) / mod_id).exists():
+                    continue
+                try:
+                    methods = link_mod_into_profile(store_path, mod_id, entry, profile["workshop_path"], link_mode,
+                                                    profile_manifest)
+                    linked += 1
+                    print(f"  {name}: 模组 {mod_id} 已链接（{', '.join(f'{k} {v}' for k, v in methods.items())}）")
+                except OSError as e:
+                    print(f"  {name}: 模组 {mod_id} 链接失败: {e}")
+                    fail_count += 1
+            profile_manifest.flush()
+
+            refs[name] = {"workshop_path": profile["workshop_path"], "mods": linked_mods}
+            metrics.count("mods_linked", linked)
+            print(f"  {name}: 更新 {linked} 个，共 {len(linked_mods)} 个模组")
+
+    save_store_refs(store_path, refs)
+
+    with metrics.stage("cleanup"):
+        cleanup_staging(store_workshop, config["staging"]["max_size_mb"])
+        if run_gc or config["store"]["auto_gc"]:
+            gc_stats = gc_store(store_path, refs)
+            print(f"共享存储清理: 删除 {gc_stats['mods_removed']} 个模组、"
+                  f"{gc_stats['objects_removed']} 个对象，释放 {format_bytes(gc_stats['bytes_freed'])}")
+
+    return 1 if fail_count > 0 else 0
+
+
+def run_verify(mod_ids, workshop_path, config, metrics):
+    """
+    校验已安装的模组，只重新下载校验失败的模组
+
+    Args:
+        mod_ids: 模组ID列表
+        workshop_path: 创意工坊内容路径
+        config: 配置字典
+        metrics: RunMetrics 实例
+
+    Returns:
+        int: 退出码（仍有模组校验失败时为 1）
+    """
+    hash_workers = config["verify"]["hash_workers"] or None
+
+    # 清单中记录的其他已安装模组（例如依赖模组）一并校验
+    manifest = load_manifest(workshop_path)
+    mod_ids = list(dict.fromkeys(list(mod_ids) + [mod_id for mod_id in manifest
+                                                   if (Path(workshop_path) / mod_id).is_dir()]))
+    metrics.count("mods_total", len(mod_ids))
+
+    with metrics.stage("verify"):
+        print(f"正在校验 {len(mod_ids)} 个模组...")
+        problems = verify_installed_mods(mod_ids, workshop_path, hash_workers)
+
+    failed = [mod_id for mod_id in mod_ids if problems[mod_id]]
+    for mod_id in failed:
+        print(f"  ✗ 模组 {mod_id}: {'; '.join(problems[mod_id][:5])}")
+        if len(problems[mod_id]) > 5:
+            print(f"    ……共 {len(problems[mod_id])} 个问题")
+    print(f"\n校验完成 - 通过: {len(mod_ids) - len(failed)}, 失败: {len(failed)}")
+    metrics.count("mods_verify_failed", len(failed))
+    metrics.count("mods_needing_update", len(failed))
+
+    if not failed:
+        return 0
+
+    # 清单中的文件哈希已不可信，删除后重新下载时会重新计算所有文件的哈希
+    with _manifest_lock:
+        manifest = load_manifest(workshop_path)
+        for mod_id in failed:
+            if mod_id in manifest:
+                manifest[mod_id].pop("files", None)
+        save_manifest(workshop_path, manifest)
+
+    api_client = SteamWebAPIClient.from_config(config["api"])
+    with metrics.stage("details"):
+        details = get_workshop_details_batch(failed, batch_size=config["api"]["batch_size"], client=api_client)
+    with metrics.stage("download"):
+        download_results = run_downloads(failed, workshop_path, config, details, api_client)
+    metrics.record_downloads(download_results)
+    metrics.record_api_client(api_client)
+    api_client.close()
+
+    with metrics.stage("verify"):
+        downloaded = [mod_id for mod_id in failed if download_results[mod_id]["success"]]
+        problems = verify_installed_mods(downloaded, workshop_path, hash_workers)
+    still_failed = [mod_id for mod_id in failed if mod_id not in problems or problems[mod_id]]
+    for mod_id in still_failed:
+        reason = "; ".join(problems[mod_id][:5]) if mod_id in problems else "重新下载失败"
+        print(f"  ✗ 模组 {mod_id} 重新下载后仍未通过校验: {reason}")
+
+    with metrics.stage("cleanup"):
+        cleanup_staging(workshop_path, config["staging"]["max_size_mb"])
+
+    return 1 if still_failed else 0
+
+
+def watch_mods(config, config_path, source_paths, workshop_path, json_stream=None):
+    """
+    常驻监视模式
+
+    在内存中保留模组列表、上次看到的创意工坊更新时间和 API 连接，
+    按 watch.interval 批量轮询 Steam Web API，只有发现变化时才启动
+    SteamCMD。通过修改时间轮询 config_player.xml 及其他模组来源文件，
+    新启用的模组会立即检查和下载。API 请求失败时按指数退避延长轮询间隔。收到 SIGTERM
+    或 SIGINT 后取消正在进行的下载并退出。每次检查到变化的轮询都会输出一份运行指标。
+
+    Args:
+        config: 配置字典
+        config_path: config.json 的绝对路径
+        source_paths: 模组来源文件 Path 列表（config_player.xml 等）
+        workshop_path: 创意工坊内容路径
+        json_stream: 输出 JSON 摘要的流（可选，用于 --json）
+    """
+    watch_config = config["watch"]
+    interval = max(1, watch_config["interval"])
+    config_poll_interval = max(1, watch_config["config_poll_interval"])
+    max_backoff = max(interval, watch_config["max_backoff"])
+
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        print(f"\n收到信号 {signum}，正在停止监视...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    api_client = SteamWebAPIClient.from_config(config["api"])
+    batch_size = config["api"]["batch_size"]
+    resolve_dependencies = config["dependencies"]["resolve"]
+    workshop = Path(workshop_path)
+
+    mod_ids = []
+    config_mtimes = None
+    # 上次轮询看到的创意工坊更新时间，只有发生变化的模组才需要检查
+    last_seen = {}
+    next_check = time.monotonic()
+    failures = 0
+
+    def run_cycle(candidate_ids):
+        """检查并下载指定模组，返回 API 是否可用"""
+        nonlocal mod_ids
+        metrics = RunMetrics("watch")
+        requests_before = api_client.request_count
+        retries_before = api_client.retry_count
+        with metrics.stage("details"):
+            details = get_workshop_details_batch(candidate_ids, batch_size=batch_size, client=api_client)
+        if candidate_ids and not details:
+            print("无法获取任何模组的更新信息")
+            return False
+
+        changed = [mod_id for mod_id in candidate_ids
+                   if mod_id not in last_seen
+                   or not (workshop / mod_id).exists()
+                   or (mod_id in details and details[mod_id]["time_updated"] != last_seen[mod_id])]
+        if not changed:
+            return True
+
+        if resolve_dependencies:
+            # 有变化的模组可能新增了依赖
+            with metrics.stage("details"):
+                graph = resolve_mod_dependencies(changed, api_client, batch_size, details)
+            new_dependencies = [mod_id for mod_id in graph["order"] if mod_id not in mod_ids]
+            if new_dependencies:
+                print(f"发现 {len(new_dependencies)} 个新的依赖模组: {', '.join(new_dependencies)}")
+                mod_ids = mod_ids + new_dependencies
+            changed = [mod_id for mod_id in graph["order"]
+                       if mod_id in changed or mod_id in new_dependencies]
+            details = graph["details"]
+
+        print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] 检查 {len(changed)} 个模组...")
+        metrics.count("mods_total", len(changed))
+        with metrics.stage("check"):
+            update_list = check_mod_updates(changed, workshop_path, details=details, api_client=api_client)
+        metrics.count("mods_needing_update", len(update_list))
+        results = {}
+        if update_list:
+            print(f"发现 {len(update_list)} 个模组需要更新或下载")
+            with metrics.stage("download"):
+                results = run_downloads(update_list, workshop_path, config, details, api_client, stop_event)
+            metrics.record_downloads(results)
+            with metrics.stage("cleanup"):
+                cleanup_staging(workshop_path, config["staging"]["max_size_mb"])
+
+        for mod_id in changed:
+            if mod_id in details and (mod_id not in results or results[mod_id]["success"]):
+                last_seen[mod_id] = details[mod_id]["time_updated"]
+            else:
+                # 下载失败或没有更新信息，下次轮询重新检查
+                last_seen.pop(mod_id, None)
+
+        metrics.counters["api_requests"] = api_client.request_count - requests_before
+        metrics.counters["api_retries"] = api_client.retry_count - retries_before
+        metrics.finish(1 if any(not result["success"] for result in results.values()) else 0)
+        emit_run_metrics(metrics, config, config_path, json_stream)
+        return True
+
+    print(f"进入监视模式: 每 {interval} 秒检查一次创意工坊更新，"
+          f"每 {config_poll_interval} 秒检查一次 {', '.join(path.name for path in source_paths)}")
+    recover_interrupted_syncs(workshop_path)
+
+    while not stop_event.is_set():
+        # 检查 config_player.xml 等来源文件是否有变化
+        mtimes = []
+        for source_path in source_paths:
+            try:
+                mtimes.append(source_path.stat().st_mtime)
+            except OSError:
+                mtimes.append(None)
+        if mtimes != config_mtimes:
+            first_load = config_mtimes is None
+            config_mtimes = mtimes
+            new_ids = parse_mod_sources(source_paths)
+            if resolve_dependencies and new_ids:
+                new_ids, _ = collect_mod_details(new_ids, config, api_client)
+            added = [mod_id for mod_id in new_ids if mod_id not in mod_ids]
+            mod_ids = new_ids
+            if first_load:
+                print(f"找到 {len(mod_ids)} 个模组")
+            elif added:
+                print(f"\n模组配置已变化，新启用 {len(added)} 个模组: {', '.join(added)}")
+                run_cycle(added)
+
+        # 定时批量轮询创意工坊
+        if time.monotonic() >= next_check and not stop_event.is_set():
+            if run_cycle(mod_ids):
+                failures = 0
+                next_check = time.monotonic() + interval
+            else:
+                failures += 1
+                delay = min(max_backoff, interval * (2 ** failures))
+                print(f"将在 {delay} 秒后重试")
+                next_check = time.monotonic() + delay
+
+        stop_event.wait(min(config_poll_interval, max(0.0, next_check - time.monotonic())))
+
+    api_client.close()
+    print("监视模式已退出")
+
+
+def parse_args(argv=None):
+    """
+    解析命令行参数
+
+    Args:
+        argv: 参数列表（默认使用 sys.argv）
+
+    Returns:
+        argparse.Namespace: 解析结果
+    """
+    parser = argparse.ArgumentParser(description="Barotrauma 模组自动更新工具")
+    parser.add_argument("--config", default="config.json", help="配置文件路径（默认 config.json）")
+    parser.add_argument("--watch", action="store_true", help="常驻监视模式，定时检查更新")
+    parser.add_argument("--deps-json", metavar="PATH", help="解析模组依赖并将依赖图导出为 JSON 文件")
+    parser.add_argument("--resume", action="store_true", help="继续上次被中断的运行，只处理未完成的模组")
+    parser.add_argument("--verify", action="store_true", help="校验已安装的模组，只重新下载校验失败的模组")
+    parser.add_argument("--plan", action="store_true",
+                        help="只检查更新并输出下载计划（数据量和预计耗时），不启动 SteamCMD")
+    parser.add_argument("--gc", action="store_true", help="多配置模式下清理共享存储中不再被引用的模组")
+    parser.add_argument("--quiet", action="store_true", help="不输出控制台信息")
+    parser.add_argument("--json", action="store_true", help="不输出控制台信息，运行结束后输出 JSON 格式的运行摘要")
+    return parser.parse_args(argv)
+
+
+def run_update(args, metrics, json_stream=None):
+    """
+    执行一次完整的更新流程（或进入监视模式）
+
+    Args:
+        args: 命令行参数
+        metrics: RunMetrics 实例
+        json_stream: 输出 JSON 摘要的流（可选，用于 --json）
+
+    Returns:
+        int: 退出码
+    """
+    # 加载配置
+    print("=== Barotrauma 模组自动更新工具 ===\n")
+    config, config_path = load_config(args.config)
+
+    # 从配置中获取设置
+    steamcmd_path = config["steamcmd"]["path"]
+    timeout = config["download"]["timeout"]
+    max_workers = config["download"]["max_workers"]
+    batch_mode = config["download"]["batch_mode"]
+
+    # 以配置文件所在目录为基准解析相对路径
+    workshop_path, source_paths = resolve_paths(config, config_path)
+
+    print(f"使用配置文件: {config_path}")
+    print(f"SteamCMD 路径: {steamcmd_path}")
+    print(f"模组下载目录: {workshop_path}")
+    print(f"下载超时: {timeout} 秒")
+    if config["download"]["adaptive"]:
+        print(f"并行下载: 自适应 {config['download']['min_workers']}-{max_workers} 个 SteamCMD 进程")
+    else:
+        print(f"并行下载: {max_workers} 个 SteamCMD 进程")
+    print(f"批量会话: {'启用' if batch_mode else '关闭'}\n")
+
+    def finish(exit_code):
+        metrics.finish(exit_code)
+        emit_run_metrics(metrics, config, config_path, json_stream)
+        return exit_code
+
+    # 多服务器配置：共享存储 + 链接
+    if config["profiles"] and (args.verify or args.resume or args.plan or args.watch):
+        print("⚠ --verify / --resume / --plan / --watch 目前只处理 files.workshop_path 中的模组\n")
+    elif config["profiles"]:
+        return finish(run_store_update(resolve_profiles(config, config_path), config, config_path, metrics,
+                                       args.gc, args.deps_json))
+
+    # 检查配置文件是否存在
+    for source_path in source_paths:
+        if not source_path.exists():
+            print(f"错误: 找不到配置文件 {source_path}")
+            return finish(1)
+
+    if args.watch:
+        watch_mods(config, config_path, source_paths, workshop_path, json_stream)
+        return 0
+
+    # 解析配置文件
+    with metrics.stage("parse"):
+        for source_path in source_paths:
+            print(f"正在解析配置文件: {source_path}")
+        mod_ids = parse_mod_sources(source_paths)
+
+    if not mod_ids:
+        print("未找到任何模组配置")
+        return finish(0)
+
+    print(f"找到 {len(mod_ids)} 个模组\n")
+
+    # 恢复上次中断的模组同步（--plan 不修改模组目录）
+    if not args.plan:
+        recover_interrupted_syncs(workshop_path)
+
+    if args.verify:
+        return finish(run_verify(mod_ids, workshop_path, config, metrics))
+
+    api_client = SteamWebAPIClient.from_config(config["api"])
+    journal = RunJournal(workshop_path)
+
+    if args.resume:
+        # 只处理上次运行中未完成的模组
+        previous = RunJournal.load(workshop_path)
+        pending = {mod_id: state for mod_id, state in (previous or {}).get("states", {}).items()
+                   if state != "installed"}
+        if not pending:
+            print("上次运行没有未完成的模组，无需恢复")
+            api_client.close()
+            return finish(0)
+
+        print(f"恢复上次运行: {len(pending)} 个模组未完成")
+        with metrics.stage("details"):
+            details = get_workshop_details_batch(list(pending), batch_size=config["api"]["batch_size"],
+                                                 client=api_client)
+        metrics.count("mods_total", len(pending))
+
+        # 已下载到临时目录（staged）的模组直接安装，其余重新交给 SteamCMD
+        staged = {mod_id: state for mod_id, state in pending.items() if state == "staged"}
+        journal.start(list(pending), staged)
+        update_list = []
+        with metrics.stage("install"):
+            manifest = ManifestWriter(workshop_path)
+            for mod_id, state in pending.items():
+                print(f"  模组 {mod_id}: 上次状态 {state}")
+                if state == "staged" and install_downloaded_mod(mod_id, workshop_path, moddetails=details.get(mod_id),
+                                                                journal=journal, manifest=manifest):
+                    continue
+                update_list.append(mod_id)
+            manifest.flush()
+    else:
+        # 批量获取模组详情（启用时同时解析依赖）
+        with metrics.stage("details"):
+            mod_ids, details = collect_mod_details(mod_ids, config, api_client, args.deps_json)
+        metrics.count("mods_total", len(mod_ids))
+
+        # 检查需要更新的模组
+        unchecked = []
+        with metrics.stage("check"):
+            print("检查模组更新状态...")
+            update_list = check_mod_updates(mod_ids, workshop_path, details=details, api_client=api_client,
+                                            persist=not args.plan, unchecked=unchecked)
+
+        if args.plan:
+            metrics.count("mods_needing_update", len(update_list))
+            metrics.record_api_client(api_client)
+            api_client.close()
+            metrics.plan = build_update_plan(update_list, workshop_path, config, details, unchecked)
+            metrics.count("plan_bytes", metrics.plan["total_bytes"])
+            metrics.count("plan_estimated_seconds", metrics.plan["estimated_seconds"])
+            metrics.count("mods_unchecked", len(unchecked))
+            print()
+            print_update_plan(metrics.plan, config["download"]["deadline"])
+            if unchecked:
+                # 查询失败（例如 API 无法访问）时不能断定模组都是最新的
+                return finish(1)
+            return finish(PLAN_EXIT_UPDATES_PENDING if update_list else 0)
+        journal.start(update_list)
+    metrics.count("mods_needing_update", len(update_list))
+
+    if update_list:
+        print(f"发现 {len(update_list)} 个模组需要更新或下载\n")
+    else:
+        print("所有模组都是最新的\n")
+
+    # 下载/更新模组（并行下载）
+    fail_count = 0
+    if update_list:
+        with metrics.stage("download"):
+            download_results = run_downloads(update_list, workshop_path, config, details, api_client,
+                                             journal=journal)
+        metrics.record_downloads(download_results)
+
+        # 统计结果
+        fail_count = sum(1 for result in download_results.values() if not result["success"])
+
+    metrics.record_api_client(api_client)
+    api_client.close()
+
+    # 按大小上限清理 SteamCMD 临时目录
+    with metrics.stage("cleanup"):
+        cleanup_staging(workshop_path, config["staging"]["max_size_mb"])
+
+    exit_code = 1 if fail_count > 0 else 0
+    journal.finish(exit_code)
+    return finish(exit_code)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    if args.watch:
+        mode = "watch"
+    elif args.verify:
+        mode = "verify"
+    else:
+        mode = "plan" if args.plan else "once"
+    metrics = RunMetrics(mode)
+
+    # --quiet / --json 时关闭控制台输出，--json 的摘要写入原始标准输出
+    json_stream = sys.stdout if args.json else None
+    with contextlib.ExitStack() as stack:
+        if args.quiet or args.json:
+            devnull = stack.enter_context(open(os.devnull, 'w', encoding='utf-8'))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        exit_code = run_update(args, metrics, json_stream)
 
-    if fail_count > 0:
-        sys.exit(1)
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
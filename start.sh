@@ -7,4 +7,4 @@ cd "$(dirname "$0")"
 source .venv/bin/activate
 
 # 运行主脚本
-python main.py
+python main.py "$@"
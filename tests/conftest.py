@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共夹具：模拟的 SteamCMD（benchmarks/fake_steamcmd.py）和
+GetPublishedFileDetails 模拟服务（benchmarks/stub_workshop_api.py）
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from stub_workshop_api import StubWorkshopAPI  # noqa: E402
+
+FAKE_STEAMCMD = str(ROOT / "benchmarks" / "fake_steamcmd.py")
+
+
+@pytest.fixture
+def fake_steamcmd(tmp_path, monkeypatch):
+    """
+    返回一个函数：写入 fake_steamcmd 的模拟参数并返回其路径
+
+    调用方式: steamcmd_path = fake_steamcmd({"default": {...}, "items": {...}})
+    """
+    spec_path = tmp_path / "fake_steamcmd.json"
+    monkeypatch.setenv("FAKE_STEAMCMD_SPEC", str(spec_path))
+
+    def configure(spec):
+        spec = dict(spec)
+        spec.setdefault("session_dir", str(tmp_path / "sessions"))
+        spec_path.write_text(json.dumps(spec), encoding='utf-8')
+        return FAKE_STEAMCMD
+
+    return configure
+
+
+@pytest.fixture
+def stub_api():
+    """启动 GetPublishedFileDetails 模拟服务，测试结束后停止"""
+    api = StubWorkshopAPI().start()
+    yield api
+    api.stop()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Steam Web API 客户端的批量查询、重试、Retry-After 和限流"""
+
+import time
+
+import pytest
+import requests
+
+import main
+
+
+def make_client(**kwargs):
+    options = {"rate_limit": 0, "max_retries": 3, "backoff_base": 0.01, "timeout": 5, "connect_timeout": 2}
+    options.update(kwargs)
+    return main.SteamWebAPIClient(**options)
+
+
+def test_details_batch_request_count(stub_api):
+    """250 个模组、每批 100 个 → 3 个请求，重复的ID只查询一次"""
+    mod_ids = [str(1000 + index) for index in range(250)]
+    for mod_id in mod_ids[:200]:
+        stub_api.update_item(mod_id, time_updated=1700000000, file_size=1024)
+    with make_client() as client:
+        details = main.get_workshop_details_batch(mod_ids + mod_ids[:10], batch_size=100, client=client,
+                                                  api_url=stub_api.url)
+    assert stub_api.details_requests == 3
+    assert len(details) == 250
+    assert sum(1 for item in details.values() if item["result"] == 1) == 200
+
+
+def test_retries_server_errors(stub_api):
+    stub_api.update_item("101", time_updated=1700000000)
+    stub_api.fail_next(503, count=2)
+    with make_client() as client:
+        details = main.get_workshop_details_batch(["101"], client=client, api_url=stub_api.url)
+        assert details["101"]["time_updated"] == 1700000000
+        assert stub_api.details_requests == 3
+        assert (client.request_count, client.retry_count) == (3, 2)
+
+
+def test_gives_up_after_max_retries(stub_api):
+    stub_api.fail_next(503, count=5)
+    with make_client(max_retries=2) as client:
+        response = client.post(stub_api.url, data={"itemcount": "0"})
+        assert response.status_code == 503
+        assert stub_api.details_requests == 3
+        assert client.retry_count == 2
+
+
+def test_does_not_retry_client_errors(stub_api):
+    stub_api.fail_next(403)
+    with make_client() as client:
+        assert client.post(stub_api.url, data={"itemcount": "0"}).status_code == 403
+        assert stub_api.details_requests == 1
+
+
+def test_honours_retry_after(stub_api):
+    """429 响应的 Retry-After 优先于指数退避"""
+    stub_api.fail_next(429, retry_after=1)
+    with make_client(backoff_base=0) as client:
+        assert client.post(stub_api.url, data={"itemcount": "0"}).status_code == 200
+    first, second = stub_api.details_request_times
+    assert second - first >= 0.9
+
+
+def test_retry_after_is_capped_by_backoff_max(stub_api):
+    stub_api.fail_next(429, retry_after=60)
+    with make_client(backoff_max=0.2) as client:
+        start = time.monotonic()
+        assert client.post(stub_api.url, data={"itemcount": "0"}).status_code == 200
+        assert time.monotonic() - start < 5
+
+
+def test_connection_errors_are_retried_then_raised(stub_api):
+    url = stub_api.url
+    stub_api.stop()
+    with make_client(max_retries=2) as client:
+        with pytest.raises(requests.ConnectionError):
+            client.post(url, data={"itemcount": "0"})
+        assert (client.request_count, client.retry_count) == (3, 2)
+
+
+def test_token_bucket_limits_request_rate(stub_api):
+    """突发容量用完后，请求按 rate_limit 的间隔发出"""
+    with make_client(rate_limit=20, burst=1) as client:
+        for _ in range(5):
+            client.post(stub_api.url, data={"itemcount": "0"})
+    times = stub_api.details_request_times
+    assert len(times) == 5
+    assert times[-1] - times[0] >= 4 / 20 * 0.9
+
+
+def test_token_bucket_disabled():
+    bucket = main.TokenBucket(0)
+    assert all(bucket.acquire() == 0.0 for _ in range(100))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""批量 SteamCMD 会话（download_mods_steamcmd_batch）"""
+
+import main
+
+
+def read_call_log(call_log):
+    """返回每次 SteamCMD 调用下载的物品数量"""
+    return [int(line.split()[1]) for line in call_log.read_text(encoding='utf-8').splitlines()]
+
+
+def test_parse_item_results():
+    output = "\n".join([
+        "Logging in user 'anonymous' to Steam Public...OK",
+        'Success. Downloaded item 101 to "/x/steamapps/workshop/content/602960/101" (1024 bytes)',
+        "ERROR! Download item 102 failed (Timeout).",
+        "ERROR! Download item 103 failed (Failure).",
+        "Downloading item 104 ...",
+    ])
+    assert main.parse_steamcmd_item_results(output) == {
+        "101": (True, ""),
+        "102": (False, "Timeout"),
+        "103": (False, "Failure"),
+    }
+    assert main.parse_steamcmd_item_results("") == {}
+
+
+def test_batch_uses_one_session(tmp_path, fake_steamcmd):
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"default": {"size": 256}, "call_log": str(call_log)})
+    workshop = tmp_path / "LocalMods"
+    mod_ids = ["101", "102", "103", "104"]
+
+    results = main.download_mods_steamcmd_batch(mod_ids, workshop, steamcmd, 30)
+    assert results == dict.fromkeys(mod_ids, True)
+    assert read_call_log(call_log) == [4]
+    assert all((workshop / mod_id / "data.bin").stat().st_size == 256 for mod_id in mod_ids)
+
+
+def test_failed_item_is_retried_alone(tmp_path, fake_steamcmd):
+    """批量会话中失败的模组单独重试，成功的模组直接安装"""
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"default": {"size": 256}, "items": {"102": {"fail_times": 1}},
+                              "call_log": str(call_log)})
+    workshop = tmp_path / "LocalMods"
+    mod_stats = {}
+
+    results = main.download_mods_steamcmd_batch(["101", "102", "103"], workshop, steamcmd, 30,
+                                                mod_stats=mod_stats)
+    assert results == {"101": True, "102": True, "103": True}
+    assert read_call_log(call_log) == [3, 1]
+    assert mod_stats["102"]["attempts"] == 2
+    assert mod_stats["101"]["attempts"] == 1
+    assert sorted(main.load_manifest(workshop)) == ["101", "102", "103"]
+
+
+def test_stalled_batch_keeps_items_reported_before_the_stall(tmp_path, fake_steamcmd):
+    """会话停滞被终止后，仍根据已输出的部分结果安装完成的模组，只重试其余模组"""
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"default": {"size": 256}, "items": {"102": {"stall": 30}},
+                              "call_log": str(call_log)})
+    workshop = tmp_path / "LocalMods"
+    mod_stats = {}
+
+    results = main.download_mods_steamcmd_batch(["101", "102"], workshop, steamcmd, 30, mod_stats=mod_stats,
+                                                stall_timeout=1)
+    assert results == {"101": True, "102": False}
+    assert read_call_log(call_log) == [2, 1]
+    assert (workshop / "101" / "data.bin").exists()
+    assert not (workshop / "102").exists()
+    assert mod_stats["102"]["timeout_reason"] == "stalled"
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""依赖解析（IPublishedFileService/GetDetails 返回的 children）"""
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def key_client(stub_api):
+    client = main.SteamWebAPIClient(rate_limit=0, max_retries=0, details_url=stub_api.url, key="test-key",
+                                    service_details_url=stub_api.service_url)
+    yield client
+    client.close()
+
+
+def add_items(stub_api, graph):
+    for mod_id, children in graph.items():
+        stub_api.update_item(mod_id, time_updated=100, title=f"Mod {mod_id}", children=children)
+
+
+def test_dependencies_come_first(stub_api, key_client):
+    # A → B → C，D → B；每一层只发送一次请求
+    add_items(stub_api, {"A": ["B"], "B": ["C"], "C": [], "D": ["B"]})
+    graph = main.resolve_mod_dependencies(["A", "D"], key_client)
+
+    assert graph["order"] == ["C", "B", "A", "D"]
+    assert graph["missing"] == ["C", "B"]
+    assert graph["cycles"] == []
+    assert graph["nodes"]["B"]["required_by"] == ["A", "D"]
+    assert {mod_id: node["level"] for mod_id, node in graph["nodes"].items()} == {"C": 0, "B": 1, "A": 2, "D": 2}
+    assert stub_api.details_requests == 3
+
+
+def test_cycle_is_reported_and_broken(stub_api, key_client):
+    add_items(stub_api, {"A": ["B"], "B": ["C"], "C": ["A"]})
+    graph = main.resolve_mod_dependencies(["A"], key_client)
+
+    assert graph["cycles"] == [["A", "B", "C", "A"]]
+    assert graph["order"] == ["C", "B", "A"]
+
+
+def test_children_need_api_key(stub_api):
+    """GetPublishedFileDetails 不返回 children；没有密钥时不解析依赖"""
+    add_items(stub_api, {"A": ["B"], "B": []})
+    config = main.load_config("missing-config.json")[0]
+    config["dependencies"]["resolve"] = True
+    with main.SteamWebAPIClient(rate_limit=0, max_retries=0, details_url=stub_api.url) as client:
+        mod_ids, details = main.collect_mod_details(["A"], config, client)
+    assert mod_ids == ["A"]
+    assert details["A"]["children"] == []
+
+
+def test_collect_mod_details_with_key(stub_api, key_client):
+    add_items(stub_api, {"A": ["B"], "B": []})
+    config = main.load_config("missing-config.json")[0]
+    config["dependencies"]["resolve"] = True
+    mod_ids, details = main.collect_mod_details(["A"], config, key_client)
+    assert mod_ids == ["B", "A"]
+    assert details["A"]["children"] == ["B"]
+
+
+def test_service_endpoint_rejects_missing_key(stub_api):
+    with main.SteamWebAPIClient(rate_limit=0, max_retries=0) as client:
+        response = client.get(stub_api.service_url, params={"publishedfileids[0]": "A"})
+    assert response.status_code == 403
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""直接下载 file_url（download_mod_http）以及改用 SteamCMD 的回退"""
+
+import io
+import time
+import zipfile
+import threading
+
+import pytest
+
+import main
+
+
+def build_archive(mod_id, size=300000):
+    """生成带有顶层目录的模组压缩包"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr(f"{mod_id}/filelist.xml",
+                         f'<contentpackage name="{mod_id}">\n  <Other file="%ModDir%/data.bin" />\n</contentpackage>\n')
+        archive.writestr(f"{mod_id}/data.bin", bytes(range(256)) * (size // 256))
+    return buffer.getvalue()
+
+
+def get_details(api, mod_id):
+    return main.get_workshop_details_batch([mod_id], api_url=api.url)[mod_id]
+
+
+@pytest.fixture
+def http_client():
+    client = main.SteamWebAPIClient(rate_limit=0, max_retries=0)
+    yield client
+    client.close()
+
+
+def test_interrupted_transfer_resumes_with_range(tmp_path, stub_api, http_client):
+    archive = build_archive("101")
+    stub_api.update_item("101", time_updated=100, archive=archive, truncate_next=150000)
+    workshop = tmp_path / "LocalMods"
+
+    assert main.download_mod_http("101", workshop, get_details(stub_api, "101"), http_client)
+    assert stub_api.file_requests == 2
+    # 第二次请求从断点继续，而不是重新下载整个文件
+    assert stub_api.bytes_sent < len(archive) * 1.5
+    assert (workshop / "101" / "data.bin").stat().st_size == 300000 // 256 * 256
+    assert not main.get_http_download_path(workshop, "101").exists()
+    assert main.load_manifest(workshop)["101"]["time_updated"] == 100
+
+
+def test_size_mismatch_is_rejected(tmp_path, stub_api, http_client):
+    stub_api.update_item("102", time_updated=100, archive=build_archive("102"))
+    workshop = tmp_path / "LocalMods"
+    details = dict(get_details(stub_api, "102"), file_size=12345)
+
+    assert not main.download_mod_http("102", workshop, details, http_client)
+    assert not (workshop / "102").exists()
+    assert not main.get_http_download_path(workshop, "102").exists()
+
+
+def test_missing_file_falls_back_to_steamcmd(tmp_path, stub_api, http_client, fake_steamcmd):
+    steamcmd = fake_steamcmd({"default": {"size": 64}})
+    details = {"103": {"result": 1, "time_updated": 100.0, "file_size": 64, "title": "",
+                       "file_url": f"{stub_api.base_url}/files/103.zip"}}
+
+    results = main._run_download_job(["103"], tmp_path / "LocalMods", steamcmd, 30, details, threading.Event(),
+                                     http_client=http_client)
+    assert stub_api.file_requests == 1
+    assert results["103"]["success"]
+    assert results["103"]["source"] == "steamcmd"
+
+
+def test_size_mismatch_falls_back_to_steamcmd(tmp_path, stub_api, http_client, fake_steamcmd):
+    steamcmd = fake_steamcmd({"default": {"size": 64}})
+    stub_api.update_item("104", time_updated=100, archive=build_archive("104"))
+    details = {"104": dict(get_details(stub_api, "104"), file_size=12345)}
+
+    results = main._run_download_job(["104"], tmp_path / "LocalMods", steamcmd, 30, details, threading.Event(),
+                                     http_client=http_client)
+    assert results["104"]["success"]
+    assert results["104"]["source"] == "steamcmd"
+
+
+def test_cancel_during_transfer_does_not_start_steamcmd(tmp_path, stub_api, http_client, fake_steamcmd):
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"default": {"size": 64}, "call_log": str(call_log)})
+    stub_api.file_rate = 200 * 1024
+    stub_api.update_item("105", time_updated=100, archive=build_archive("105", 1024 * 1024))
+    details = {"105": get_details(stub_api, "105")}
+    workshop = tmp_path / "LocalMods"
+
+    cancel_event = threading.Event()
+    threading.Timer(0.5, cancel_event.set).start()
+    start = time.monotonic()
+    results = main._run_download_job(["105"], workshop, steamcmd, 30, details, cancel_event,
+                                     http_client=http_client)
+
+    assert time.monotonic() - start < 3
+    assert results["105"]["status"] == "cancelled"
+    assert not call_log.exists()
+    assert not (workshop / "105").exists()
+
+
+def test_http_deadline_uses_size_based_timeout(tmp_path, stub_api, http_client, fake_steamcmd):
+    """大文件的直接下载使用按大小计算的截止时间，而不是固定的 download.timeout"""
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"default": {"size": 64}, "call_log": str(call_log)})
+    stub_api.file_rate = 512 * 1024
+    stub_api.update_item("106", time_updated=100, archive=build_archive("106", 1024 * 1024))
+    details = {"106": get_details(stub_api, "106")}
+    estimator = main.ThroughputEstimator(256 * 1024, timeout_factor=3)
+
+    results = main._run_download_job(["106"], tmp_path / "LocalMods", steamcmd, 1, details, threading.Event(),
+                                     estimator=estimator, http_client=http_client)
+    assert results["106"]["success"]
+    assert results["106"]["source"] == "http"
+    assert not call_log.exists()
+
+
+def build_versioned_archive(mod_id, version, size=300000):
+    """生成内容随版本变化、大小不变的模组压缩包（不压缩，各版本大小相同）"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(f"{mod_id}/filelist.xml",
+                         f'<contentpackage name="{mod_id}">\n  <Other file="%ModDir%/data.bin" />\n</contentpackage>\n')
+        archive.writestr(f"{mod_id}/data.bin", bytes([version]) * size)
+    return buffer.getvalue()
+
+
+def leave_partial(stub_api, workshop, http_client, mod_id, archive):
+    """下载到一半中断并保留未完成的文件"""
+    stub_api.update_item(mod_id, time_updated=100, archive=archive, truncate_next=len(archive) // 2)
+    assert not main.download_mod_http(mod_id, workshop, get_details(stub_api, mod_id), http_client, max_attempts=1)
+    assert main.get_http_download_path(workshop, mod_id).exists()
+
+
+def test_partial_from_older_version_is_discarded(tmp_path, stub_api, http_client):
+    """模组更新后不能把旧版本的前半部分与新版本的后半部分拼接"""
+    workshop = tmp_path / "LocalMods"
+    old, new = build_versioned_archive("107", 1), build_versioned_archive("107", 2)
+    assert len(old) == len(new)
+    leave_partial(stub_api, workshop, http_client, "107", old)
+
+    stub_api.update_item("107", time_updated=200, archive=new)
+    assert main.download_mod_http("107", workshop, get_details(stub_api, "107"), http_client)
+    assert set((workshop / "107" / "data.bin").read_bytes()) == {2}
+    assert main.load_manifest(workshop)["107"]["time_updated"] == 200
+    assert not main.get_http_download_path(workshop, "107").with_name("107.part.json").exists()
+
+
+def test_changed_file_with_same_details_uses_if_range(tmp_path, stub_api, http_client):
+    """详情没变但服务器上的文件已改变：If-Range 让服务器返回完整内容"""
+    workshop = tmp_path / "LocalMods"
+    leave_partial(stub_api, workshop, http_client, "108", build_versioned_archive("108", 1))
+
+    stub_api.update_item("108", archive=build_versioned_archive("108", 2))
+    assert main.download_mod_http("108", workshop, get_details(stub_api, "108"), http_client)
+    assert set((workshop / "108" / "data.bin").read_bytes()) == {2}
+
+
+def test_partial_without_version_record_is_discarded(tmp_path, stub_api, http_client):
+    workshop = tmp_path / "LocalMods"
+    part_path = main.get_http_download_path(workshop, "109")
+    part_path.parent.mkdir(parents=True)
+    part_path.write_bytes(b"\1" * 1000)
+    stub_api.update_item("109", time_updated=100, archive=build_versioned_archive("109", 2))
+
+    assert main.download_mod_http("109", workshop, get_details(stub_api, "109"), http_client)
+    assert set((workshop / "109" / "data.bin").read_bytes()) == {2}
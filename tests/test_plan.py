@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""--plan 的退出码"""
+
+import json
+
+import main
+
+
+def write_plan_config(root, api_url, mod_ids):
+    """生成 config.json、config_player.xml 和已安装的模组目录，返回 config.json 路径"""
+    players = "".join(f'      <package path="LocalMods/{mod_id}/filelist.xml"/>\n' for mod_id in mod_ids)
+    (root / "config_player.xml").write_text(
+        f'<config>\n  <contentpackages>\n    <regularpackages>\n{players}'
+        f'    </regularpackages>\n  </contentpackages>\n</config>\n', encoding='utf-8')
+    for mod_id in mod_ids:
+        (root / "LocalMods" / mod_id).mkdir(parents=True)
+        (root / "LocalMods" / mod_id / "filelist.xml").write_text("<contentpackage/>", encoding='utf-8')
+    config_path = root / "config.json"
+    config_path.write_text(json.dumps({
+        "files": {"config_file": "config_player.xml", "workshop_path": "LocalMods", "extra_sources": []},
+        "api": {"details_url": api_url, "rate_limit": 0, "max_retries": 0, "timeout": 5}
+    }), encoding='utf-8')
+    return config_path
+
+
+def run_plan(config_path):
+    metrics = main.RunMetrics("plan")
+    exit_code = main.run_update(main.parse_args(["--config", str(config_path), "--plan"]), metrics)
+    return exit_code, metrics
+
+
+def test_plan_up_to_date_exits_zero(tmp_path, stub_api):
+    stub_api.update_item("101", time_updated=1)
+    exit_code, metrics = run_plan(write_plan_config(tmp_path, stub_api.url, ["101"]))
+    assert exit_code == 0
+    assert metrics.plan["unchecked"] == []
+
+
+def test_plan_missing_details_exits_one(tmp_path, stub_api):
+    """物品查询失败时不能报告为已是最新"""
+    stub_api.update_item("101", time_updated=1)
+    exit_code, metrics = run_plan(write_plan_config(tmp_path, stub_api.url, ["101", "102"]))
+    assert exit_code == 1
+    assert metrics.plan["unchecked"] == ["102"]
+
+
+def test_plan_unreachable_api_exits_one(tmp_path, stub_api):
+    url = stub_api.url
+    stub_api.stop()
+    exit_code, metrics = run_plan(write_plan_config(tmp_path, url, ["101"]))
+    assert exit_code == 1
+    assert metrics.plan["unchecked"] == ["101"]
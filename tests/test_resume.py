@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""运行日志与 --resume"""
+
+import json
+
+import main
+
+
+def write_player_config(path, mod_ids):
+    players = "".join(f'      <package path="LocalMods/{mod_id}/filelist.xml"/>\n' for mod_id in mod_ids)
+    path.write_text(f'<config>\n  <contentpackages>\n    <regularpackages>\n{players}'
+                    f'    </regularpackages>\n  </contentpackages>\n</config>\n', encoding='utf-8')
+
+
+def write_journal(workshop, records, tail=""):
+    workshop.mkdir(parents=True, exist_ok=True)
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    (workshop / main.JOURNAL_FILENAME).write_text(lines + tail, encoding='utf-8')
+
+
+def test_resume_continues_interrupted_run(tmp_path, stub_api, fake_steamcmd):
+    mod_ids = ["101", "102", "103", "104"]
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"default": {"size": 1024}, "call_log": str(call_log)})
+    for mod_id in mod_ids:
+        stub_api.update_item(mod_id, time_updated=100)
+    write_player_config(tmp_path / "config_player.xml", mod_ids)
+    (tmp_path / "config.json").write_text(json.dumps({
+        "steamcmd": {"path": steamcmd},
+        "files": {"config_file": "config_player.xml", "workshop_path": "LocalMods", "extra_sources": []},
+        "api": {"details_url": stub_api.url, "rate_limit": 0, "max_retries": 0}
+    }), encoding='utf-8')
+    workshop = tmp_path / "LocalMods"
+
+    # 101 已下载到临时目录，进程在安装前被终止
+    staged = main.get_steamcmd_download_path(workshop, "101")
+    staged.mkdir(parents=True)
+    (staged / "filelist.xml").write_text('<contentpackage name="Staged" />', encoding='utf-8')
+    (staged / "staged.xml").write_text("staged", encoding='utf-8')
+    # 104 已安装，不应再处理
+    (workshop / "104").mkdir(parents=True)
+    (workshop / "104" / "filelist.xml").write_text('<contentpackage name="Installed" />', encoding='utf-8')
+    # 最后一行在写入中途被截断：103 仍按 failed 处理
+    write_journal(workshop, [
+        {"type": "run", "started_at": 1, "mods": {mod_id: "queued" for mod_id in mod_ids}},
+        {"type": "mod", "mod_id": "101", "state": "downloading", "time": 2},
+        {"type": "mod", "mod_id": "101", "state": "staged", "time": 3},
+        {"type": "mod", "mod_id": "102", "state": "downloading", "time": 4},
+        {"type": "mod", "mod_id": "103", "state": "failed", "time": 5},
+        {"type": "mod", "mod_id": "104", "state": "installed", "time": 6},
+    ], tail='{"type": "mod", "mod_id": "103", "state": "instal')
+
+    args = main.parse_args(["--config", str(tmp_path / "config.json"), "--resume"])
+    assert main.run_update(args, main.RunMetrics("once")) == 0
+
+    # staged 的模组直接安装，没有交给 SteamCMD；只有 102 和 103 重新下载
+    assert (workshop / "101" / "staged.xml").read_text(encoding='utf-8') == "staged"
+    assert sum(int(line.split()[1]) for line in call_log.read_text().splitlines()) == 2
+    for mod_id in ("102", "103"):
+        assert (workshop / mod_id / "filelist.xml").exists()
+    assert (workshop / "104" / "filelist.xml").read_text(encoding='utf-8') == '<contentpackage name="Installed" />'
+    assert sorted(main.load_manifest(workshop)) == ["101", "102", "103"]
+
+    journal = main.RunJournal.load(workshop)
+    assert journal["finished"]
+    assert journal["states"] == {"101": "installed", "102": "installed", "103": "installed"}
+
+
+def test_resume_without_pending_mods_does_nothing(tmp_path, fake_steamcmd):
+    call_log = tmp_path / "calls.log"
+    steamcmd = fake_steamcmd({"call_log": str(call_log)})
+    write_player_config(tmp_path / "config_player.xml", ["101"])
+    (tmp_path / "config.json").write_text(json.dumps({
+        "steamcmd": {"path": steamcmd},
+        "files": {"config_file": "config_player.xml", "workshop_path": "LocalMods", "extra_sources": []}
+    }), encoding='utf-8')
+    write_journal(tmp_path / "LocalMods", [
+        {"type": "run", "started_at": 1, "mods": {"101": "queued"}},
+        {"type": "mod", "mod_id": "101", "state": "installed", "time": 2},
+        {"type": "end", "exit_code": 0, "time": 3},
+    ])
+
+    args = main.parse_args(["--config", str(tmp_path / "config.json"), "--resume"])
+    assert main.run_update(args, main.RunMetrics("once")) == 0
+    assert not call_log.exists()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""下载调度器"""
+
+import main
+
+
+def test_requeued_stalled_job_counts_both_attempts(tmp_path, fake_steamcmd):
+    """停滞后重新排队的模组，结果中的尝试次数包含两次 SteamCMD 会话"""
+    steamcmd = fake_steamcmd({"items": {"222": {"stall": 30}}})
+    results = dict(main.iter_download_results(["222"], tmp_path / "LocalMods", steamcmd, 30, 1,
+                                              stall_timeout=1))
+    assert results["222"]["status"] == "stalled"
+    assert results["222"]["attempts"] == 2
+
+
+def test_download_writes_manifest_once_per_run(tmp_path, fake_steamcmd, monkeypatch):
+    """下载阶段不为每个模组重写整个清单，结束时一次写入所有条目"""
+    steamcmd = fake_steamcmd({"default": {"size": 1024}})
+    workshop = tmp_path / "LocalMods"
+    mod_ids = ["101", "102", "103", "104"]
+    saves = []
+    save_manifest = main.save_manifest
+    monkeypatch.setattr(main, "save_manifest",
+                        lambda path, manifest: (saves.append(len(manifest)), save_manifest(path, manifest)))
+
+    results = main.download_mods_parallel(mod_ids, str(workshop), steamcmd, 30, 2)
+    assert all(result["success"] for result in results.values())
+    assert saves == [len(mod_ids)]
+    assert sorted(main.load_manifest(workshop)) == mod_ids
+
+
+def run_adaptive(workshop, steamcmd, mod_ids, controller):
+    return dict(main.iter_download_results(mod_ids, workshop, steamcmd, 30, controller.max_workers,
+                                           controller=controller))
+
+
+def test_unrelated_failure_keeps_concurrency(tmp_path, fake_steamcmd):
+    """一直失败的模组不是拥塞，不降低并发数"""
+    steamcmd = fake_steamcmd({"items": {"101": {"fail": True}}})
+    controller = main.ConcurrencyController(1, 8, initial=4)
+    results = run_adaptive(tmp_path / "LocalMods", steamcmd, ["101", "102"], controller)
+    assert results["101"]["status"] == "failed"
+    assert results["101"]["error"] == "Failure"
+    assert results["102"]["success"]
+    assert controller.history == [4]
+
+
+def test_rate_limited_failure_decreases_concurrency(tmp_path, fake_steamcmd):
+    steamcmd = fake_steamcmd({"items": {"101": {"fail": True, "error": "Rate Limit Exceeded"}}})
+    controller = main.ConcurrencyController(1, 8, initial=4)
+    run_adaptive(tmp_path / "LocalMods", steamcmd, ["101", "102"], controller)
+    # 第一次失败减半，降低并发后重试仍被限流再减半
+    assert controller.history == [4, 2, 1]
+
+
+def test_success_on_retry_decreases_concurrency_once(tmp_path, fake_steamcmd):
+    """第一次因超时失败时减半，重新排队后成功不再重复减半"""
+    steamcmd = fake_steamcmd({"items": {"101": {"fail_times": 1, "error": "Timeout"}}})
+    controller = main.ConcurrencyController(1, 8, initial=4)
+    results = run_adaptive(tmp_path / "LocalMods", steamcmd, ["101", "102"], controller)
+    assert results["101"]["success"]
+    assert results["101"]["attempts"] == 2
+    # 102 在减半之后完成时，与重试成功的 101 组成一轮，并发数加一
+    assert controller.history in ([4, 2], [4, 2, 3])
+
+
+def test_success_on_retry_after_unrelated_failure_keeps_concurrency(tmp_path, fake_steamcmd):
+    """第一次失败不是拥塞（Failure），重试成功也不降低并发数"""
+    steamcmd = fake_steamcmd({"items": {"101": {"fail_times": 1}}})
+    controller = main.ConcurrencyController(1, 8, initial=4)
+    results = run_adaptive(tmp_path / "LocalMods", steamcmd, ["101", "102"], controller)
+    assert results["101"]["success"]
+    assert results["101"]["attempts"] == 2
+    assert controller.history == [4]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""模组来源解析（config_player.xml、JSON 和纯文本模组列表）"""
+
+import json
+
+import main
+
+PLAYER_CONFIG = '''<?xml version="1.0" encoding="utf-8"?>
+<config language="English">
+  <contentpackages>
+    <corepackage path="LocalMods/100/filelist.xml" />
+    <regularpackages>
+      <package path="LocalMods/101/filelist.xml" />
+      <package path="WorkshopMods/Installed/102/filelist.xml" />
+      <package path="C:\\Steam\\steamapps\\workshop\\content\\602960\\103\\filelist.xml" />
+      <package path="Content/ContentPackages/Vanilla.xml" />
+      <package path="LocalMods/101/filelist.xml" />
+    </regularpackages>
+  </contentpackages>
+</config>
+'''
+
+
+def test_xml_core_and_workshop_paths(tmp_path):
+    path = tmp_path / "config_player.xml"
+    path.write_text(PLAYER_CONFIG, encoding='utf-8')
+    assert list(main.iter_mod_ids_from_xml(str(path))) == ["100", "101", "102", "103", "101"]
+
+
+def test_json_forms(tmp_path):
+    path = tmp_path / "mods.json"
+    path.write_text(json.dumps({"mods": ["201", 202, {"id": "203"}, {"publishedfileid": 204}, "abc"]}),
+                    encoding='utf-8')
+    assert list(main.iter_mod_ids_from_json(str(path))) == ["201", "202", "203", "204"]
+    path.write_text(json.dumps([{"id": 205, "name": "x"}, "206"]), encoding='utf-8')
+    assert list(main.iter_mod_ids_from_json(str(path))) == ["205", "206"]
+
+
+def test_text_comments_and_urls(tmp_path):
+    path = tmp_path / "mods.txt"
+    path.write_text("# 注释\n301\n  302  # 行尾注释\n\n"
+                    "https://steamcommunity.com/sharedfiles/filedetails/?id=303\n"
+                    "https://steamcommunity.com/sharedfiles/filedetails/?l=english&id=304\n"
+                    "not a mod\n# 305\n", encoding='utf-8')
+    assert list(main.iter_mod_ids_from_text(str(path))) == ["301", "302", "303", "304"]
+
+
+def test_sources_keep_load_order_and_deduplicate(tmp_path):
+    xml_path = tmp_path / "config_player.xml"
+    xml_path.write_text(PLAYER_CONFIG, encoding='utf-8')
+    json_path = tmp_path / "extra.json"
+    json_path.write_text(json.dumps(["102", "201"]), encoding='utf-8')
+    text_path = tmp_path / "extra.txt"
+    text_path.write_text("301\n100\n201\n", encoding='utf-8')
+    assert main.parse_mod_sources([xml_path, json_path, text_path]) == \
+        ["100", "101", "102", "103", "201", "301"]
+
+
+def test_malformed_source_is_skipped(tmp_path, capsys):
+    broken_json = tmp_path / "broken.json"
+    broken_json.write_text("{not json", encoding='utf-8')
+    broken_xml = tmp_path / "broken.xml"
+    broken_xml.write_text('<config><package path="LocalMods/401/filelist.xml" /><unclosed>', encoding='utf-8')
+    text_path = tmp_path / "mods.txt"
+    text_path.write_text("501\n", encoding='utf-8')
+
+    mod_ids = main.parse_mod_sources([broken_json, broken_xml, tmp_path / "missing.txt", text_path])
+    # 出错前已解析出的模组保留，其余来源继续解析
+    assert mod_ids == ["401", "501"]
+    assert capsys.readouterr().out.count("解析配置文件") == 3
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""状态文件的原子写入"""
+
+import json
+
+import pytest
+
+import main
+
+
+def test_atomic_write_json_replaces_file(tmp_path):
+    path = tmp_path / "state" / "state.json"
+    main.atomic_write_json(path, {"a": 1})
+    main.atomic_write_json(path, {"a": 2})
+    assert json.loads(path.read_text(encoding='utf-8')) == {"a": 2}
+    assert [p.name for p in path.parent.iterdir()] == ["state.json"]
+
+
+def test_atomic_write_json_failure_keeps_old_file(tmp_path):
+    path = tmp_path / "state.json"
+    main.atomic_write_json(path, {"a": 1})
+    with pytest.raises(TypeError):
+        main.atomic_write_json(path, {"a": object()})
+    assert json.loads(path.read_text(encoding='utf-8')) == {"a": 1}
+    assert [p.name for p in tmp_path.iterdir()] == ["state.json"]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""SteamCMD 下载结果的判断与临时目录管理"""
+
+import os
+import time
+import threading
+
+import pytest
+
+import main
+
+
+def test_failed_download_does_not_install_stale_staging(tmp_path, fake_steamcmd):
+    """SteamCMD 输出下载失败（退出码仍为 0）时，不能安装临时目录中保留的旧版本"""
+    workshop = tmp_path / "LocalMods"
+    steamcmd = fake_steamcmd({"items": {"111": {"size": 64, "version": 1}}})
+    assert main.download_mod_steamcmd("111", workshop, steamcmd, 30, {"time_updated": 100.0, "file_size": 64})
+    assert main.load_manifest(workshop)["111"]["time_updated"] == 100.0
+    installed = (workshop / "111" / "data.bin").read_bytes()
+
+    # 发布新版本，但 SteamCMD 下载失败：临时目录中仍是旧版本
+    fake_steamcmd({"items": {"111": {"size": 64, "version": 2, "fail": True}}})
+    assert not main.download_mod_steamcmd("111", workshop, steamcmd, 30, {"time_updated": 200.0, "file_size": 64})
+    assert main.get_steamcmd_download_path(workshop, "111").exists()
+    assert main.load_manifest(workshop)["111"]["time_updated"] == 100.0
+    assert (workshop / "111" / "data.bin").read_bytes() == installed
+
+
+ACF = '''"AppWorkshop"
+{
+	"appid"		"602960"
+	"SizeOnDisk"		"3145728"
+	"WorkshopItemsInstalled"
+	{
+		"111"
+		{
+			"size"		"2097152"
+			"timeupdated"		"100"
+			"manifest"		"1111"
+		}
+		"222"
+		{
+			"size"		"1048576"
+			"timeupdated"		"200"
+			"manifest"		"2222"
+		}
+	}
+	"WorkshopItemDetails"
+	{
+		"111"
+		{
+			"manifest"		"1111"
+			"timeupdated"		"100"
+		}
+		"222"
+		{
+			"manifest"		"2222"
+			"timeupdated"		"200"
+		}
+	}
+}
+'''
+
+
+def test_cleanup_staging_evicts_only_matching_acf_entries(tmp_path):
+    """淘汰部分物品时只删除这些物品在 acf 中的状态，保留的物品仍可差异下载"""
+    workshop = tmp_path / "LocalMods"
+    for mod_id, size in (("111", 2 * 1024 * 1024), ("222", 1024 * 1024)):
+        item = main.get_steamcmd_download_path(workshop, mod_id)
+        item.mkdir(parents=True)
+        (item / "data.bin").write_bytes(b"\0" * size)
+    old = main.get_steamcmd_download_path(workshop, "111")
+    os.utime(old, (1, 1))
+    acf_path = workshop / "steamapps" / "workshop" / "appworkshop_602960.acf"
+    acf_path.write_text(ACF, encoding='utf-8')
+
+    main.cleanup_staging(workshop, max_size_mb=2)
+
+    assert not old.exists()
+    assert main.get_steamcmd_download_path(workshop, "222").exists()
+    app_state = dict(main.parse_vdf(acf_path.read_text(encoding='utf-8')))["AppWorkshop"]
+    sections = dict(app_state)
+    assert [item_id for item_id, _ in sections["WorkshopItemsInstalled"]] == ["222"]
+    assert [item_id for item_id, _ in sections["WorkshopItemDetails"]] == ["222"]
+    assert dict(dict(sections["WorkshopItemsInstalled"])["222"])["manifest"] == "2222"
+
+
+def test_remove_acf_items_deletes_unparsable_file(tmp_path):
+    acf_path = tmp_path / "appworkshop_602960.acf"
+    acf_path.write_text('"AppWorkshop"\n{\n\t"appid"\t\t"602960"\n', encoding='utf-8')
+    main.remove_acf_items(acf_path, {"111"})
+    assert not acf_path.exists()
+
+
+def write_wrapper(tmp_path):
+    """与 steamcmd.sh 相同：脚本把真正的进程作为子进程运行（不 exec）"""
+    script = tmp_path / "steamcmd.sh"
+    script.write_text("#!/bin/sh\necho 'Loading Steam API...OK'\nsleep 20\necho done\n", encoding='utf-8')
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="需要 POSIX 进程组")
+def test_stalled_wrapper_kills_child_process(tmp_path):
+    """看门狗终止停滞的 SteamCMD 时，脚本启动的子进程也被终止，不等它自己退出"""
+    start = time.monotonic()
+    with pytest.raises(main.SteamCMDTimeout) as excinfo:
+        main.run_steamcmd([write_wrapper(tmp_path)], 60, stall_timeout=1, poll_interval=0.2)
+    assert excinfo.value.reason == "stalled"
+    assert "Loading Steam API" in excinfo.value.stdout
+    assert time.monotonic() - start < 10
+
+
+@pytest.mark.skipif(os.name != "posix", reason="需要 POSIX 进程组")
+def test_terminate_active_steamcmd_kills_child_process(tmp_path):
+    wrapper = write_wrapper(tmp_path)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(main.run_steamcmd([wrapper], 60, poll_interval=0.2)))
+    start = time.monotonic()
+    thread.start()
+    while not main._active_processes and time.monotonic() - start < 5:
+        time.sleep(0.05)
+    time.sleep(0.3)
+    main.terminate_active_steamcmd()
+    thread.join(timeout=15)
+    assert not thread.is_alive()
+    assert results[0].returncode != 0
+    assert time.monotonic() - start < 10
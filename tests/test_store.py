@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""多服务器配置：共享存储、链接到各配置和 --gc"""
+
+import json
+
+import main
+
+
+def write_player_config(path, mod_ids):
+    players = "".join(f'      <package path="LocalMods/{mod_id}/filelist.xml"/>\n' for mod_id in mod_ids)
+    path.write_text(f'<config>\n  <contentpackages>\n    <regularpackages>\n{players}'
+                    f'    </regularpackages>\n  </contentpackages>\n</config>\n', encoding='utf-8')
+
+
+def run(root, *extra):
+    metrics = main.RunMetrics("once")
+    return main.run_update(main.parse_args(["--config", str(root / "config.json"), *extra]), metrics)
+
+
+def object_hashes(store):
+    return {path.name for path in (store / main.STORE_OBJECTS_DIR).glob('*/*')}
+
+
+def referenced_hashes(*workshops):
+    hashes = set()
+    for workshop in workshops:
+        for entry in main.load_manifest(workshop).values():
+            hashes.update(info["sha256"] for info in entry["files"].values())
+    return hashes
+
+
+def test_two_profiles_share_store(tmp_path, stub_api, fake_steamcmd):
+    steamcmd = fake_steamcmd({"default": {"size": 4096}})
+    for mod_id, size in (("101", 1000), ("102", 2000), ("103", 3000)):
+        stub_api.update_item(mod_id, time_updated=100, file_size=size)
+    write_player_config(tmp_path / "a.xml", ["101", "102"])
+    write_player_config(tmp_path / "b.xml", ["102", "103"])
+    (tmp_path / "config.json").write_text(json.dumps({
+        "steamcmd": {"path": steamcmd},
+        "files": {"config_file": "a.xml", "workshop_path": "A", "extra_sources": []},
+        "api": {"details_url": stub_api.url, "rate_limit": 0, "max_retries": 0},
+        "store": {"path": "Store"},
+        "profiles": [{"name": "a", "config_file": "a.xml", "workshop_path": "A"},
+                     {"name": "b", "config_file": "b.xml", "workshop_path": "B"}]
+    }), encoding='utf-8')
+    store, a, b = tmp_path / "Store", tmp_path / "A", tmp_path / "B"
+
+    assert run(tmp_path) == 0
+    assert sorted(p.name for p in a.iterdir() if not p.name.startswith('.')) == ["101", "102"]
+    assert sorted(p.name for p in b.iterdir() if not p.name.startswith('.')) == ["102", "103"]
+    # 两个配置中的同一个文件是共享存储中同一个对象的硬链接
+    shared = (a / "102" / "data.bin").stat()
+    assert shared.st_ino == (b / "102" / "data.bin").stat().st_ino
+    sha256 = main.load_manifest(a)["102"]["files"]["data.bin"]["sha256"]
+    assert main.get_store_object_path(store, sha256).stat().st_ino == shared.st_ino
+    old_102 = (a / "102" / "data.bin").read_bytes()
+
+    # 发布 102 的新版本：两个配置都重新链接到新内容
+    fake_steamcmd({"default": {"size": 4096}, "items": {"102": {"version": 1}}})
+    stub_api.update_item("102", time_updated=200)
+    assert run(tmp_path) == 0
+    new_102 = (a / "102" / "data.bin").read_bytes()
+    assert new_102 != old_102
+    assert (b / "102" / "data.bin").read_bytes() == new_102
+    assert (a / "102" / "data.bin").stat().st_ino == (b / "102" / "data.bin").stat().st_ino
+    assert main.load_manifest(b)["102"]["time_updated"] == 200
+
+    removed_101 = main.load_manifest(a)["101"]["files"]
+    objects_before_gc = object_hashes(store)
+
+    # 配置 a 不再使用 101；--gc 只删除没有任何配置引用的模组和对象
+    write_player_config(tmp_path / "a.xml", ["102"])
+    assert run(tmp_path, "--gc") == 0
+    assert not (store / main.STORE_MODS_DIR / "101").exists()
+    assert (store / main.STORE_MODS_DIR / "102").exists()
+    assert (store / main.STORE_MODS_DIR / "103").exists()
+    # 剩下的对象正好是 102（新版本）和 103 的文件，101 和 102 旧版本的对象已删除
+    assert object_hashes(store) == referenced_hashes(store / main.STORE_MODS_DIR)
+    assert sorted(main.load_manifest(store / main.STORE_MODS_DIR)) == ["102", "103"]
+    assert removed_101["filelist.xml"]["sha256"] not in object_hashes(store)
+    assert object_hashes(store) < objects_before_gc
+    assert (a / "102" / "data.bin").read_bytes() == new_102
+    assert (b / "103" / "data.bin").exists()
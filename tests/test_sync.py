@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""增量同步（sync_mod_tree）、目录替换和中断恢复"""
+
+import main
+
+
+def write_tree(path, files):
+    for rel_path, content in files.items():
+        (path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (path / rel_path).write_bytes(content)
+
+
+def test_sync_counts_and_keeps_unchanged_inodes(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    final = workshop / "101"
+    write_tree(final, {"filelist.xml": b"<a/>", "same.bin": b"s" * 100, "changed.bin": b"o" * 50,
+                       "sub/removed.bin": b"r" * 30})
+    same_inode = (final / "same.bin").stat().st_ino
+
+    staged = tmp_path / "staged"
+    write_tree(staged, {"filelist.xml": b"<a/>", "same.bin": b"s" * 100, "changed.bin": b"n" * 60,
+                        "sub/added.bin": b"a" * 20})
+    stats = main.sync_mod_tree(staged, final)
+
+    assert (stats["bytes_written"], stats["bytes_skipped"]) == (80, 104)
+    assert (stats["files_written"], stats["files_skipped"], stats["files_deleted"]) == (2, 2, 1)
+    assert (final / "same.bin").stat().st_ino == same_inode
+    assert (final / "changed.bin").read_bytes() == b"n" * 60
+    assert (final / "sub" / "added.bin").exists()
+    assert not (final / "sub" / "removed.bin").exists()
+    assert sorted(stats["files"]) == ["changed.bin", "filelist.xml", "same.bin", "sub/added.bin"]
+    assert stats["files"]["same.bin"]["sha256"] == main.hash_file(final / "same.bin")
+    # 同步完成后不留下临时目录
+    assert sorted(p.name for p in workshop.iterdir()) == ["101"]
+
+
+def test_sync_uses_recorded_hashes(tmp_path):
+    """清单中记录的哈希与新文件不同时，即使大小相同也重新写入"""
+    final = tmp_path / "LocalMods" / "101"
+    write_tree(final, {"data.bin": b"x" * 10})
+    staged = tmp_path / "staged"
+    write_tree(staged, {"data.bin": b"x" * 10})
+    stats = main.sync_mod_tree(staged, final, {"data.bin": {"size": 10, "sha256": "0" * 64}})
+    assert stats["files_written"] == 1
+
+
+def test_sync_into_new_directory(tmp_path):
+    final = tmp_path / "LocalMods" / "101"
+    staged = tmp_path / "staged"
+    write_tree(staged, {"data.bin": b"x" * 10})
+    stats = main.sync_mod_tree(staged, final, keep_staged=True)
+    assert (stats["bytes_written"], stats["files_deleted"]) == (10, 0)
+    assert (final / "data.bin").read_bytes() == b"x" * 10
+    assert (staged / "data.bin").exists()
+
+
+def test_swap_replaces_existing_directory(tmp_path):
+    final = tmp_path / "101"
+    write_tree(final, {"old.bin": b"o"})
+    new = tmp_path / ".101.sync"
+    write_tree(new, {"new.bin": b"n"})
+    main._swap_mod_dir(new, final)
+    assert [p.name for p in final.iterdir()] == ["new.bin"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["101"]
+
+
+def test_recover_restores_old_directory_without_final(tmp_path):
+    """在两次改名之间中断：最终目录缺失，恢复旧版本"""
+    workshop = tmp_path / "LocalMods"
+    write_tree(workshop / ".101.old", {"data.bin": b"old"})
+    write_tree(workshop / ".101.sync", {"data.bin": b"half"})
+    main.recover_interrupted_syncs(workshop)
+    assert (workshop / "101" / "data.bin").read_bytes() == b"old"
+    assert sorted(p.name for p in workshop.iterdir()) == ["101"]
+
+
+def test_recover_removes_leftovers_next_to_final(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    write_tree(workshop / "101", {"data.bin": b"new"})
+    write_tree(workshop / ".101.old", {"data.bin": b"old"})
+    write_tree(workshop / ".102.sync", {"data.bin": b"half"})
+    write_tree(workshop / ".hidden", {"keep": b"k"})
+    main.recover_interrupted_syncs(workshop)
+    assert (workshop / "101" / "data.bin").read_bytes() == b"new"
+    assert sorted(p.name for p in workshop.iterdir()) == [".hidden", "101"]
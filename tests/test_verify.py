@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""--verify：filelist.xml 路径解析、文件哈希校验和校验基准"""
+
+import main
+
+FILELIST = '''<contentpackage name="Test Mod" steamworkshopid="101">
+  <Item file="%ModDir%/Items/item.xml" />
+  <Sounds file="%ModDir:101%\\Sounds\\sound.ogg" />
+  <Texture file="%ModDir:Test Mod%/tex.png" />
+  <Other file="%ModDir:Other Mod%/foreign.xml" />
+  <Legacy file="Mods/Test Mod/legacy.xml" />
+  <Vanilla file="Content/Items/vanilla.xml" />
+  <Item file="%ModDir%/Items/item.xml" />
+</contentpackage>
+'''
+CONTENT = ["Items/item.xml", "Sounds/sound.ogg", "tex.png", "legacy.xml"]
+
+
+def install_mod(workshop, mod_id="101", record_hashes=True):
+    mod_path = workshop / mod_id
+    mod_path.mkdir(parents=True)
+    (mod_path / "filelist.xml").write_text(FILELIST, encoding='utf-8')
+    for rel_path in CONTENT:
+        (mod_path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (mod_path / rel_path).write_bytes(rel_path.encode('utf-8') * 10)
+    if record_hashes:
+        entry = main.build_manifest_entry(mod_path, {"time_updated": 100.0, "file_size": 1000})
+    else:
+        entry = {"time_updated": 100.0, "file_size": 1000, "content_hash": None, "installed_at": 1.0}
+    main.save_manifest(workshop, {mod_id: entry})
+    return mod_path
+
+
+def test_parse_filelist_paths(tmp_path):
+    path = tmp_path / "filelist.xml"
+    path.write_text(FILELIST, encoding='utf-8')
+    # %ModDir%、%ModDir:ID%、%ModDir:名称%、旧版 Mods/名称/ 指向本模组；其他模组和游戏本体的路径被忽略
+    assert main.parse_filelist_files(path, "101") == CONTENT
+
+
+def test_intact_mod_passes(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    install_mod(workshop)
+    assert main.verify_installed_mods(["101"], workshop) == {"101": []}
+
+
+def test_detects_missing_changed_and_resized_files(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    mod_path = install_mod(workshop)
+    (mod_path / "tex.png").unlink()
+    data = (mod_path / "legacy.xml").read_bytes()
+    (mod_path / "legacy.xml").write_bytes(bytes([data[0] ^ 1]) + data[1:])
+    (mod_path / "Sounds" / "sound.ogg").write_bytes(b"short")
+
+    problems = main.verify_installed_mods(["101", "102"], workshop)
+    assert sorted(problems["101"]) == sorted([
+        "缺少内容文件 tex.png",
+        "缺少文件 tex.png",
+        "文件内容不一致 legacy.xml",
+        "文件大小不一致 Sounds/sound.ogg",
+    ])
+    assert problems["102"] == ["模组目录不存在"]
+
+
+def test_broken_filelist_is_reported(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    mod_path = install_mod(workshop)
+    (mod_path / "filelist.xml").write_text("<contentpackage>", encoding='utf-8')
+    problems = main.verify_installed_mods(["101"], workshop)["101"]
+    assert problems[0].startswith("filelist.xml 解析失败")
+
+
+def test_entry_without_hashes_records_baseline(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    mod_path = install_mod(workshop, record_hashes=False)
+
+    assert main.verify_installed_mods(["101"], workshop) == {"101": []}
+    entry = main.load_manifest(workshop)["101"]
+    assert entry["time_updated"] == 100.0
+    assert entry["installed_at"] == 1.0
+    assert entry["files"] == main.hash_mod_files(mod_path)
+
+    # 之后的校验按记录的基准比较
+    (mod_path / "tex.png").write_bytes(b"X" * len((mod_path / "tex.png").read_bytes()))
+    assert main.verify_installed_mods(["101"], workshop)["101"] == ["文件内容不一致 tex.png"]
+
+
+def test_baseline_not_recorded_for_broken_mod(tmp_path):
+    workshop = tmp_path / "LocalMods"
+    mod_path = install_mod(workshop, record_hashes=False)
+    (mod_path / "legacy.xml").unlink()
+    assert main.verify_installed_mods(["101"], workshop)["101"] == ["缺少内容文件 legacy.xml"]
+    assert "files" not in main.load_manifest(workshop)["101"]